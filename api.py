@@ -0,0 +1,204 @@
+from src.startup import profile_step, log_startup_report
+import uuid
+import asyncio
+from contextlib import asynccontextmanager
+import uvicorn
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool, iterate_in_threadpool
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, field_validator
+from src.database import ensure_db, get_appointment, get_appointments, cancel_by_id, normalize_email, compute_starts_at
+from src.availability import book_slot, reschedule_slot, next_free_slots, format_slot, SlotUnavailableError
+from src.llm_setup import setup_llm
+from src.normalize import normalize_date, normalize_time
+from src.appointment_handler import process_message, stream_message
+from src.session_store import SQLiteSessionStore, SessionConflictError, open_session
+from src.utils import is_valid_email
+from src.metrics import enable_metrics, prometheus_text, snapshot
+
+# Load environment variables
+load_dotenv()
+
+# Worker processes when started with `python api.py`
+API_HOST = "0.0.0.0"
+API_PORT = 8000
+API_WORKERS = 4
+
+# Per-stage latency tracing, exported at /metrics (each worker reports its own series)
+METRICS_ENABLED = True
+enable_metrics(METRICS_ENABLED)
+
+@asynccontextmanager
+async def lifespan(app):
+    """Apply schema migrations once per worker and drop idle sessions before serving requests."""
+    with profile_step("ensure_db"):
+        ensure_db()
+    await run_in_threadpool(SESSION_STORE.purge_idle)
+    log_startup_report()
+    yield
+
+app = FastAPI(title="AI Appointment Booking Agent API", lifespan=lifespan)
+
+# Chat sessions live in the shared database, so any worker can serve any turn
+SESSION_STORE = SQLiteSessionStore()
+
+# Reply when a turn can't be saved because other workers kept saving the same session (see open_session)
+SESSION_CONFLICT_MESSAGE = "This conversation was updated from another window at the same time. Please send your message again."
+
+# Turns on one session are serialized within a worker; locks are striped to stay bounded
+SESSION_LOCK_STRIPES = 64
+_session_locks = [asyncio.Lock() for _ in range(SESSION_LOCK_STRIPES)]
+
+def _check_name(name):
+    """Reject a blank name, as the chat flow does before booking."""
+    if not name.strip():
+        raise ValueError("name must not be empty")
+    return name.strip()
+
+def _check_email(email):
+    """Reject an email the chat flow would ask to have corrected."""
+    if not is_valid_email(email.strip()):
+        raise ValueError("email is not a valid email address")
+    return email.strip()
+
+class BookingRequest(BaseModel):
+    name: str
+    email: str
+    date: str
+    time: str
+    purpose: str = "General appointment"
+
+    _name = field_validator('name')(_check_name)
+    _email = field_validator('email')(_check_email)
+
+class RescheduleRequest(BaseModel):
+    email: str
+    date: str
+    time: str
+
+    _email = field_validator('email')(_check_email)
+
+class ChatTurn(BaseModel):
+    message: str
+    session_id: str | None = None
+
+def _session_lock(session_id):
+    """Return the lock serializing turns for a session in this worker."""
+    return _session_locks[hash(session_id) % SESSION_LOCK_STRIPES]
+
+def _run_turn(session_id, message):
+    """Run one chat turn against the stored session state."""
+    with open_session(SESSION_STORE, session_id, setup_llm) as session:
+        return process_message(message, session['llm_chain'], session['llm'], session)
+
+def _stream_turn(session_id, message):
+    """Stream one chat turn against the stored session state."""
+    with open_session(SESSION_STORE, session_id, setup_llm) as session:
+        yield from stream_message(message, session['llm_chain'], session['llm'], session)
+
+def _public(row):
+    """Convert an Appointment into the fields returned by the API."""
+    return {field: getattr(row, field) for field in ('id', 'name', 'email', 'date', 'time', 'purpose', 'created_at')}
+
+async def _unavailable(message, date, time):
+    """Build the 409 for a slot that is closed, off the grid or full, with the next free times."""
+    alternatives = await run_in_threadpool(next_free_slots, compute_starts_at(date, time))
+    return HTTPException(status_code=409, detail={
+        'message': message,
+        'own_booking': False,
+        'alternatives': [format_slot(slot) for slot in alternatives]
+    })
+
+@app.post("/appointments", status_code=201)
+async def book(request: BookingRequest):
+    """Book a slot, or return 409 with the conflict and the next free times."""
+    date, time = normalize_date(request.date), normalize_time(request.time)
+    try:
+        appointment_id, conflict = await run_in_threadpool(
+            book_slot, request.name, request.email, date, time, request.purpose)
+    except SlotUnavailableError as e:
+        raise await _unavailable(str(e), date, time)
+    if conflict:
+        alternatives = await run_in_threadpool(next_free_slots, compute_starts_at(date, time))
+        raise HTTPException(status_code=409, detail={
+            'message': f"The {time} slot on {date} is already booked.",
+            'own_booking': conflict.email_norm == normalize_email(request.email),
+            'alternatives': [format_slot(slot) for slot in alternatives]
+        })
+    return _public(await run_in_threadpool(get_appointment, appointment_id))
+
+@app.get("/appointments")
+async def retrieve(email: str, date: str | None = None):
+    """List an email's appointments, optionally on one date."""
+    rows = await run_in_threadpool(get_appointments, None, email, normalize_date(date) if date else None)
+    return [_public(row) for row in rows]
+
+@app.delete("/appointments/{appointment_id}")
+async def cancel(appointment_id: int, email: str):
+    """Cancel an appointment owned by the given email."""
+    if not await run_in_threadpool(cancel_by_id, appointment_id, email):
+        raise HTTPException(status_code=404, detail=f"Appointment {appointment_id} not found for {email}")
+    return {'canceled': appointment_id}
+
+@app.post("/appointments/{appointment_id}/reschedule")
+async def reschedule(appointment_id: int, request: RescheduleRequest):
+    """Move an appointment owned by the given email, or return 409 with the next free times."""
+    date, time = normalize_date(request.date), normalize_time(request.time)
+    try:
+        moved, conflict = await run_in_threadpool(reschedule_slot, appointment_id, request.email, date, time)
+    except SlotUnavailableError as e:
+        raise await _unavailable(str(e), date, time)
+    if moved:
+        return _public(moved)
+    if conflict is None:
+        raise HTTPException(status_code=404, detail=f"Appointment {appointment_id} not found for {request.email}")
+    alternatives = await run_in_threadpool(next_free_slots, compute_starts_at(date, time))
+    raise HTTPException(status_code=409, detail={
+        'message': f"The {time} slot on {date} is already booked.",
+        'own_booking': conflict.email_norm == normalize_email(request.email),
+        'alternatives': [format_slot(slot) for slot in alternatives]
+    })
+
+@app.post("/chat")
+async def chat(turn: ChatTurn):
+    """Run one chat turn through the same handler the Streamlit app uses."""
+    session_id = turn.session_id or uuid.uuid4().hex
+    async with _session_lock(session_id):
+        try:
+            response = await run_in_threadpool(_run_turn, session_id, turn.message)
+        except SessionConflictError:
+            raise HTTPException(status_code=409, detail=SESSION_CONFLICT_MESSAGE)
+    return {'session_id': session_id, 'response': response}
+
+@app.websocket("/ws/chat")
+async def chat_stream(websocket: WebSocket, session_id: str | None = None):
+    """Stream chat replies: each text message in gets its reply as chunks, then a done marker."""
+    await websocket.accept()
+    session_id = session_id or uuid.uuid4().hex
+    await websocket.send_json({'session_id': session_id})
+    try:
+        while True:
+            message = await websocket.receive_text()
+            async with _session_lock(session_id):
+                try:
+                    async for chunk in iterate_in_threadpool(_stream_turn(session_id, message)):
+                        await websocket.send_json({'chunk': chunk})
+                except SessionConflictError:
+                    await websocket.send_json({'error': SESSION_CONFLICT_MESSAGE})
+            await websocket.send_json({'done': True})
+    except WebSocketDisconnect:
+        pass
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Per-stage latency percentiles in the Prometheus text format."""
+    return PlainTextResponse(prometheus_text(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics.json")
+async def metrics_json():
+    """Per-stage latency percentiles as JSON."""
+    return snapshot()
+
+if __name__ == "__main__":
+    uvicorn.run("api:app", host=API_HOST, port=API_PORT, workers=API_WORKERS)
@@ -1,21 +1,60 @@
+from src.startup import profile_step, log_startup_report
 import streamlit as st
 import os
-import re
+import time
 from dotenv import load_dotenv
-from src.database import init_db, get_appointments, DB_FOLDER, DB_NAME, DB_PATH
+from src.database import ensure_db, DB_FOLDER, DB_NAME, DB_PATH
 from src.llm_setup import setup_llm
-from src.appointment_handler import process_message
+from src.appointment_handler import process_message, stream_message
 from src.utils import get_random_greeting
+from src.intents import router_stats
+from src.structured import structured_stats
+from src.session_store import ChatTranscript, purge_idle_transcripts
 
 # Load environment variables
 load_dotenv()
 
+# Render assistant replies token by token as the LLM generates them
+STREAM_RESPONSES = True
+
+# Messages rendered on each rerun, and how many more each "load earlier" click adds;
+# keep RENDER_WINDOW within half of TRANSCRIPT_RING_SIZE so reruns don't read SQLite
+RENDER_WINDOW = 20
+LOAD_EARLIER_STEP = 20
+
+@st.cache_resource
+def purge_transcripts():
+    """Delete idle transcripts' spilled messages once per process."""
+    return purge_idle_transcripts()
+
+def load_earlier():
+    """Widen the rendered window by one step; runs before the next rerun."""
+    st.session_state['render_window'] += LOAD_EARLIER_STEP
+
+def render_transcript(transcript):
+    """Render the newest messages with a button for earlier ones, and time the render."""
+    started = time.perf_counter()
+    messages = transcript.window(st.session_state['render_window'])
+    hidden = len(transcript) - len(messages)
+    if hidden:
+        st.button(f"Load earlier messages ({hidden} more)", on_click=load_earlier)
+    
+    for message in messages:
+        with st.chat_message(message["role"]):
+            st.write(message["content"])
+    
+    st.session_state['render_ms'] = (time.perf_counter() - started) * 1000
+    st.sidebar.caption(f"Render time: {st.session_state['render_ms']:.1f} ms "
+                       f"({len(messages)} of {len(transcript)} messages)")
+
 def main():
     st.set_page_config(page_title="AI Appointment Booking Agent", page_icon="📅")
 
     # Initialize session state variables
-    if 'messages' not in st.session_state:
-        st.session_state['messages'] = [{"role": "assistant", "content": get_random_greeting()}]
+    if 'transcript' not in st.session_state:
+        st.session_state['transcript'] = ChatTranscript()
+        st.session_state['transcript'].append("assistant", get_random_greeting())
+        st.session_state['render_window'] = RENDER_WINDOW
 
     if 'current_name' not in st.session_state:
         st.session_state['current_name'] = None
@@ -27,7 +66,8 @@ def main():
     # Initialize LLM chain
     if 'llm_chain' not in st.session_state:
         try:
-            st.session_state['llm_chain'], st.session_state['llm'] = setup_llm()
+            with profile_step("setup_llm"):
+                st.session_state['llm_chain'], st.session_state['llm'] = setup_llm()
         except Exception as e:
             st.error(f"Error initializing LLM: {str(e)}")
             st.error("Please make sure you have set the GEMINI_API_KEY environment variable or added it to .env file.")
@@ -36,68 +76,62 @@ def main():
     # Page title
     st.title("📅 AI Appointment Booking Agent")
     
-    # Initialize database
+    # Initialize database (once per process)
     try:
-        init_db()
+        with profile_step("ensure_db"):
+            ensure_db()
+        purge_transcripts()
     except Exception as e:
         st.error(f"Database initialization error: {str(e)}")
         if os.path.exists(DB_PATH):
             st.error(f"The database file exists at {DB_PATH} but there might be a schema issue. You may need to delete the file and restart.")
     
-    # Display chat messages
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.write(message["content"])
+    # Import and init timings, once per process when PROFILE_STARTUP=1
+    log_startup_report()
+    
+    # Display the latest chat messages
+    transcript = st.session_state['transcript']
+    render_transcript(transcript)
+
+    # Prompt and completion size of the last LLM turn
+    if st.session_state.get('prompt_tokens'):
+        st.sidebar.caption(f"Prompt tokens last turn: ~{st.session_state['prompt_tokens']}")
+    if st.session_state.get('completion_tokens'):
+        st.sidebar.caption(f"Completion tokens last turn: ~{st.session_state['completion_tokens']}")
+    
+    # Schema failures and repair calls in the JSON extraction mode
+    parse_stats = structured_stats()
+    if parse_stats['turns']:
+        st.sidebar.caption(f"JSON replies: {parse_stats['parse_failures']} parse failures, "
+                           f"{parse_stats['retries']} retries in {parse_stats['turns']} turns")
+    
+    # Turns answered by the intent router without calling the LLM
+    stats = router_stats()
+    if stats['turns']:
+        st.sidebar.caption(f"Turns handled without the LLM: {stats['handled']}/{stats['turns']}")
 
     # Chat input
     user_input = st.chat_input("Type your message here...")
     
     if user_input:
         # Add user message to chat history
-        st.session_state.messages.append({"role": "user", "content": user_input})
+        transcript.append("user", user_input)
+        st.session_state['render_window'] = RENDER_WINDOW
         with st.chat_message("user"):
             st.write(user_input)
         
-        # Extract email from input
-        email_pattern = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
-        email_match = re.search(email_pattern, user_input)
-        
-        if email_match:
-            email = email_match.group()
-            if not st.session_state.get('current_email') or st.session_state.get('current_email') != email:
-                st.session_state['current_email'] = email
-                
-                # Direct retrieval if only email was provided
-                if len(user_input.strip()) < 50 and email in user_input:
-                    appointments = get_appointments(email=email)
-                    
-                    if appointments:
-                        from src.database import get_table_structure
-                        columns = get_table_structure()
-                        response = f"Here are the appointments for {email}:\n\n"
-                        for i, appt in enumerate(appointments):
-                            appt_dict = {columns[j]: appt[j] for j in range(len(appt))}
-                            response += f"📅 Appointment {i+1}:\n"
-                            response += f"• Date: {appt_dict.get('date', 'N/A')}\n"
-                            response += f"• Time: {appt_dict.get('time', 'N/A')}\n"
-                            response += f"• Name: {appt_dict.get('name', 'N/A')}\n"
-                            purpose = appt_dict.get('purpose', '')
-                            if purpose and purpose not in ('N/A', 'None', 'none'):
-                                response += f"• Purpose: {purpose}\n"
-                            response += "\n"
-                        
-                        st.session_state.messages.append({"role": "assistant", "content": response})
-                        with st.chat_message("assistant"):
-                            st.write(response)
-                        st.stop()
-        
         # Process the message
-        response = process_message(user_input, st.session_state['llm_chain'], st.session_state['llm'])
-        
-        # Add assistant response to chat history
-        st.session_state.messages.append({"role": "assistant", "content": response})
-        with st.chat_message("assistant"):
-            st.write(response)
+        if STREAM_RESPONSES:
+            with st.chat_message("assistant"):
+                response = st.write_stream(stream_message(user_input, st.session_state['llm_chain'], st.session_state['llm'], st.session_state))
+            transcript.append("assistant", response)
+        else:
+            response = process_message(user_input, st.session_state['llm_chain'], st.session_state['llm'], st.session_state)
+            
+            # Add assistant response to chat history
+            transcript.append("assistant", response)
+            with st.chat_message("assistant"):
+                st.write(response)
             
 
 
@@ -0,0 +1,45 @@
+"""Micro-benchmarks for date/time normalization and appointment detail extraction.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_normalize
+"""
+import timeit
+from src.normalize import normalize_date, normalize_time, _dateparser_date
+from src.utils import extract_appointment_details
+
+RESPONSE = """Great, let me book that for you! 📅
+
+<APPOINTMENT_DETAILS>
+name: Jane Doe
+email: jane@example.com
+date: 2025-03-15
+time: 3:30 PM
+purpose: Dental check-up
+action: book
+</APPOINTMENT_DETAILS>"""
+
+CASES = [
+    ("normalize_date ISO", lambda: normalize_date("2025-03-15")),
+    ("normalize_date m/d/Y", lambda: normalize_date("3/15/2025")),
+    ("normalize_date dateparser (cached)", lambda: normalize_date("next friday")),
+    ("normalize_time 12-hour", lambda: normalize_time("3:30 PM")),
+    ("normalize_time 24-hour", lambda: normalize_time("15:30")),
+    ("extract_appointment_details", lambda: extract_appointment_details(RESPONSE)),
+]
+
+def per_call_us(func, number=20000):
+    """Best per-call time in microseconds over a few repeats."""
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+def main():
+    # Cold dateparser call: includes the lazy import on first use
+    start = timeit.default_timer()
+    _dateparser_date("in two weeks", "cold")
+    print(f"{'dateparser cold call (incl. import)':40s} {(timeit.default_timer() - start) * 1e3:10.1f} ms")
+
+    for label, func in CASES:
+        print(f"{label:40s} {per_call_us(func):10.2f} us/call")
+
+if __name__ == "__main__":
+    main()
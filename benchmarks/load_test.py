@@ -0,0 +1,290 @@
+"""Load test for the chat pipeline and the database layer, using a scripted stand-in LLM.
+
+Each simulated conversation books an appointment, lists its appointments and
+cancels the booking again, for a number of rounds. The database is a throwaway
+copy seeded with synthetic appointments. Run from the repository root:
+
+    python -m benchmarks.load_test --conversations 32 --rows 100000 --output bench.json
+
+The JSON report (throughput, latency percentiles per action, per-stage timings,
+database lock waits and memory per session) is meant to be diffed across releases.
+"""
+import re
+import os
+import gc
+import json
+import time
+import random
+import argparse
+import calendar
+import platform
+import tempfile
+import threading
+import tracemalloc
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from langchain.schema import AIMessage, ChatResult, ChatGeneration
+from langchain.chat_models.base import BaseChatModel
+import src.database as database
+from src import availability, metrics
+from src.llm_setup import setup_llm
+from src.appointment_handler import process_message
+
+# Booking turns sent by the simulated users, and what the scripted LLM picks out of them
+BOOK_MESSAGE = "Please book {name}, {email}, on {date} at {time} for {purpose}"
+BOOK_PATTERN = re.compile(r'book (?P<name>[^,]+), (?P<email>[^,]+), on (?P<date>\S+) at (?P<time>.+?) for (?P<purpose>.+)$')
+CANCEL_MESSAGE = "Please cancel the booking on {date}"
+CANCEL_PATTERN = re.compile(r"cancel the booking on (?P<date>\S+)")
+RETRIEVE_MESSAGE = "Show my appointments"
+
+# Conversations book far past the synthetic rows so their slots never collide with them
+CONVERSATION_START = datetime(2090, 1, 2, 9, 0)  # a Monday
+SYNTHETIC_START = datetime(2000, 1, 3, 9, 0)
+SYNTHETIC_USERS_PER_ROW = 0.2
+SEED_BATCH_SIZE = 50000
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+class ScriptedChatModel(BaseChatModel):
+    """Deterministic local chat model that answers the load test's scripted turns.
+
+    Booking and cancellation requests get an <APPOINTMENT_DETAILS> block; anything
+    else gets a short reply. latency_ms simulates the provider's response time.
+    """
+
+    latency_ms: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "scripted"
+
+    def _reply(self, text):
+        """Build the reply for the latest user message."""
+        match = BOOK_PATTERN.search(text)
+        if match:
+            fields = match.groupdict()
+            return ("Lovely, let me book that for you! 📅\n\n<APPOINTMENT_DETAILS>\n"
+                    + "".join(f"{field}: {fields[field]}\n" for field in ('name', 'email', 'date', 'time', 'purpose'))
+                    + "action: book\n</APPOINTMENT_DETAILS>")
+
+        match = CANCEL_PATTERN.search(text)
+        if match:
+            return (f"Let me find that appointment for you.\n\n<APPOINTMENT_DETAILS>\ndate: {match.group('date')}\n"
+                    "action: cancel\n</APPOINTMENT_DETAILS>")
+        return "Happy to help! What would you like to do? 😊"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        message = AIMessage(content=self._reply(messages[-1].content))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+def _percentiles(samples):
+    """p50/p95/p99 of a list of durations, in milliseconds."""
+    if not samples:
+        return {f"p{int(q * 100)}_ms": 0.0 for q in QUANTILES}
+    ordered = sorted(samples)
+    return {f"p{int(q * 100)}_ms": round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+            for q in QUANTILES}
+
+def _summarize(latencies, elapsed):
+    """Count, rate and percentiles for each action's latency samples."""
+    summary = {}
+    for action, samples in sorted(latencies.items()):
+        summary[action] = {'count': len(samples), 'per_second': round(len(samples) / elapsed, 2), **_percentiles(samples)}
+    return summary
+
+def _slot(start, index):
+    """The index-th 30-minute weekday slot between 9 AM and 5 PM, counting from a Monday start."""
+    day, slot = divmod(index, 16)
+    weeks, weekday = divmod(day, 5)
+    return start + timedelta(days=weeks * 7 + weekday, minutes=30 * slot)
+
+def seed_database(path, rows):
+    """Create a fresh database at path holding rows synthetic appointments."""
+    database.DB_PATH = path
+    database.ensure_db()
+    users = max(1, int(rows * SYNTHETIC_USERS_PER_ROW))
+
+    def generate():
+        for i in range(rows):
+            user = i % users
+            starts = SYNTHETIC_START + timedelta(minutes=30 * i)
+            date, time_str = starts.strftime('%Y-%m-%d'), starts.strftime('%I:%M %p').lstrip('0')
+            name, email = f"User {user}", f"user{user}@example.com"
+            yield (name, email, date, time_str, "Synthetic appointment", database.normalize_email(email),
+                   database.normalize_name(name), calendar.timegm(starts.timetuple()), None)
+
+    rows_iter = generate()
+    while True:
+        batch = [row for _, row in zip(range(SEED_BATCH_SIZE), rows_iter)]
+        if not batch:
+            break
+        with database.transaction(immediate=True) as conn:
+            conn.executemany("INSERT INTO appointments (name, email, date, time, purpose, email_norm, name_norm, "
+                             "starts_at, duration_minutes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+    with database.transaction() as conn:
+        conn.execute("ANALYZE")
+
+def run_conversation(index, rounds, llm, latencies, lock):
+    """Drive one simulated user through rounds of book, retrieve and cancel; returns its (chain, session)."""
+    chain, llm = setup_llm(llm=llm)
+    session = {}
+    name, email = f"Load Tester {index}", f"load{index}@example.com"
+
+    for round_number in range(rounds):
+        slot = _slot(CONVERSATION_START, index * rounds + round_number)
+        date, time_str = slot.strftime('%Y-%m-%d'), slot.strftime('%I:%M %p').lstrip('0')
+        turns = [
+            ('book', BOOK_MESSAGE.format(name=name, email=email, date=date, time=time_str, purpose="Load test")),
+            ('retrieve', RETRIEVE_MESSAGE),
+            ('cancel', CANCEL_MESSAGE.format(date=date))
+        ]
+        for action, message in turns:
+            started = time.perf_counter()
+            response = process_message(message, chain, llm, session)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.setdefault(action, []).append(elapsed)
+                if response.startswith("Error processing message"):
+                    latencies.setdefault('errors', []).append(elapsed)
+    return chain, session
+
+def bench_chat(conversations, rounds, llm_latency_ms):
+    """Run concurrent conversations through process_message."""
+    llm = ScriptedChatModel(latency_ms=llm_latency_ms)
+    latencies, lock = {}, threading.Lock()
+    metrics.reset_metrics()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=conversations) as pool:
+        for future in [pool.submit(run_conversation, i, rounds, llm, latencies, lock) for i in range(conversations)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    errors = len(latencies.pop('errors', []))
+    turns = sum(len(samples) for samples in latencies.values())
+    return {
+        'turns': turns,
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'turns_per_second': round(turns / elapsed, 2),
+        'latency': {'all': _percentiles([s for samples in latencies.values() for s in samples]),
+                    **_summarize(latencies, elapsed)},
+        'stages': metrics.snapshot()
+    }
+
+def _timed_op(action, func, latencies, lock, *args):
+    """Run one database call and record its latency under action."""
+    started = time.perf_counter()
+    try:
+        return func(*args)
+    except database.sqlite3.OperationalError:
+        action = 'busy_errors'
+    finally:
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.setdefault(action, []).append(elapsed)
+
+def run_db_worker(index, operations, rows, latencies, lock):
+    """Mix slot reservations, lookups, searches and cancellations straight against the database layer."""
+    rng = random.Random(index)
+    users = max(1, int(rows * SYNTHETIC_USERS_PER_ROW))
+    for op in range(operations):
+        slot = _slot(CONVERSATION_START, 10 ** 6 + index * operations + op)
+        date, time_str = slot.strftime('%Y-%m-%d'), slot.strftime('%I:%M %p').lstrip('0')
+        email = f"dbload{index}@example.com"
+        appointment_id, _ = _timed_op('reserve_slot', database.reserve_slot, latencies, lock,
+                                      f"Db Load {index}", email, date, time_str, "Load test") or (None, None)
+        _timed_op('get_appointments', database.get_appointments, latencies, lock,
+                  None, f"user{rng.randrange(users)}@example.com")
+        _timed_op('get_appointments_between', database.get_appointments_between, latencies, lock,
+                  slot, slot + timedelta(days=7))
+        _timed_op('search_appointments', database.search_appointments, latencies, lock,
+                  f"user {rng.randrange(users)}", 10)
+        if appointment_id:
+            _timed_op('delete_appointment', database.delete_appointment, latencies, lock, appointment_id)
+
+def bench_db(workers, operations, rows):
+    """Run concurrent workers against the database layer directly."""
+    latencies, lock = {}, threading.Lock()
+    metrics.reset_metrics()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(run_db_worker, i, operations, rows, latencies, lock) for i in range(workers)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    busy_errors = len(latencies.pop('busy_errors', []))
+    lock_waits = [entry for entry in metrics.snapshot() if entry['stage'] == 'db.lock_wait']
+    return {
+        'operations': sum(len(samples) for samples in latencies.values()),
+        'seconds': round(elapsed, 3),
+        'operations_per_second': round(sum(len(samples) for samples in latencies.values()) / elapsed, 2),
+        'latency': _summarize(latencies, elapsed),
+        'lock_contention': {
+            'busy_errors': busy_errors,
+            'lock_waits': sum(entry['count'] for entry in lock_waits),
+            'lock_wait_seconds': round(sum(entry['sum_seconds'] for entry in lock_waits), 6),
+            'lock_wait_p99_ms': round(max((entry['p99'] for entry in lock_waits), default=0.0) * 1000, 3)
+        }
+    }
+
+def bench_memory(sessions):
+    """Average memory held by a live chat session after one booking round."""
+    # Latency samples would otherwise count towards the sessions' memory
+    metrics.enable_metrics(False)
+    llm = ScriptedChatModel()
+    run_conversation(0, 1, llm, {}, threading.Lock())
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [run_conversation(10 ** 5 + i, 1, llm, {}, threading.Lock()) for i in range(sessions)]
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    grown = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del kept
+    return {'sessions': sessions, 'bytes_per_session': round(grown / sessions)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the appointment chat pipeline and database layer.")
+    parser.add_argument('--conversations', type=int, default=16, help="concurrent simulated conversations")
+    parser.add_argument('--rounds', type=int, default=5, help="book/retrieve/cancel rounds per conversation")
+    parser.add_argument('--rows', type=int, default=1000, help="synthetic appointments seeded into the database")
+    parser.add_argument('--llm-latency-ms', type=float, default=0.0, help="simulated LLM response time")
+    parser.add_argument('--db-workers', type=int, default=8, help="concurrent workers for the database benchmark")
+    parser.add_argument('--db-operations', type=int, default=200, help="operation rounds per database worker")
+    parser.add_argument('--memory-sessions', type=int, default=50, help="sessions measured for memory use")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        seed_started = time.perf_counter()
+        seed_database(os.path.join(folder, 'load_test.db'), args.rows)
+        seed_seconds = time.perf_counter() - seed_started
+        availability.clear_cache()
+        metrics.enable_metrics()
+
+        report = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'config': vars(args),
+            'seed_seconds': round(seed_seconds, 3),
+            'chat': bench_chat(args.conversations, args.rounds, args.llm_latency_ms),
+            'db': bench_db(args.db_workers, args.db_operations, args.rows),
+            'memory': bench_memory(args.memory_sessions)
+        }
+        database.close_connections()
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -1,227 +1,534 @@
 import re
-import streamlit as st
 from src.database import (
     get_appointments, 
-    check_appointment_exists, 
-    add_appointment, 
     delete_appointment, 
-    get_table_structure
+    cancel_by_id,
+    search_appointments,
+    normalize_email,
+    compute_starts_at
 )
-from src.utils import extract_appointment_details, is_valid_email
-from src.llm_setup import format_appointment_response
+from src.availability import book_slot, reschedule_slot, next_free_slots, format_slot, SlotUnavailableError
+from src.normalize import normalize_date, normalize_time
+from src.utils import (
+    extract_appointment_details,
+    is_valid_email,
+    render_appointments,
+    APPOINTMENTS_PAGE_SIZE,
+    SHOW_MORE_HINT,
+    DETAILS_OPEN_TAG,
+    DETAILS_CLOSE_TAG,
+    estimate_tokens
+)
+from src.llm_setup import format_appointment_response, repair_structured_reply
+from src.intents import route_intent, record_turn, EMAIL_PATTERN
+from src.metrics import span, set_action, trace_turn, annotate, iterate_in_turn
+
+# Action label used in latency metrics for each router intent
+INTENT_ACTIONS = {'cancel_by_id': 'cancel', 'retrieve_by_date': 'retrieve', 'bare_email': 'retrieve', 'retrieve': 'retrieve',
+                  'show_more': 'retrieve', 'reschedule': 'reschedule', 'search': 'retrieve'}
+
+BUSY_MESSAGE = "I'm getting a lot of requests right now and couldn't reach the assistant. Please try again in a moment."
+
+CANCEL_CHOICE_HEADING = "I found multiple appointments. Please specify which one you'd like to cancel by ID:"
+CANCEL_CHOICE_FOOTER = "Please reply with the ID number of the appointment you want to cancel (e.g., 'Cancel appointment ID 5')."
+RESCHEDULE_CHOICE_HEADING = "You have several appointments. Which one would you like to move?"
+RESCHEDULE_CHOICE_FOOTER = "Please reply with its ID and the new time (e.g., 'Reschedule appointment ID 5 to 2025-03-20 at 3:00 PM')."
+
+# Best full-text matches listed for a search; results are ranked, so there is no "show more"
+SEARCH_RESULT_LIMIT = 10
+
+def _appointments_page(session, heading, footer=None, name=None, email=None, date=None, after=None, start=1):
+    """Render one page of matching appointments and remember where the next page starts.
+
+    Returns (text, page); text is None when no appointments matched.
+    """
+    rows = get_appointments(name, email, date, limit=APPOINTMENTS_PAGE_SIZE + 1, after=after)
+    page = rows[:APPOINTMENTS_PAGE_SIZE]
+    if not page:
+        session.pop('more_appointments', None)
+        return None, page
+    
+    if len(rows) > APPOINTMENTS_PAGE_SIZE:
+        session['more_appointments'] = {'name': name, 'email': email, 'date': date, 'footer': footer,
+                                        'after': page[-1].cursor, 'start': start + len(page)}
+        footer = f"{SHOW_MORE_HINT}\n\n{footer}" if footer else SHOW_MORE_HINT
+    else:
+        session.pop('more_appointments', None)
+    return render_appointments(page, heading, start, footer), page
+
+def _list_appointments(session, email, date=None):
+    """Build the reply listing the first page of an email's appointments, optionally on one date."""
+    text, _ = _appointments_page(session, f"Here are the appointments for {email}:", email=email, date=date)
+    if text is None:
+        when = f" on {date}" if date else ""
+        return f"I couldn't find any appointments associated with {email}{when}. Would you like to book a new appointment?"
+    return text
+
+def _show_more(session):
+    """Continue the last appointment list with its next page."""
+    more = session.get('more_appointments')
+    text = None
+    if more:
+        text, _ = _appointments_page(session, "Here are more appointments:", more['footer'], more['name'],
+                                     more['email'], more['date'], more['after'], more['start'])
+    return text or "There are no more appointments to show. Is there anything else I can help you with?"
+
+def _search(session, query):
+    """List the current user's appointments best matching a name, email or purpose search."""
+    session.pop('more_appointments', None)
+    email = session.get('current_email')
+    if not email:
+        return "To search your appointments, I'll need your email address. What email did you use when booking?"
+    
+    matches = search_appointments(query, SEARCH_RESULT_LIMIT, email=email)
+    if not matches:
+        return f"I couldn't find any of your appointments matching \"{query}\". Try a word from the purpose or a date."
+    return render_appointments(matches, f"Here are your appointments best matching \"{query}\":")
 
-def process_message(user_input, llm_chain, llm):
-    """Process user messages and handle appointment-related actions."""
+def _cancel_by_id(appointment_id, session):
+    """Cancel one of the current user's appointments by its ID."""
+    email = session.get('current_email')
+    if not email:
+        return "To cancel an appointment, I'll need your email address first. What email did you use when booking?"
+    
+    appointment = cancel_by_id(appointment_id, email)
+    if appointment is None:
+        return f"I couldn't find appointment ID {appointment_id} for {email}. Please check the ID and try again."
+    return f"✅ I've successfully canceled your appointment on {appointment.date} at {appointment.time}. Is there anything else I can help you with?"
+
+def _slot_taken(date, time, reason=None):
+    """Reply for a slot someone else holds, or that can't be booked for reason, offering the next free times."""
+    response = reason or f"Sorry, the {time} slot on {date} is already booked."
+    alternatives = next_free_slots(compute_starts_at(date, time))
+    if alternatives:
+        response += " The next free times are:\n\n" + "\n".join(f"• {format_slot(slot)}" for slot in alternatives)
+        response += "\n\nWould you like one of these instead?"
+    else:
+        response += " Would you like to book a different time?"
+    return response
+
+def _reschedule(appointment_id, date, time, session):
+    """Move one of the current user's appointments to a new date and time."""
+    email = session.get('current_email')
+    if not email:
+        return "To reschedule an appointment, I'll need your email address first. What email did you use when booking?"
+    
+    date, time = normalize_date(date), normalize_time(time)
+    if compute_starts_at(date, time) is None:
+        return f"I couldn't understand \"{date} at {time}\" as a date and time. Could you give it like 2025-03-20 at 3:00 PM?"
+    
     try:
-        # Extract email from input if present
-        email_pattern = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
-        email_match = re.search(email_pattern, user_input)
-        if email_match:
-            email = email_match.group()
-            st.session_state['current_email'] = email
-        
-        # Check if input is a retrieval request
-        user_input_lower = user_input.lower().strip()
-        retrieval_phrases = ["retrieve", "check appointment", "my appointment", "show appointment", 
-                            "view appointment", "get appointment", "find appointment", "look up", 
-                            "lookup", "get info", "find info", "check info", "appointment info"]
-        
-        is_retrieval_request = any(phrase in user_input_lower for phrase in retrieval_phrases)
-        
-        # Direct retrieval flow
-        if is_retrieval_request:
-            email = st.session_state.get('current_email')
-            
+        moved, conflict = reschedule_slot(appointment_id, email, date, time)
+    except SlotUnavailableError as e:
+        return _slot_taken(date, time, str(e))
+    if moved:
+        return f"✅ I've moved appointment ID {appointment_id} to {moved.date} at {moved.time}. Is there anything else I can help you with?"
+    if conflict is None:
+        return f"I couldn't find appointment ID {appointment_id} for {email}. Please check the ID and try again."
+    if conflict.email_norm == normalize_email(email):
+        return f"You already have an appointment on {date} at {time}. Would you like a different time?"
+    return _slot_taken(date, time)
+
+def _direct_response(user_input, session):
+    """Handle the parts of a turn that don't need the LLM.
+
+    Returns (response, is_retrieval_request); response is None when the LLM is needed.
+    """
+    # Extract email from input if present
+    email_match = re.search(EMAIL_PATTERN, user_input)
+    if email_match:
+        email = email_match.group()
+        session['current_email'] = email
+    
+    response = None
+    is_retrieval_request = False
+    intent = route_intent(user_input)
+    
+    if intent:
+        name, params = intent
+        set_action(INTENT_ACTIONS[name])
+        
+        if name == 'cancel_by_id':
+            response = _cancel_by_id(params['id'], session)
+        
+        elif name == 'reschedule':
+            response = _reschedule(params['id'], params['date'], params['time'], session)
+        
+        elif name == 'retrieve_by_date':
+            is_retrieval_request = True
+            email = params['email'] or session.get('current_email')
             if email:
-                appointments = get_appointments(email=email)
-                
-                if appointments:
-                    columns = get_table_structure()
-                    response = f"Here are the appointments for {email}:\n\n"
-                    for i, appt in enumerate(appointments):
-                        appt_dict = {columns[j]: appt[j] for j in range(len(appt))}
-                        response += f"📅 Appointment {i+1}:\n"
-                        response += f"• Date: {appt_dict.get('date', 'N/A')}\n"
-                        response += f"• Time: {appt_dict.get('time', 'N/A')}\n"
-                        response += f"• Name: {appt_dict.get('name', 'N/A')}\n"
-                        purpose = appt_dict.get('purpose', '')
-                        if purpose and purpose not in ('N/A', 'None', 'none'):
-                            response += f"• Purpose: {purpose}\n"
-                        response += "\n"
-                    return response.strip()
-                else:
-                    return f"I couldn't find any appointments associated with {email}. Would you like to book a new appointment?"
+                response = _list_appointments(session, email, params['date'])
             else:
-                return "To check your appointments, I'll need your email address. What email did you use when booking?"
+                response = "To check your appointments, I'll need your email address. What email did you use when booking?"
         
-        # Standard LLM processing flow
-        llm_response = llm_chain.invoke({"input": user_input})
+        # A bare email lists that user's bookings; otherwise it's an answer for the LLM
+        elif name == 'bare_email':
+            if get_appointments(email=params['email'], limit=1):
+                response = _list_appointments(session, params['email'])
         
-        response_text = ""
-        if hasattr(llm_response, "text"):
-            response_text = llm_response.text
-        elif hasattr(llm_response, "content"):
-            response_text = llm_response.content
-        elif isinstance(llm_response, dict):
-            response_text = llm_response.get("text", llm_response.get("content", ""))
+        elif name == 'retrieve':
+            is_retrieval_request = True
+            email = session.get('current_email')
+            if email:
+                response = _list_appointments(session, email)
+            else:
+                response = "To check your appointments, I'll need your email address. What email did you use when booking?"
         
-        details, clean_response = extract_appointment_details(response_text)
+        elif name == 'search':
+            is_retrieval_request = True
+            response = _search(session, params['query'])
         
-        if details and details.get('email'):
-            st.session_state['current_email'] = details['email']
-            
-        if details and details.get('name'):
-            st.session_state['current_name'] = details['name']
-            
-        # Handle retrieval fallback with current email
-        current_email = st.session_state.get('current_email')
-        if current_email and is_retrieval_request and (not details or details.get('action') != 'retrieve'):
-            appointments = get_appointments(email=current_email)
-            
-            if appointments:
-                columns = get_table_structure()
-                response = f"Here are the appointments for {current_email}:\n\n"
-                for i, appt in enumerate(appointments):
-                    appt_dict = {columns[j]: appt[j] for j in range(len(appt))}
-                    response += f"📅 Appointment {i+1}:\n"
-                    response += f"• Date: {appt_dict.get('date', 'N/A')}\n"
-                    response += f"• Time: {appt_dict.get('time', 'N/A')}\n"
-                    response += f"• Name: {appt_dict.get('name', 'N/A')}\n"
-                    purpose = appt_dict.get('purpose', '')
-                    if purpose and purpose not in ('N/A', 'None', 'none'):
-                        response += f"• Purpose: {purpose}\n"
-                    response += "\n"
-                return response.strip()
-            else:
-                return f"I couldn't find any appointments associated with {current_email}. Would you like to book a new appointment?"
-                
-        # No details extracted
-        if not details:
-            return clean_response
-        
-        # Booking flow
-        if details.get('action') == 'book':
-            if not details.get('name'):
-                details['name'] = st.session_state.get('current_name', '')
-            if not details.get('email'):
-                details['email'] = st.session_state.get('current_email', '')
-            
-            if not details.get('name'):
-                return f"{clean_response}\n\nCould you please tell me your name?"
-                
-            if not details.get('email'):
-                return f"{clean_response}\n\nThanks, {details['name']}! What's your email address?"
-            elif not is_valid_email(details.get('email')):
-                return f"{clean_response}\n\nThe email address doesn't seem valid. Could you please provide a valid email?"
-                
-            if not details.get('date'):
-                return f"{clean_response}\n\nGreat! What date would you like to book? (Any format like 3/15/2025 or 2025-03-15 works)"
-                
-            if not details.get('time'):
-                return f"{clean_response}\n\nPerfect! What time would you prefer on {details['date']}?"
-                
-            if not details.get('purpose') and 'purpose' not in details:
-                return f"{clean_response}\n\nAlmost done! Could you tell me the purpose of this appointment?"
-            
-            # Save the current user info to session state
-            st.session_state['current_name'] = details['name']
-            st.session_state['current_email'] = details['email']
-            
-            # Check if appointment already exists
-            if check_appointment_exists(details['name'], details['email'], details['date'], details['time']):
-                return f"You already have an appointment on {details['date']} at {details['time']}. Would you like to book a different time?"
+        elif name == 'show_more':
+            is_retrieval_request = True
+            response = _show_more(session)
+    
+    record_turn(response is not None)
+    return response, is_retrieval_request
+
+def _act_on_details(details, is_retrieval_request, llm, session):
+    """Run the booking, retrieval or cancellation for the details the LLM extracted.
+
+    Returns (text, keep_llm_text): text is None when the LLM's reply stands alone,
+    and keep_llm_text says whether text follows the LLM's reply or replaces it.
+    """
+    if details and details.get('action'):
+        set_action(details['action'])
+    elif is_retrieval_request:
+        set_action('retrieve')
+    
+    if details and details.get('email'):
+        session['current_email'] = details['email']
+        
+    if details and details.get('name'):
+        session['current_name'] = details['name']
+        
+    # Handle retrieval fallback with current email
+    current_email = session.get('current_email')
+    if current_email and is_retrieval_request and (not details or details.get('action') != 'retrieve'):
+        return _list_appointments(session, current_email), False
             
-            # Add the appointment to the database
-            purpose = details.get('purpose', 'General appointment')
-            add_appointment(details['name'], details['email'], details['date'], details['time'], purpose)
-
-            # Format and return confirmation
-            confirmation = {
-                "name": details['name'],
-                "email": details['email'],
-                "date": details['date'],
-                "time": details['time'],
-                "purpose": purpose
-            }
+    # No details extracted
+    if not details:
+        return None, True
+    
+    # Booking flow
+    if details.get('action') == 'book':
+        if not details.get('name'):
+            details['name'] = session.get('current_name', '')
+        if not details.get('email'):
+            details['email'] = session.get('current_email', '')
+        
+        if not details.get('name'):
+            return "Could you please tell me your name?", True
             
-            return format_appointment_response(confirmation, "confirmation", llm)
+        if not details.get('email'):
+            return f"Thanks, {details['name']}! What's your email address?", True
+        elif not is_valid_email(details.get('email')):
+            return "The email address doesn't seem valid. Could you please provide a valid email?", True
             
-        # Retrieval flow
-        elif details.get('action') == 'retrieve':
-            email = details.get('email') or st.session_state.get('current_email', '')
-            date = details.get('date')
+        if not details.get('date'):
+            return "Great! What date would you like to book? (Any format like 3/15/2025 or 2025-03-15 works)", True
             
-            if not email:
-                return f"{clean_response}\n\nPlease provide your email address so I can check your appointments."
+        if not details.get('time'):
+            return f"Perfect! What time would you prefer on {details['date']}?", True
             
-            if email:
-                st.session_state['current_email'] = email
+        if not details.get('purpose') and 'purpose' not in details:
+            return "Almost done! Could you tell me the purpose of this appointment?", True
+        
+        # Save the current user info to session state
+        session['current_name'] = details['name']
+        session['current_email'] = details['email']
+        
+        # Book the slot in one write, unless it is already taken
+        purpose = details.get('purpose', 'General appointment')
+        try:
+            appointment_id, conflict = book_slot(details['name'], details['email'], details['date'], details['time'], purpose)
+        except SlotUnavailableError as e:
+            return _slot_taken(details['date'], details['time'], str(e)), False
+        
+        if conflict:
+            if conflict.email_norm == normalize_email(details['email']):
+                return f"You already have an appointment on {details['date']} at {details['time']}. Would you like to book a different time?", False
             
-            appointments = get_appointments(email=email, date=date)
+            return _slot_taken(details['date'], details['time']), False
+
+        # Format and return confirmation
+        confirmation = {
+            "name": details['name'],
+            "email": details['email'],
+            "date": details['date'],
+            "time": details['time'],
+            "purpose": purpose
+        }
+        
+        with span("format_confirmation"):
+            return format_appointment_response(confirmation, "confirmation", llm), False
+        
+    # Retrieval flow
+    elif details.get('action') == 'retrieve':
+        email = details.get('email') or session.get('current_email', '')
+        date = details.get('date')
+        
+        if not email:
+            return "Please provide your email address so I can check your appointments.", True
+        
+        if email:
+            session['current_email'] = email
+        
+        return _list_appointments(session, email, date), False
+    
+    # Cancellation flow
+    elif details.get('action') == 'cancel':
+        appointments = []
+        name = details.get('name') or session.get('current_name', '')
+        email = details.get('email') or session.get('current_email', '')
+        date = details.get('date')
+        
+        if not name and not email:
+            return "Please provide your name or email so I can find and cancel your appointment.", True
+        
+        if name:
+            session['current_name'] = name
+        if email:
+            session['current_email'] = email
             
-            if appointments:
-                columns = get_table_structure()
-                response = f"Here are the appointments for {email}:\n\n"
-                for i, appt in enumerate(appointments):
-                    appt_dict = {columns[j]: appt[j] for j in range(len(appt))}
-                    response += f"📅 Appointment {i+1}:\n"
-                    response += f"• Date: {appt_dict.get('date', 'N/A')}\n"
-                    response += f"• Time: {appt_dict.get('time', 'N/A')}\n"
-                    response += f"• Name: {appt_dict.get('name', 'N/A')}\n"
-                    purpose = appt_dict.get('purpose', '')
-                    if purpose and purpose not in ('N/A', 'None', 'none'):
-                        response += f"• Purpose: {purpose}\n"
-                    response += "\n"
-                return response.strip()
+        # The email identifies the person; the name may be shortened ("John" for "John Smith"),
+        # so it is only used to look appointments up when no email is known
+        text, page = _appointments_page(session, CANCEL_CHOICE_HEADING, CANCEL_CHOICE_FOOTER,
+                                        None if email else name, email, date)
+        
+        if not page:
+            return "I couldn't find any appointments to cancel. Please check your details and try again.", False
+        
+        if len(page) == 1 and not session.get('more_appointments'):
+            appointment = page[0]
+            if delete_appointment(appointment.id):
+                return f"✅ I've successfully canceled your appointment on {appointment.date} at {appointment.time}. Is there anything else I can help you with?", False
             else:
-                return f"I couldn't find any appointments associated with {email}. Would you like to book a new appointment?"
-        
-        # Cancellation flow
-        elif details.get('action') == 'cancel':
-            appointments = []
-            name = details.get('name') or st.session_state.get('current_name', '')
-            email = details.get('email') or st.session_state.get('current_email', '')
-            date = details.get('date')
+                return "❌ I encountered an error while trying to cancel your appointment. Please try again or contact support.", False
+        
+        return text, False
+    
+    # Reschedule flow
+    elif details.get('action') == 'reschedule':
+        email = details.get('email') or session.get('current_email', '')
+        if not email:
+            return "Please provide your email address so I can find the appointment to move.", True
+        session['current_email'] = email
+        
+        appointment_id = details.get('id', '').lstrip('#')
+        if not appointment_id.isdigit():
+            text, page = _appointments_page(session, RESCHEDULE_CHOICE_HEADING, RESCHEDULE_CHOICE_FOOTER, email=email)
+            if not page:
+                return f"I couldn't find any appointments associated with {email}. Would you like to book a new appointment?", False
+            if len(page) > 1 or session.get('more_appointments'):
+                return text, False
+            appointment_id = page[0].id
+        
+        if not details.get('date') or not details.get('time'):
+            return "What new date and time would you like for this appointment?", True
+        
+        return _reschedule(int(appointment_id), details['date'], details['time'], session), False
+        
+    return None, True
+
+def _extraction_mode(llm_chain):
+    """The chain's extraction mode, "tags" or "json" (see setup_llm)."""
+    return (getattr(llm_chain, 'metadata', None) or {}).get('extraction_mode', 'tags')
+
+def _record_usage(llm_response, response_text, llm_chain, session):
+    """Store the turn's prompt and completion token counts, from the model's usage data when it has any."""
+    usage = None
+    generations = llm_response.get("full_generation") if isinstance(llm_response, dict) else None
+    if generations:
+        usage = getattr(getattr(generations[0], "message", None), "usage_metadata", None)
+    
+    if usage:
+        session['prompt_tokens'], session['completion_tokens'] = usage['input_tokens'], usage['output_tokens']
+    else:
+        session['prompt_tokens'] = getattr(llm_chain.memory, 'last_prompt_tokens', None)
+        session['completion_tokens'] = estimate_tokens(response_text)
+    annotate(prompt_tokens=session['prompt_tokens'], completion_tokens=session['completion_tokens'])
+
+def _gateway_error():
+    """Return LLMGatewayError; the gateway module (and LangChain) load only once a turn fails."""
+    from src.llm_gateway import LLMGatewayError
+    return LLMGatewayError
+
+def _parse_structured(response_text, llm):
+    """Validate a JSON-mode reply, asking the model to repair it up to STRUCTURED_MAX_RETRIES times.
+
+    A reply that still fails is read with the tag parser, so any details block or
+    plain text the model originally wrote instead is not lost.
+    """
+    from src.structured import parse_structured_reply, record_parse, STRUCTURED_MAX_RETRIES
+    
+    failures = retries = 0
+    text = response_text
+    while True:
+        try:
+            details, clean_response = parse_structured_reply(text)
+            break
+        except ValueError as e:
+            failures += 1
+            if retries == STRUCTURED_MAX_RETRIES:
+                details, clean_response = extract_appointment_details(response_text)
+                break
+            retries += 1
+            text = repair_structured_reply(llm, text, e)
+    
+    record_parse(failures, retries)
+    annotate(parse_failures=failures, parse_retries=retries)
+    return details, clean_response
+
+def _compose_response(clean_response, text, keep_llm_text):
+    """Combine the LLM's visible reply with the result of acting on its details."""
+    if text is None:
+        return clean_response
+    if keep_llm_text:
+        return f"{clean_response}\n\n{text}"
+    return text
+
+def process_message(user_input, llm_chain, llm, session):
+    """Process user messages and handle appointment-related actions.
+
+    session is the user's conversation state: any dict-like mapping, such as
+    st.session_state in the Streamlit app or a plain dict in the API.
+    """
+    with trace_turn():
+        try:
+            with span("route"):
+                response, is_retrieval_request = _direct_response(user_input, session)
+            if response is not None:
+                return response
             
-            if not name and not email:
-                return f"{clean_response}\n\nPlease provide your name or email so I can find and cancel your appointment."
+            # Standard LLM processing flow
+            with span("llm"):
+                llm_response = llm_chain.invoke({"input": user_input})
             
-            if name:
-                st.session_state['current_name'] = name
-            if email:
-                st.session_state['current_email'] = email
-                
-            appointments = get_appointments(name, email, date)
+            response_text = ""
+            if hasattr(llm_response, "text"):
+                response_text = llm_response.text
+            elif hasattr(llm_response, "content"):
+                response_text = llm_response.content
+            elif isinstance(llm_response, dict):
+                response_text = llm_response.get("text", llm_response.get("content", ""))
             
-            if not appointments:
-                return f"I couldn't find any appointments to cancel. Please check your details and try again."
+            _record_usage(llm_response, response_text, llm_chain, session)
             
-            if len(appointments) == 1:
-                columns = get_table_structure()
-                appt_dict = {columns[j]: appointments[0][j] for j in range(len(appointments[0]))}
-                appt_id = appt_dict.get('id')
-                appt_date = appt_dict.get('date')
-                appt_time = appt_dict.get('time')
-                
-                if delete_appointment(appt_id):
-                    return f"✅ I've successfully canceled your appointment on {appt_date} at {appt_time}. Is there anything else I can help you with?"
+            with span("extract_details"):
+                if _extraction_mode(llm_chain) == "json":
+                    details, clean_response = _parse_structured(response_text, llm)
                 else:
-                    return f"❌ I encountered an error while trying to cancel your appointment. Please try again or contact support."
-            
-            columns = get_table_structure()
-            appointments_text = "I found multiple appointments. Please specify which one you'd like to cancel by ID:\n\n"
-            for i, appt in enumerate(appointments):
-                appt_dict = {columns[j]: appt[j] for j in range(len(appt))}
-                appointments_text += f"📅 Appointment {i+1}:\n"
-                appointments_text += f"• ID: {appt_dict.get('id', 'N/A')}\n"
-                appointments_text += f"• Date: {appt_dict.get('date', 'N/A')}\n"
-                appointments_text += f"• Time: {appt_dict.get('time', 'N/A')}\n"
-                appointments_text += f"• Purpose: {appt_dict.get('purpose', 'General appointment')}\n\n"
-            
-            appointments_text += "Please reply with the ID number of the appointment you want to cancel (e.g., 'Cancel appointment ID 5')."
-            return appointments_text
+                    details, clean_response = extract_appointment_details(response_text)
+            with span("act"):
+                text, keep_llm_text = _act_on_details(details, is_retrieval_request, llm, session)
+            return _compose_response(clean_response, text, keep_llm_text)
+        
+        except _gateway_error():
+            set_action("error")
+            return BUSY_MESSAGE
+        except Exception as e:
+            set_action("error")
+            return f"Error processing message: {str(e)}\n\nPlease try again or restart the application."
+
+def _stream_llm(llm_chain, user_input, session):
+    """Stream the chain's reply token by token, saving the full turn to its memory afterwards."""
+    inputs = {"input": user_input}
+    inputs.update(llm_chain.memory.load_memory_variables(inputs))
+    session['prompt_tokens'] = getattr(llm_chain.memory, 'last_prompt_tokens', None)
+    
+    chunks = []
+    for chunk in (llm_chain.prompt | llm_chain.llm).stream(inputs):
+        chunks.append(chunk.content)
+        yield chunk.content
+    
+    session['completion_tokens'] = estimate_tokens("".join(chunks))
+    llm_chain.memory.save_context({"input": user_input}, {"text": "".join(chunks)})
+
+def _held_back(text, tag):
+    """Length of the longest suffix of text that could be the start of tag."""
+    for size in range(min(len(text), len(tag) - 1), 0, -1):
+        if tag.startswith(text[-size:]):
+            return size
+    return 0
+
+def stream_message(user_input, llm_chain, llm, session):
+    """Like process_message, but yield the reply in pieces as the LLM produces it.
+
+    The <APPOINTMENT_DETAILS> block is held back and never yielded; the database
+    action runs as soon as its closing tag arrives, and its result is yielded once
+    the LLM's visible text has finished streaming. JSON-mode replies can't be shown
+    before they are complete, so they arrive in one piece.
+    """
+    if _extraction_mode(llm_chain) == "json":
+        yield process_message(user_input, llm_chain, llm, session)
+        return
+    
+    with trace_turn() as turn:
+        yield from iterate_in_turn(turn, _stream_reply(user_input, llm_chain, llm, session))
+
+def _stream_reply(user_input, llm_chain, llm, session):
+    """Body of stream_message, run inside its turn."""
+    try:
+        with span("route"):
+            response, is_retrieval_request = _direct_response(user_input, session)
+        if response is not None:
+            yield response
+            return
+    
+        pending = ""
+        in_details = False
+        visible = []
+        result = None
+    
+        for token in _stream_llm(llm_chain, user_input, session):
+            pending += token
+            while True:
+                if in_details:
+                    end = pending.find(DETAILS_CLOSE_TAG)
+                    if end < 0:
+                        break
+                    block = DETAILS_OPEN_TAG + pending[:end + len(DETAILS_CLOSE_TAG)]
+                    pending = pending[end + len(DETAILS_CLOSE_TAG):]
+                    in_details = False
+                    if result is None:
+                        with span("extract_details"):
+                            details, _ = extract_appointment_details(block)
+                        with span("act"):
+                            result = _act_on_details(details, is_retrieval_request, llm, session)
+                    continue
             
-        return clean_response
+                start = pending.find(DETAILS_OPEN_TAG)
+                if start >= 0:
+                    text, pending = pending[:start], pending[start + len(DETAILS_OPEN_TAG):]
+                    in_details = True
+                else:
+                    # Hold back anything that might be the start of an opening tag
+                    cut = len(pending) - _held_back(pending, DETAILS_OPEN_TAG)
+                    text, pending = pending[:cut], pending[cut:]
+                if text:
+                    visible.append(text)
+                    yield text
+                if not in_details:
+                    break
     
+        # Flush any trailing text; an unterminated details block is dropped
+        if pending and not in_details:
+            visible.append(pending)
+            yield pending
+    
+        if result is None:
+            with span("act"):
+                result = _act_on_details(None, is_retrieval_request, llm, session)
+        text = result[0]
+        if text is not None:
+            yield f"\n\n{text}" if "".join(visible).strip() else text
+
+    except _gateway_error():
+        set_action("error")
+        yield BUSY_MESSAGE
     except Exception as e:
-        return f"Error processing message: {str(e)}\n\nPlease try again or restart the application."
\ No newline at end of file
+        set_action("error")
+        yield f"\n\nError processing message: {str(e)}\n\nPlease try again or restart the application."
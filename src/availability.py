@@ -0,0 +1,200 @@
+import threading
+import time as clock
+from datetime import datetime
+from src.database import (
+    add_change_listener,
+    compute_starts_at,
+    from_epoch,
+    get_appointments_between,
+    normalize_email,
+    reserve_slot,
+    reschedule_appointment,
+    to_epoch,
+    DEFAULT_DURATION_MINUTES,
+    DEFAULT_RESOURCE
+)
+
+# Bookable hours and slot layout
+OPEN_HOUR = 9
+CLOSE_HOUR = 17
+SLOT_MINUTES = 30
+WORKING_DAYS = {0, 1, 2, 3, 4}  # Monday to Friday
+OPENING_HOURS_TEXT = "Monday to Friday, 9:00 AM to 5:00 PM"  # keep in sync with the values above
+
+# How many bookings one slot can hold (one per resource)
+SLOT_CAPACITY = 1
+
+# How far ahead to look for free slots, and how long a loaded day is trusted before
+# reloading it. Occupancy is cached per process and only this process's writes update
+# it, so a slot that looks full is reloaded from the database before a booking is refused.
+MAX_SEARCH_DAYS = 60
+DAY_CACHE_TTL_SECONDS = 60
+
+SECONDS_PER_DAY = 86400
+SLOTS_PER_DAY = (CLOSE_HOUR - OPEN_HOUR) * 60 // SLOT_MINUTES
+
+# Per-day occupancy: day number -> (loaded_at, bytearray of bookings per slot)
+_days = {}
+_days_lock = threading.Lock()
+
+class SlotUnavailableError(Exception):
+    """Raised when a booking or move targets a time that is closed, off the slot grid or already full."""
+
+def slot_resources():
+    """Resource names that share each slot, one per unit of capacity."""
+    return [DEFAULT_RESOURCE] + [f"{DEFAULT_RESOURCE}-{n}" for n in range(2, SLOT_CAPACITY + 1)]
+
+def _slot_range(starts_at, duration_minutes):
+    """Return (day, first_slot, end_slot) covered by a booking, clipped to working hours."""
+    day = starts_at // SECONDS_PER_DAY
+    offset = starts_at - day * SECONDS_PER_DAY - OPEN_HOUR * 3600
+    duration = (duration_minutes or DEFAULT_DURATION_MINUTES) * 60
+    slot_seconds = SLOT_MINUTES * 60
+    first = max(offset // slot_seconds, 0)
+    end = min(-(-(offset + duration) // slot_seconds), SLOTS_PER_DAY)
+    return day, first, end
+
+def _load_day(day):
+    """Build the occupancy counts for one day from the database."""
+    occupancy = bytearray(SLOTS_PER_DAY)
+    start = day * SECONDS_PER_DAY
+    for appt in get_appointments_between(start, start + SECONDS_PER_DAY):
+        _, first, end = _slot_range(appt.starts_at, appt.duration_minutes)
+        for slot in range(first, end):
+            occupancy[slot] = min(occupancy[slot] + 1, 255)
+    return occupancy
+
+def _get_day(day, reload=False):
+    """Return the cached occupancy for a day, loading it on first use, once it is stale, or when asked to."""
+    with _days_lock:
+        entry = _days.get(day)
+        if reload or entry is None or clock.monotonic() - entry[0] > DAY_CACHE_TTL_SECONDS:
+            entry = _days[day] = (clock.monotonic(), _load_day(day))
+        return entry[1]
+
+def _on_change(event, starts_at, duration_minutes):
+    """Apply a committed booking change to any day already loaded."""
+    day, first, end = _slot_range(starts_at, duration_minutes)
+    if event == 'reload':
+        with _days_lock:
+            _days.pop(day, None)
+        return
+
+    step = 1 if event == 'add' else -1
+    with _days_lock:
+        entry = _days.get(day)
+        if entry is None:
+            return
+        occupancy = entry[1]
+        for slot in range(first, end):
+            occupancy[slot] = min(max(occupancy[slot] + step, 0), 255)
+
+add_change_listener(_on_change)
+
+def clear_cache():
+    """Forget all loaded days so they are reloaded from the database."""
+    with _days_lock:
+        _days.clear()
+
+def _has_room(starts_at, duration_minutes=None, reload=False):
+    """Check whether every slot a booking would cover has room for it; reload rereads the day first."""
+    day, first, end = _slot_range(starts_at, duration_minutes)
+    occupancy = _get_day(day, reload)
+    return all(occupancy[slot] < SLOT_CAPACITY for slot in range(first, end))
+
+def is_slot_free(date, time):
+    """Check whether the slot at the given date and time has room for another booking."""
+    starts_at = compute_starts_at(date, time)
+    if starts_at is None:
+        return True
+    return _has_room(starts_at, SLOT_MINUTES)
+
+def check_slot(date, time, duration_minutes=None):
+    """Return the starts_at epoch of a bookable slot, or raise SlotUnavailableError saying why it isn't.
+
+    Bookings must start on the slot grid of a working day and end by closing time.
+    Room in the slot is checked separately, by book_slot and reschedule_slot.
+    """
+    starts_at = compute_starts_at(date, time)
+    if starts_at is None:
+        raise SlotUnavailableError(f"I couldn't read \"{date} at {time}\" as a date and time.")
+    
+    offset = starts_at % SECONDS_PER_DAY - OPEN_HOUR * 3600
+    duration = (duration_minutes or DEFAULT_DURATION_MINUTES) * 60
+    if (from_epoch(starts_at).weekday() not in WORKING_DAYS or offset < 0
+            or offset + duration > (CLOSE_HOUR - OPEN_HOUR) * 3600):
+        raise SlotUnavailableError(f"Sorry, {date} at {time} is outside our hours ({OPENING_HOURS_TEXT}).")
+    if offset % (SLOT_MINUTES * 60):
+        raise SlotUnavailableError(f"Sorry, appointments start every {SLOT_MINUTES} minutes from {OPEN_HOUR}:00 AM, "
+                                   f"so {time} isn't available.")
+    return starts_at
+
+def _claim_check(date, time, email, duration_minutes=None):
+    """Validate a slot before writing it; returns the person's own booking there, if any.
+
+    The day occupancy catches bookings that overlap the slot without starting at
+    the same time, which the unique slot indexes can't see.
+    """
+    starts_at = check_slot(date, time, duration_minutes)
+    if _has_room(starts_at, duration_minutes):
+        return None
+    own = get_appointments_between(starts_at, starts_at + 1, email=email, limit=1)
+    if own:
+        return own[0]
+    # The cached day may predate a cancellation made by another process
+    if _has_room(starts_at, duration_minutes, reload=True):
+        return None
+    raise SlotUnavailableError(f"Sorry, the {time} slot on {date} is already booked.")
+
+def next_free_slots(after=None, count=3):
+    """Return up to count datetimes of free slot starts at or after the given datetime or epoch."""
+    after = to_epoch(after) if after is not None else to_epoch(datetime.now())
+    day = after // SECONDS_PER_DAY
+    free = []
+
+    for day in range(day, day + MAX_SEARCH_DAYS):
+        if from_epoch(day * SECONDS_PER_DAY).weekday() not in WORKING_DAYS:
+            continue
+        occupancy = _get_day(day)
+        day_open = day * SECONDS_PER_DAY + OPEN_HOUR * 3600
+        for slot in range(SLOTS_PER_DAY):
+            slot_start = day_open + slot * SLOT_MINUTES * 60
+            if slot_start >= after and occupancy[slot] < SLOT_CAPACITY:
+                free.append(from_epoch(slot_start))
+                if len(free) == count:
+                    return free
+    return free
+
+def book_slot(name, email, date, time, purpose, duration_minutes=None):
+    """Reserve the slot on the first resource with room; returns reserve_slot's (id, conflict).
+
+    Raises SlotUnavailableError when the slot is closed, off the grid or full.
+    """
+    own = _claim_check(date, time, email, duration_minutes)
+    if own:
+        return None, own
+    conflict = None
+    for resource in slot_resources():
+        appointment_id, conflict = reserve_slot(name, email, date, time, purpose, duration_minutes, resource)
+        if appointment_id or conflict.email_norm == normalize_email(email):
+            return appointment_id, conflict
+    return None, conflict
+
+def reschedule_slot(appointment_id, email, date, time):
+    """Move an appointment to the first resource with room in the new slot; returns reschedule_appointment's result.
+
+    Raises SlotUnavailableError when the new slot is closed, off the grid or full.
+    """
+    own = _claim_check(date, time, email)
+    if own:
+        return None, own
+    moved, conflict = None, None
+    for resource in slot_resources():
+        moved, conflict = reschedule_appointment(appointment_id, email, date, time, resource)
+        if moved or conflict is None or conflict.email_norm == normalize_email(email):
+            return moved, conflict
+    return moved, conflict
+
+def format_slot(slot):
+    """Format a free slot datetime the way appointments are shown to users."""
+    return f"{slot.strftime('%Y-%m-%d')} at {slot.strftime('%I:%M %p').lstrip('0')}"
@@ -0,0 +1,155 @@
+"""Bulk appointment import and export for CSV and JSONL files.
+
+    python -m src.bulk import appointments.csv
+    python -m src.bulk export backup.jsonl
+"""
+import os
+import csv
+import json
+import argparse
+from src.database import ensure_db, add_appointments, iter_appointments, compute_starts_at
+from src.normalize import normalize_date, normalize_time
+from src.utils import is_valid_email
+
+# Rows written per transaction on import, and read per cursor fetch on export
+IMPORT_BATCH_SIZE = 5000
+EXPORT_BATCH_SIZE = 1000
+
+# Columns read on import (name, email, date and time are required) and written on export
+IMPORT_FIELDS = ('name', 'email', 'date', 'time', 'purpose', 'duration_minutes', 'resource')
+EXPORT_FIELDS = ('id', 'name', 'email', 'date', 'time', 'purpose', 'created_at', 'duration_minutes', 'resource')
+
+# Invalid rows listed in an import report; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+def _file_format(path, file_format=None):
+    """Return 'csv' or 'jsonl' from the explicit format or the file extension."""
+    file_format = file_format or os.path.splitext(path)[1].lstrip('.').lower()
+    if file_format not in ('csv', 'jsonl'):
+        raise ValueError(f"Unsupported file format '{file_format}'; use csv or jsonl")
+    return file_format
+
+def read_records(path, file_format=None):
+    """Yield (line_number, record) from a CSV file with a header row or a JSONL file.
+
+    Records are dicts, except that a JSONL line that isn't valid JSON yields its
+    JSONDecodeError and one holding another JSON value yields that value; the
+    import reports both as invalid rows.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        if _file_format(path, file_format) == 'csv':
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+        else:
+            for line_number, line in enumerate(f, start=1):
+                if line.strip():
+                    try:
+                        yield line_number, json.loads(line)
+                    except json.JSONDecodeError as e:
+                        yield line_number, e
+
+def _text(value):
+    """Strip a field read from a file, treating missing values as empty."""
+    return "" if value is None else str(value).strip()
+
+def _prepare_batch(records):
+    """Validate and normalize a batch of (line_number, record) pairs.
+
+    Returns (rows, errors): rows ready for add_appointments, and (line_number, reason)
+    for every record that was rejected.
+    """
+    rows, errors = [], []
+    for line_number, record in records:
+        if isinstance(record, json.JSONDecodeError):
+            errors.append((line_number, f"malformed JSON ({record.msg})"))
+            continue
+        if not isinstance(record, dict):
+            errors.append((line_number, "not a JSON object"))
+            continue
+
+        name, email = _text(record.get('name')), _text(record.get('email'))
+        date, time = normalize_date(_text(record.get('date'))), normalize_time(_text(record.get('time')))
+        duration = _text(record.get('duration_minutes'))
+
+        if not name:
+            errors.append((line_number, "missing name"))
+        elif not is_valid_email(email):
+            errors.append((line_number, f"invalid email '{email}'"))
+        elif compute_starts_at(date, time) is None:
+            errors.append((line_number, f"unrecognized date/time '{date} {time}'"))
+        elif duration and not duration.isdigit():
+            errors.append((line_number, f"invalid duration '{duration}'"))
+        else:
+            rows.append((name, email, date, time, _text(record.get('purpose')) or "General appointment",
+                         int(duration) if duration else None, _text(record.get('resource')) or None))
+    return rows, errors
+
+def import_records(records, batch_size=IMPORT_BATCH_SIZE):
+    """Import (line_number, record) pairs in batched transactions.
+
+    Returns counts of rows read, added, skipped because their slot was taken, and
+    invalid, plus the first MAX_REPORTED_ERRORS validation errors.
+    """
+    report = {'read': 0, 'added': 0, 'skipped': 0, 'invalid': 0, 'errors': []}
+    batch = []
+
+    def flush():
+        rows, errors = _prepare_batch(batch)
+        added = add_appointments(rows) if rows else 0
+        report['read'] += len(batch)
+        report['added'] += added
+        report['skipped'] += len(rows) - added
+        report['invalid'] += len(errors)
+        report['errors'].extend(errors[:MAX_REPORTED_ERRORS - len(report['errors'])])
+        batch.clear()
+
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return report
+
+def import_file(path, file_format=None, batch_size=IMPORT_BATCH_SIZE):
+    """Import appointments from a CSV or JSONL file; see import_records for the report."""
+    return import_records(read_records(path, file_format), batch_size)
+
+def export_file(path, file_format=None, batch_size=EXPORT_BATCH_SIZE):
+    """Stream every appointment to a CSV or JSONL file in constant memory; returns the row count."""
+    file_format = _file_format(path, file_format)
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        if file_format == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(EXPORT_FIELDS)
+        for rows in iter_appointments(batch_size, EXPORT_FIELDS):
+            if file_format == 'csv':
+                writer.writerows(rows)
+            else:
+                f.write("".join(json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + "\n" for row in rows))
+            count += len(rows)
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import or export appointments as CSV or JSONL.")
+    parser.add_argument('command', choices=['import', 'export'])
+    parser.add_argument('path', help="file to read from or write to")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="file format (default: from the extension)")
+    parser.add_argument('--batch-size', type=int, help="rows per transaction (import) or cursor fetch (export)")
+    args = parser.parse_args()
+
+    ensure_db()
+    if args.command == 'import':
+        report = import_file(args.path, args.format, args.batch_size or IMPORT_BATCH_SIZE)
+        print(f"Read {report['read']} rows: {report['added']} added, {report['skipped']} skipped (slot taken), "
+              f"{report['invalid']} invalid.")
+        for line_number, reason in report['errors']:
+            print(f"  line {line_number}: {reason}")
+    else:
+        count = export_file(args.path, args.format, args.batch_size or EXPORT_BATCH_SIZE)
+        print(f"Exported {count} appointments to {args.path}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+from langchain.schema import BaseChatMessageHistory, messages_from_dict, messages_to_dict
+
+class SessionChatHistory(BaseChatMessageHistory):
+    """LangChain message history kept in a session's 'history' entry."""
+
+    def __init__(self, session):
+        self.session = session
+        self.session.setdefault('history', [])
+
+    @property
+    def messages(self):
+        return messages_from_dict(self.session['history'])
+
+    def add_message(self, message):
+        self.session['history'].append(messages_to_dict([message])[0])
+
+    def clear(self):
+        self.session['history'] = []
@@ -1,21 +1,212 @@
+import re
 import sqlite3
-import streamlit as st
+import calendar
+import threading
+from datetime import datetime, timezone
+from contextlib import contextmanager
 import os
+import logging
+from src.metrics import timed, span
+
+logger = logging.getLogger(__name__)
 
 # Define the database location and name
 DB_FOLDER = 'data'
 DB_NAME = 'booking_system.db'
 DB_PATH = os.path.join(DB_FOLDER, DB_NAME)
 
-def init_db():
-    """Initialize the SQLite database and create tables if they don't exist."""
-    # Create the data directory if it doesn't exist
-    if not os.path.exists(DB_FOLDER):
-        os.makedirs(DB_FOLDER)
-        
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+# Pragmas applied to every pooled connection
+BUSY_TIMEOUT_MS = 5000
+JOURNAL_MODE = 'WAL'
+SYNCHRONOUS = 'NORMAL'
+
+# Length assumed for appointments booked without an explicit duration
+DEFAULT_DURATION_MINUTES = 30
+
+# Resource booked when the caller doesn't name one; each resource holds one booking per slot
+DEFAULT_RESOURCE = 'default'
+
+# Formats accepted when deriving starts_at from the stored date and time text
+DATE_FORMATS = ['%Y-%m-%d', '%m/%d/%Y', '%m-%d-%Y', '%Y/%m/%d']
+TIME_FORMATS = ['%I:%M %p', '%I:%M%p', '%I %p', '%I%p', '%H:%M']
+
+# Columns of the appointments table, in the order Appointment takes them
+APPOINTMENT_COLUMNS = ('id', 'name', 'email', 'date', 'time', 'purpose', 'created_at', 'email_norm', 'name_norm',
+                       'starts_at', 'duration_minutes', 'resource')
+SELECT_APPOINTMENTS = f"SELECT {', '.join(APPOINTMENT_COLUMNS)} FROM appointments"
+
+# Full-text search: bm25 weights for the name, email and purpose columns, and the default result count
+SEARCH_WEIGHTS = (10.0, 5.0, 1.0)
+SEARCH_LIMIT = 20
+SEARCH_TERM_PATTERN = re.compile(r'\w+')
+
+# One reusable connection per (thread, database path)
+_pool = {}
+_pool_lock = threading.Lock()
+
+# Callbacks kept in sync with committed bookings (see add_change_listener)
+_change_listeners = []
+
+# Database paths already initialized by this process (see ensure_db)
+_initialized_paths = set()
+_init_lock = threading.Lock()
+
+class Appointment:
+    """One appointments row with attribute access.
+
+    id: int, name/email/date/time/purpose: str, created_at: str, email_norm and
+    name_norm: str, starts_at: int epoch or None, duration_minutes: int or None,
+    resource: str.
+    """
+    __slots__ = APPOINTMENT_COLUMNS
+
+    def __init__(self, id, name, email, date, time, purpose, created_at, email_norm, name_norm, starts_at,
+                 duration_minutes, resource):
+        self.id = id
+        self.name = name
+        self.email = email
+        self.date = date
+        self.time = time
+        self.purpose = purpose
+        self.created_at = created_at
+        self.email_norm = email_norm
+        self.name_norm = name_norm
+        self.starts_at = starts_at
+        self.duration_minutes = duration_minutes
+        self.resource = resource
+
+    @property
+    def cursor(self):
+        """Keyset position of this row in get_appointments order; pass it back as after."""
+        return (self.starts_at, self.id)
+
+    def __repr__(self):
+        return (f"Appointment(id={self.id}, name={self.name!r}, email={self.email!r}, date={self.date!r}, "
+                f"time={self.time!r}, purpose={self.purpose!r})")
+
+def _appointment_row(cursor, row):
+    """Row factory building an Appointment from a SELECT_APPOINTMENTS row."""
+    return Appointment(*row)
+
+def _query_appointments(conn, query, params=()):
+    """Execute a SELECT_APPOINTMENTS query whose rows come back as Appointment objects."""
+    cursor = conn.cursor()
+    cursor.row_factory = _appointment_row
+    return cursor.execute(query, params)
+
+def _open_connection(path):
+    """Open a new connection to the given database and apply the pool pragmas."""
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None, check_same_thread=False)
+    conn.execute(f"PRAGMA journal_mode={JOURNAL_MODE}")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA synchronous={SYNCHRONOUS}")
+    return conn
+
+def _prune_dead_threads():
+    """Close pooled connections owned by threads that have exited."""
+    alive = {t.ident for t in threading.enumerate()}
+    for key in [key for key in _pool if key[0] not in alive]:
+        _pool.pop(key).close()
+
+def get_connection():
+    """Return the calling thread's reusable connection to DB_PATH, opening it on first use."""
+    key = (threading.get_ident(), DB_PATH)
+    conn = _pool.get(key)
+    if conn is None:
+        conn = _open_connection(DB_PATH)
+        with _pool_lock:
+            _prune_dead_threads()
+            _pool[key] = conn
+    return conn
+
+def add_change_listener(callback):
+    """Register callback(event, starts_at, duration_minutes), called after appointments change.
+
+    event is 'add' or 'delete' for one appointment, or 'reload' when the day holding
+    starts_at changed in bulk and should be read again.
+    """
+    _change_listeners.append(callback)
+
+def _notify_change(event, starts_at, duration_minutes):
+    """Tell change listeners about a committed insert ('add'), delete ('delete') or bulk change ('reload')."""
+    if starts_at is None:
+        return
+    for callback in _change_listeners:
+        callback(event, starts_at, duration_minutes)
+
+def close_connections():
+    """Close every pooled connection, e.g. on shutdown or before deleting the database file."""
+    with _pool_lock:
+        for conn in _pool.values():
+            conn.close()
+        _pool.clear()
+
+@contextmanager
+def transaction(immediate=False):
+    """Run a block inside a transaction on the thread's pooled connection.
+
+    Commits on success and rolls back on error. Pass immediate=True for writes so the
+    write lock is taken up front instead of failing on a lock upgrade. Nested calls
+    join the outer transaction.
+    """
+    conn = get_connection()
+    if conn.in_transaction:
+        yield conn
+        return
+
+    if immediate:
+        # Time spent here is waiting on other writers for the database lock
+        with span("db.lock_wait"):
+            conn.execute("BEGIN IMMEDIATE")
+    else:
+        conn.execute("BEGIN")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+def normalize_email(email):
+    """Normalize an email address for indexed lookups."""
+    return email.strip().lower() if email else email
+
+def normalize_name(name):
+    """Normalize a person's name for indexed lookups."""
+    return " ".join(name.split()).casefold() if name else name
+
+def to_epoch(value):
+    """Convert a datetime (wall-clock, no timezone) or epoch integer to epoch seconds."""
+    if isinstance(value, datetime):
+        return calendar.timegm(value.timetuple())
+    return int(value)
+
+def from_epoch(value):
+    """Convert epoch seconds back to a wall-clock datetime without timezone."""
+    return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+
+def compute_starts_at(date, time):
+    """Derive the sortable starts_at epoch from stored date and time text, or None if unparseable."""
+    if not date or not time:
+        return None
     
+    time = time.strip().upper()
+    for date_fmt in DATE_FORMATS:
+        try:
+            day = datetime.strptime(date.strip(), date_fmt)
+        except ValueError:
+            continue
+        for time_fmt in TIME_FORMATS:
+            try:
+                clock = datetime.strptime(time, time_fmt)
+            except ValueError:
+                continue
+            return to_epoch(day.replace(hour=clock.hour, minute=clock.minute))
+        return None
+    return None
+
+def _create_appointments_table(c):
+    """Schema v1: the appointments table, including the email column added after launch."""
     c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='appointments'")
     table_exists = c.fetchone()
     
@@ -23,9 +214,8 @@ def init_db():
         try:
             c.execute("SELECT email FROM appointments LIMIT 1")
         except sqlite3.OperationalError:
-            st.write("Adding email column to existing database...")
+            logger.info("Adding email column to existing database...")
             c.execute("ALTER TABLE appointments ADD COLUMN email TEXT DEFAULT 'no-email@example.com'")
-            conn.commit()
     else:
         c.execute('''
         CREATE TABLE appointments
@@ -37,76 +227,446 @@ def init_db():
          purpose TEXT,
          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)
         ''')
-        conn.commit()
+
+def _add_normalized_lookup_columns(c):
+    """Schema v2: normalized email/name columns with indexes for exact-match lookups."""
+    c.execute("ALTER TABLE appointments ADD COLUMN email_norm TEXT")
+    c.execute("ALTER TABLE appointments ADD COLUMN name_norm TEXT")
+    c.connection.create_function("normalize_email", 1, normalize_email, deterministic=True)
+    c.connection.create_function("normalize_name", 1, normalize_name, deterministic=True)
+    c.execute("UPDATE appointments SET email_norm = normalize_email(email), name_norm = normalize_name(name)")
+    c.execute("CREATE INDEX idx_appointments_email_norm ON appointments (email_norm, date, time)")
+    c.execute("CREATE INDEX idx_appointments_name_norm ON appointments (name_norm, date, time)")
+
+def _add_starts_at_column(c):
+    """Schema v3: integer starts_at epoch and optional duration, indexed for range scans."""
+    c.execute("ALTER TABLE appointments ADD COLUMN starts_at INTEGER")
+    c.execute("ALTER TABLE appointments ADD COLUMN duration_minutes INTEGER")
+    c.connection.create_function("compute_starts_at", 2, compute_starts_at, deterministic=True)
+    c.execute("UPDATE appointments SET starts_at = compute_starts_at(date, time)")
+    c.execute("CREATE INDEX idx_appointments_starts_at ON appointments (starts_at)")
+    c.execute("CREATE INDEX idx_appointments_email_starts_at ON appointments (email_norm, starts_at)")
+
+def _add_slot_uniqueness(c):
+    """Schema v4: resource column and unique per-resource and per-person slot indexes."""
+    c.execute(f"ALTER TABLE appointments ADD COLUMN resource TEXT NOT NULL DEFAULT '{DEFAULT_RESOURCE}'")
+    # Earlier versions allowed double-booking; keep the first booking on each slot scheduled
+    c.execute('''
+    UPDATE appointments SET starts_at = NULL
+    WHERE EXISTS (SELECT 1 FROM appointments AS earlier
+                  WHERE earlier.starts_at = appointments.starts_at
+                  AND earlier.id < appointments.id
+                  AND (earlier.resource = appointments.resource OR earlier.email_norm = appointments.email_norm))
+    ''')
+    c.execute("CREATE UNIQUE INDEX idx_appointments_resource_slot ON appointments (resource, starts_at) "
+              "WHERE starts_at IS NOT NULL")
+    c.execute("CREATE UNIQUE INDEX idx_appointments_person_slot ON appointments (email_norm, starts_at) "
+              "WHERE starts_at IS NOT NULL")
+
+def _create_sessions_table(c):
+    """Schema v5: serialized chat session state shared by worker processes."""
+    c.execute('''
+    CREATE TABLE sessions
+    (id TEXT PRIMARY KEY,
+     state TEXT NOT NULL,
+     updated_at REAL NOT NULL)
+    ''')
+    c.execute("CREATE INDEX idx_sessions_updated_at ON sessions (updated_at)")
+
+def _create_chat_messages_table(c):
+    """Schema v6: chat messages spilled out of long sessions' in-memory transcripts."""
+    c.execute('''
+    CREATE TABLE chat_messages
+    (session_id TEXT NOT NULL,
+     seq INTEGER NOT NULL,
+     role TEXT NOT NULL,
+     content TEXT NOT NULL,
+     spilled_at REAL NOT NULL,
+     PRIMARY KEY (session_id, seq))
+    ''')
+
+def _create_search_index(c):
+    """Schema v7: FTS5 index over name, email and purpose, kept in sync by triggers."""
+    # External content: the index stores only tokens and reads column values from appointments
+    c.execute("CREATE VIRTUAL TABLE appointments_fts USING fts5(name, email, purpose, content='appointments', "
+              "content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+    c.execute(f"INSERT INTO appointments_fts (appointments_fts, rank) VALUES ('rank', 'bm25({', '.join(map(str, SEARCH_WEIGHTS))})')")
+    c.execute("INSERT INTO appointments_fts (appointments_fts) VALUES ('rebuild')")
+    c.execute('''
+    CREATE TRIGGER appointments_fts_insert AFTER INSERT ON appointments BEGIN
+        INSERT INTO appointments_fts (rowid, name, email, purpose) VALUES (new.id, new.name, new.email, new.purpose);
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER appointments_fts_delete AFTER DELETE ON appointments BEGIN
+        INSERT INTO appointments_fts (appointments_fts, rowid, name, email, purpose)
+        VALUES ('delete', old.id, old.name, old.email, old.purpose);
+    END
+    ''')
+    # Reschedules only touch date and time, so they leave the index alone
+    c.execute('''
+    CREATE TRIGGER appointments_fts_update AFTER UPDATE OF name, email, purpose ON appointments BEGIN
+        INSERT INTO appointments_fts (appointments_fts, rowid, name, email, purpose)
+        VALUES ('delete', old.id, old.name, old.email, old.purpose);
+        INSERT INTO appointments_fts (rowid, name, email, purpose) VALUES (new.id, new.name, new.email, new.purpose);
+    END
+    ''')
+
+def _create_reminder_tables(c):
+    """Schema v8: reminder scheduler high-water marks and per-appointment delivery bookkeeping."""
+    c.execute('''
+    CREATE TABLE scheduler_state
+    (name TEXT PRIMARY KEY,
+     starts_at INTEGER NOT NULL,
+     appointment_id INTEGER NOT NULL)
+    ''')
+    # Keyed by start time too, so a rescheduled appointment gets a reminder for its new slot
+    c.execute('''
+    CREATE TABLE reminder_deliveries
+    (appointment_id INTEGER NOT NULL,
+     starts_at INTEGER NOT NULL,
+     status TEXT NOT NULL DEFAULT 'pending',
+     attempts INTEGER NOT NULL DEFAULT 0,
+     last_error TEXT,
+     updated_at REAL NOT NULL,
+     PRIMARY KEY (appointment_id, starts_at))
+    ''')
+    c.execute("CREATE INDEX idx_reminder_deliveries_pending ON reminder_deliveries (starts_at, appointment_id) "
+              "WHERE status = 'pending'")
+
+def _add_session_versions(c):
+    """Schema v9: per-session version numbers, so concurrent saves of one session can be detected."""
+    c.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+# Ordered schema migrations; PRAGMA user_version records how many have been applied
+MIGRATIONS = [
+    _create_appointments_table,
+    _add_normalized_lookup_columns,
+    _add_starts_at_column,
+    _add_slot_uniqueness,
+    _create_sessions_table,
+    _create_chat_messages_table,
+    _create_search_index,
+    _create_reminder_tables,
+    _add_session_versions,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+@timed("db.init_db")
+def init_db():
+    """Initialize the SQLite database and apply any pending schema migrations."""
+    # Create the data directory if it doesn't exist
+    if not os.path.exists(DB_FOLDER):
+        os.makedirs(DB_FOLDER)
+        
+    with transaction(immediate=True) as conn:
+        c = conn.cursor()
+        version = c.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(c)
+            c.execute(f"PRAGMA user_version = {number}")
+
+def ensure_db():
+    """Run init_db once per process for the current DB_PATH; later calls are a set lookup."""
+    if DB_PATH in _initialized_paths:
+        return
+    with _init_lock:
+        if DB_PATH not in _initialized_paths:
+            init_db()
+            _initialized_paths.add(DB_PATH)
+
+@timed("db.add_appointment")
+def add_appointment(name, email, date, time, purpose, duration_minutes=None):
+    """Add a new appointment to the database and return its ID."""
+    starts_at = compute_starts_at(date, time)
+    with transaction(immediate=True) as conn:
+        c = conn.execute("INSERT INTO appointments (name, email, date, time, purpose, email_norm, name_norm, "
+                         "starts_at, duration_minutes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (name, email, date, time, purpose, normalize_email(email), normalize_name(name),
+                          starts_at, duration_minutes))
+    _notify_change('add', starts_at, duration_minutes)
+    return c.lastrowid
+
+@timed("db.add_appointments")
+def add_appointments(rows):
+    """Insert many appointments in one write transaction and return how many were added.
+
+    rows are (name, email, date, time, purpose, duration_minutes, resource) tuples with
+    date and time already normalized. Rows whose slot is already taken are skipped.
+    """
+    prepared = [(name, email, date, time, purpose, normalize_email(email), normalize_name(name),
+                 compute_starts_at(date, time), duration_minutes, resource or DEFAULT_RESOURCE)
+                for name, email, date, time, purpose, duration_minutes, resource in rows]
     
-    conn.close()
+    with transaction(immediate=True) as conn:
+        # rowcount, unlike total_changes, leaves out the search index rows the triggers write
+        c = conn.executemany("INSERT INTO appointments (name, email, date, time, purpose, email_norm, name_norm, "
+                             "starts_at, duration_minutes, resource) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                             "ON CONFLICT DO NOTHING", prepared)
+        added = c.rowcount
+    
+    for day_start in {row[7] - row[7] % 86400 for row in prepared if row[7] is not None}:
+        _notify_change('reload', day_start, None)
+    return added
 
-def add_appointment(name, email, date, time, purpose):
-    """Add a new appointment to the database."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT INTO appointments (name, email, date, time, purpose) VALUES (?, ?, ?, ?, ?)",
-              (name, email, date, time, purpose))
-    conn.commit()
-    conn.close()
+def iter_appointments(batch_size=1000, columns=APPOINTMENT_COLUMNS):
+    """Yield every appointment, ordered by ID, in lists of up to batch_size rows.
+
+    The rows are read through one cursor on a dedicated connection, so memory use
+    stays constant however large the table is and the pooled connection stays free.
+    """
+    conn = _open_connection(DB_PATH)
+    try:
+        cursor = conn.execute(f"SELECT {', '.join(columns)} FROM appointments ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
 
-def get_appointments(name=None, email=None, date=None):
-    """Retrieve appointments based on filters."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+def _like_pattern(value):
+    """Build a LIKE pattern that matches value as a literal substring."""
+    escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+@timed("db.reserve_slot")
+def reserve_slot(name, email, date, time, purpose, duration_minutes=None, resource=DEFAULT_RESOURCE):
+    """Atomically book a slot unless it is already taken.
+
+    Returns (appointment_id, None) on success, or (None, conflicting_row) when the
+    resource or the person already has a booking at that time. The unique slot
+    indexes decide the conflict inside a single write transaction, so concurrent
+    sessions cannot double-book.
+    """
+    email_norm = normalize_email(email)
+    starts_at = compute_starts_at(date, time)
     
-    query = "SELECT * FROM appointments"
+    appointment_id, conflict = None, None
+    with transaction(immediate=True) as conn:
+        if starts_at is None:
+            # Unparseable times can't use the slot indexes; the write lock still makes this check safe
+            conflict = _query_appointments(conn, f"{SELECT_APPOINTMENTS} WHERE email_norm = ? AND date = ? AND time = ?",
+                                           (email_norm, date, time)).fetchone()
+            if conflict:
+                return None, conflict
+        
+        c = conn.execute("INSERT INTO appointments (name, email, date, time, purpose, email_norm, name_norm, "
+                         "starts_at, duration_minutes, resource) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                         "ON CONFLICT DO NOTHING",
+                         (name, email, date, time, purpose, email_norm, normalize_name(name),
+                          starts_at, duration_minutes, resource))
+        if c.rowcount:
+            appointment_id = c.lastrowid
+        else:
+            conflict = _query_appointments(conn, f"{SELECT_APPOINTMENTS} WHERE starts_at = ? AND (resource = ? OR email_norm = ?) "
+                                           "ORDER BY email_norm = ? DESC LIMIT 1",
+                                           (starts_at, resource, email_norm, email_norm)).fetchone()
+    
+    if appointment_id:
+        _notify_change('add', starts_at, duration_minutes)
+    return appointment_id, conflict
+
+@timed("db.get_appointments")
+def get_appointments(name=None, email=None, date=None, substring=False, limit=None, after=None):
+    """Retrieve appointments based on filters, ordered by start time.
+
+    Name and email match exactly (case-insensitively) through the normalized lookup
+    indexes. Pass substring=True to opt into a slower partial-match scan instead.
+    For keyset pagination pass limit, and the cursor of the last row already seen
+    as after; the next page then starts right behind it without an OFFSET scan.
+    """
+    query = SELECT_APPOINTMENTS
     params = []
     
     conditions = []
     if name:
-        conditions.append("LOWER(name) LIKE LOWER(?)")
-        params.append(f"%{name}%")
+        if substring:
+            conditions.append("name_norm LIKE ? ESCAPE '\\'")
+            params.append(_like_pattern(normalize_name(name)))
+        else:
+            conditions.append("name_norm = ?")
+            params.append(normalize_name(name))
     if email:
-        conditions.append("LOWER(email) LIKE LOWER(?)")
-        params.append(f"%{email}%")
+        if substring:
+            conditions.append("email_norm LIKE ? ESCAPE '\\'")
+            params.append(_like_pattern(normalize_email(email)))
+        else:
+            conditions.append("email_norm = ?")
+            params.append(normalize_email(email))
     if date:
         conditions.append("date = ?")
         params.append(date)
+    if after:
+        # Rows without a start time sort first
+        after_starts_at, after_id = after
+        if after_starts_at is None:
+            conditions.append("(starts_at IS NOT NULL OR id > ?)")
+            params.append(after_id)
+        else:
+            conditions.append("starts_at >= ? AND (starts_at > ? OR id > ?)")
+            params.extend([after_starts_at, after_starts_at, after_id])
     
     if conditions:
         query += " WHERE " + " AND ".join(conditions)
     
-    query += " ORDER BY date, time"
+    query += " ORDER BY starts_at, id"
     
-    c.execute(query, params)
-    appointments = c.fetchall()
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
     
-    conn.close()
-    return appointments
+    with transaction() as conn:
+        return _query_appointments(conn, query, params).fetchall()
 
-def check_appointment_exists(name, email, date, time):
-    """Check if an appointment with the given details exists."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+@timed("db.get_appointment")
+def get_appointment(id):
+    """Retrieve a single appointment by its ID, or None."""
+    with transaction() as conn:
+        return _query_appointments(conn, f"{SELECT_APPOINTMENTS} WHERE id = ?", (id,)).fetchone()
+
+@timed("db.get_appointments_between")
+def get_appointments_between(start, end, email=None, limit=None):
+    """Retrieve appointments starting in [start, end), ordered by start time.
+
+    start and end may be datetimes or epoch seconds; the lookup is an index range
+    scan on starts_at, optionally narrowed to one email.
+    """
+    query = f"{SELECT_APPOINTMENTS} WHERE starts_at >= ? AND starts_at < ?"
+    params = [to_epoch(start), to_epoch(end)]
+    
+    if email:
+        query += " AND email_norm = ?"
+        params.append(normalize_email(email))
+    
+    query += " ORDER BY starts_at"
+    
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
     
-    c.execute("SELECT * FROM appointments WHERE name = ? AND email = ? AND date = ? AND time = ?", 
-            (name, email, date, time))
-    result = c.fetchone()
+    with transaction() as conn:
+        return _query_appointments(conn, query, params).fetchall()
+
+def _search_expression(query):
+    """Turn free text into an FTS5 query, or None if it has no words.
+
+    Every word must match whole except the last, which may also match as a prefix
+    (from two characters), so results narrow as the user types. Quoting keeps FTS5
+    operators in user text literal.
+    """
+    terms = SEARCH_TERM_PATTERN.findall(query)
+    if not terms:
+        return None
+    
+    phrases = [f'"{term}"' for term in terms]
+    # A whole-word match of the last word also matches the prefix, so it scores twice and ranks first
+    if len(terms[-1]) >= 2:
+        phrases[-1] = f'({phrases[-1]} OR {phrases[-1]}*)'
+    return " AND ".join(phrases)
+
+@timed("db.search_appointments")
+def search_appointments(query, limit=SEARCH_LIMIT, email=None):
+    """Full-text search appointments by name, email and purpose, best matches first.
+
+    Words match whole, and the last one also as a prefix, so "follow-up" and
+    "dent" both find a "Dental follow-up". Name matches outrank email matches, which
+    outrank purpose matches (see SEARCH_WEIGHTS). With email, only that person's
+    appointments are searched.
+    """
+    expression = _search_expression(query)
+    if expression is None:
+        return []
     
-    conn.close()
+    with transaction() as conn:
+        if email is None:
+            return _query_appointments(conn, f"{SELECT_APPOINTMENTS} JOIN (SELECT rowid AS hit_id, rank FROM appointments_fts "
+                                             "WHERE appointments_fts MATCH ? ORDER BY rank LIMIT ?) AS hits "
+                                             "ON hits.hit_id = appointments.id ORDER BY hits.rank, starts_at",
+                                       (expression, limit)).fetchall()
+        # Filter before limiting, so other people's better matches don't crowd this person's out
+        return _query_appointments(conn, f"{SELECT_APPOINTMENTS} JOIN (SELECT rowid AS hit_id, rank FROM appointments_fts "
+                                         "WHERE appointments_fts MATCH ?) AS hits ON hits.hit_id = appointments.id "
+                                         "WHERE email_norm = ? ORDER BY hits.rank, starts_at LIMIT ?",
+                                   (expression, normalize_email(email), limit)).fetchall()
+
+@timed("db.check_appointment_exists")
+def check_appointment_exists(name, email, date, time):
+    """Check if an appointment with the given details exists."""
+    with transaction() as conn:
+        result = conn.execute("SELECT 1 FROM appointments WHERE email_norm = ? AND date = ? AND time = ? AND name = ?",
+                              (normalize_email(email), date, time, name)).fetchone()
     return result is not None
 
+@timed("db.delete_appointment")
 def delete_appointment(id):
     """Delete an appointment by its ID."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM appointments WHERE id = ?", (id,))
-    rows_affected = conn.total_changes
-    conn.commit()
-    conn.close()
-    return rows_affected > 0
+    with transaction(immediate=True) as conn:
+        slot = conn.execute("SELECT starts_at, duration_minutes FROM appointments WHERE id = ?", (id,)).fetchone()
+        c = conn.execute("DELETE FROM appointments WHERE id = ?", (id,))
+    if c.rowcount > 0:
+        _notify_change('delete', *slot)
+    return c.rowcount > 0
+
+@timed("db.cancel_by_id")
+def cancel_by_id(id, email):
+    """Delete an appointment if it belongs to email, in one transaction.
+
+    Returns the deleted Appointment, or None when email has no appointment with that ID.
+    """
+    with transaction(immediate=True) as conn:
+        appointment = _query_appointments(conn, f"{SELECT_APPOINTMENTS} WHERE id = ? AND email_norm = ?",
+                                          (id, normalize_email(email))).fetchone()
+        if appointment is None:
+            return None
+        c = conn.execute("DELETE FROM appointments WHERE id = ?", (id,))
+    if not c.rowcount:
+        return None
+    _notify_change('delete', appointment.starts_at, appointment.duration_minutes)
+    return appointment
+
+@timed("db.reschedule_appointment")
+def reschedule_appointment(id, email, date, time, resource=None):
+    """Move an appointment that belongs to email to a new date and time in one transaction.
+
+    Returns (moved_appointment, None), (None, conflicting_row) when the new slot is
+    taken, or (None, None) when email has no appointment with that ID. The booking
+    keeps its resource unless another one is given.
+    """
+    email_norm = normalize_email(email)
+    starts_at = compute_starts_at(date, time)
+    
+    with transaction(immediate=True) as conn:
+        old = _query_appointments(conn, f"{SELECT_APPOINTMENTS} WHERE id = ? AND email_norm = ?",
+                                  (id, email_norm)).fetchone()
+        if old is None:
+            return None, None
+        
+        if starts_at is None:
+            # Unparseable times can't use the slot indexes; the write lock still makes this check safe
+            conflict = _query_appointments(conn, f"{SELECT_APPOINTMENTS} WHERE email_norm = ? AND date = ? AND time = ? "
+                                           "AND id != ?", (email_norm, date, time, id)).fetchone()
+            if conflict:
+                return None, conflict
+        
+        resource = resource or old.resource
+        c = conn.execute("UPDATE OR IGNORE appointments SET date = ?, time = ?, starts_at = ?, resource = ? WHERE id = ?",
+                         (date, time, starts_at, resource, id))
+        if not c.rowcount:
+            conflict = _query_appointments(conn, f"{SELECT_APPOINTMENTS} WHERE starts_at = ? AND id != ? "
+                                           "AND (resource = ? OR email_norm = ?) ORDER BY email_norm = ? DESC LIMIT 1",
+                                           (starts_at, id, resource, email_norm, email_norm)).fetchone()
+            return None, conflict
+        moved = _query_appointments(conn, f"{SELECT_APPOINTMENTS} WHERE id = ?", (id,)).fetchone()
+    
+    _notify_change('delete', old.starts_at, old.duration_minutes)
+    _notify_change('add', moved.starts_at, moved.duration_minutes)
+    return moved, None
 
+@timed("db.get_table_structure")
 def get_table_structure():
     """Get the column names of the appointments table."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("PRAGMA table_info(appointments)")
-    columns = c.fetchall()
-    conn.close()
-    return [col[1] for col in columns]
\ No newline at end of file
+    with transaction() as conn:
+        columns = conn.execute("PRAGMA table_info(appointments)").fetchall()
+    return [col[1] for col in columns]
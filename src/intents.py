@@ -0,0 +1,95 @@
+import re
+import threading
+from datetime import datetime
+
+EMAIL_PATTERN = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
+DATE_PATTERN = r'\d{4}-\d{1,2}-\d{1,2}|\d{1,2}/\d{1,2}/\d{4}'
+DATE_FORMATS = ['%Y-%m-%d', '%m/%d/%Y']
+
+# Phrases that ask to see existing appointments anywhere in a message
+RETRIEVAL_PHRASES = ["retrieve", "check appointment", "my appointment", "show appointment",
+                     "view appointment", "get appointment", "find appointment", "look up",
+                     "lookup", "get info", "find info", "check info", "appointment info"]
+
+# Action verbs that make a message containing a retrieval phrase a request for the LLM instead
+ACTION_VERB_PATTERN = re.compile(r'\b(?:reschedul(?:e|ing)|mov(?:e|ing)|cancel(?:l?ing)?|book)\b', re.IGNORECASE)
+
+# Words that make a "search for ..." message an availability question for the LLM instead
+AVAILABILITY_PATTERN = re.compile(r'\b(?:slots?|openings?|availab(?:le|ility)|free|times?|next\s+week|tomorrow|today)\b',
+                                  re.IGNORECASE)
+
+# One combined pattern, compiled once. Whole-message commands are anchored so they
+# win at position 0; retrieval phrases may match anywhere in the message.
+INTENT_PATTERN = re.compile(
+    r'^\s*(?:please\s+)?cancel\s+(?:my\s+)?(?:appointment\s*)?(?:id\s*)?#?\s*(?P<cancel_id>\d+)\s*[.!]?\s*$'
+    r'|^\s*(?:please\s+)?(?:reschedule|move)\s+(?:my\s+)?(?:appointment\s*)?(?:id\s*)?#?\s*(?P<reschedule_id>\d+)\s+to\s+'
+    r'(?P<reschedule_date>.+?)\s+at\s+(?P<reschedule_time>[^.!]+?)\s*[.!]?\s*$'
+    r'|^\s*(?:show|list|view|get|check|find)\s+(?:me\s+)?(?:my\s+)?appointments?\s+'
+    rf'(?:for\s+(?P<date_email>{EMAIL_PATTERN})\s+)?on\s+(?P<date>{DATE_PATTERN})\s*[.!?]?\s*$'
+    rf'|^\s*(?P<bare_email>{EMAIL_PATTERN})\s*[.!]?\s*$'
+    r'|^\s*(?:please\s+)?(?:search\s+(?:for\s+)?(?:(?:appointments?|bookings?)\s+(?:for|about|with|matching|mentioning)\s+)?'
+    r'|(?:find|look\s*up)\s+(?:all\s+)?(?:appointments?|bookings?)\s+(?:about|with|matching|mentioning)\s+)'
+    r'(?P<search>.+?)\s*[.!?]?\s*$'
+    r'|^\s*(?:please\s+)?(?P<show_more>(?:(?:show|see|list|load)\s+(?:me\s+)?)?more(?:\s+appointments)?)\s*(?:please\s*)?[.!?]?\s*$'
+    r'|(?P<retrieve>' + '|'.join(re.escape(phrase) for phrase in RETRIEVAL_PHRASES) + r')',
+    re.IGNORECASE
+)
+
+# Turns seen by the router and how many it answered without the LLM
+_stats = {'turns': 0, 'handled': 0}
+_stats_lock = threading.Lock()
+
+def _normalize_date(date_str):
+    """Convert an ISO or m/d/Y date to YYYY-MM-DD, or None if it isn't a real date."""
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(date_str, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return None
+
+def route_intent(user_input):
+    """Classify a message as a deterministic command.
+
+    Returns (intent, params) for 'cancel_by_id', 'reschedule', 'retrieve_by_date',
+    'bare_email', 'search', 'show_more' and 'retrieve', or None when the message needs the LLM.
+    Reschedule dates and times are returned as written.
+    """
+    match = INTENT_PATTERN.search(user_input)
+    if not match:
+        return None
+
+    if match.group('cancel_id'):
+        return 'cancel_by_id', {'id': int(match.group('cancel_id'))}
+    if match.group('reschedule_id'):
+        return 'reschedule', {'id': int(match.group('reschedule_id')), 'date': match.group('reschedule_date'),
+                              'time': match.group('reschedule_time')}
+    if match.group('date'):
+        date = _normalize_date(match.group('date'))
+        if date is None:
+            return 'retrieve', {}
+        return 'retrieve_by_date', {'date': date, 'email': match.group('date_email')}
+    if match.group('bare_email'):
+        return 'bare_email', {'email': match.group('bare_email')}
+    if match.group('search'):
+        if AVAILABILITY_PATTERN.search(match.group('search')):
+            return None
+        return 'search', {'query': match.group('search')}
+    if match.group('show_more'):
+        return 'show_more', {}
+    # "I want to reschedule my appointment" mentions an appointment but asks for an action
+    if ACTION_VERB_PATTERN.search(user_input):
+        return None
+    return 'retrieve', {}
+
+def record_turn(handled):
+    """Count a turn, and whether the router answered it without the LLM."""
+    with _stats_lock:
+        _stats['turns'] += 1
+        if handled:
+            _stats['handled'] += 1
+
+def router_stats():
+    """Return a snapshot of the router's turn counters."""
+    with _stats_lock:
+        return dict(_stats)
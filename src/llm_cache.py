@@ -0,0 +1,122 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from langchain.schema.cache import BaseCache
+from langchain.load import dumps, loads
+
+# Default location and limits for the local response cache
+CACHE_PATH = os.path.join('data', 'llm_cache.db')
+CACHE_MAX_BYTES = 20 * 1024 * 1024
+CACHE_TTL_SECONDS = 24 * 3600
+
+# Prompts or replies carrying personal data are never cached
+PII_PATTERN = re.compile(r'<APPOINTMENT_DETAILS>|[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+
+def cache_key(prompt, llm_string):
+    """Hash the model settings and a whitespace- and case-normalized prompt into a cache key."""
+    normalized = " ".join(prompt.split()).casefold()
+    return hashlib.sha256(f"{llm_string}\x00{normalized}".encode('utf-8')).hexdigest()
+
+class SQLiteLLMCache(BaseCache):
+    """LangChain response cache stored in a local SQLite file.
+
+    Entries expire after ttl_seconds, and the least recently used entries are
+    evicted once the stored replies exceed max_bytes. Turns that mention an email
+    address or an <APPOINTMENT_DETAILS> block bypass the cache entirely.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES, ttl_seconds=CACHE_TTL_SECONDS):
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''
+        CREATE TABLE IF NOT EXISTS llm_cache
+        (key TEXT PRIMARY KEY,
+         value TEXT NOT NULL,
+         size INTEGER NOT NULL,
+         created_at REAL NOT NULL,
+         last_used REAL NOT NULL)
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used)")
+
+    def lookup(self, prompt, llm_string):
+        """Return the cached generations for this prompt, or None."""
+        if PII_PATTERN.search(prompt):
+            with self._lock:
+                self.bypassed += 1
+            return None
+
+        key = cache_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] <= self.ttl_seconds:
+                self._conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+                self.hits += 1
+                return [loads(generation) for generation in json.loads(row[0])]
+
+            if row:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+
+    def update(self, prompt, llm_string, return_val):
+        """Store a reply unless it carries personal data, then evict down to the size limit."""
+        if PII_PATTERN.search(prompt) or any(PII_PATTERN.search(generation.text) for generation in return_val):
+            return
+
+        value = json.dumps([dumps(generation) for generation in return_val])
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("INSERT OR REPLACE INTO llm_cache (key, value, size, created_at, last_used) "
+                                   "VALUES (?, ?, ?, ?, ?)",
+                                   (cache_key(prompt, llm_string), value, len(value), now, now))
+                self._evict(now)
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+
+    def _evict(self, now):
+        """Drop expired entries, then least recently used ones until under max_bytes."""
+        self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        excess = total - self.max_bytes
+        freed = 0
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM llm_cache ORDER BY last_used"):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", victims)
+
+    def clear(self, **kwargs):
+        """Remove every cached reply."""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+
+    def stats(self):
+        """Return hit/miss/bypass counters and current size of the cache."""
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            return {'hits': self.hits, 'misses': self.misses, 'bypassed': self.bypassed,
+                    'entries': entries, 'bytes': size}
@@ -0,0 +1,223 @@
+import random
+import asyncio
+import threading
+import time
+from typing import Any
+from langchain.load import dumps
+from langchain.schema import ChatResult, ChatGeneration
+from langchain.chat_models.base import BaseChatModel
+
+# Default limits for calls to the LLM provider
+RATE_PER_SECOND = 5.0
+BURST = 10
+MAX_CONCURRENCY = 8
+MAX_RETRIES = 4
+BASE_DELAY_SECONDS = 0.5
+MAX_DELAY_SECONDS = 8.0
+CALL_TIMEOUT_SECONDS = 30.0
+
+# Provider errors worth retrying (quota, overload, transient server errors)
+RETRYABLE_ERRORS = {'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable', 'DeadlineExceeded',
+                    'InternalServerError', 'TimeoutError'}
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class LLMGatewayError(Exception):
+    """Raised when a transient LLM failure persists through all retries, or a call misses its deadline.
+
+    Errors that are not worth retrying are re-raised unchanged.
+    """
+
+def is_retryable(error):
+    """Whether an exception from the provider is transient and worth retrying."""
+    if type(error).__name__ in RETRYABLE_ERRORS or isinstance(error, asyncio.TimeoutError):
+        return True
+    code = getattr(error, 'code', None) or getattr(error, 'status_code', None)
+    return code in RETRYABLE_STATUS_CODES
+
+class TokenBucket:
+    """Async token-bucket rate limiter."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class LLMGateway:
+    """Async front door for a LangChain chat model.
+
+    Calls are rate limited by a token bucket, capped in concurrency, retried with
+    exponential backoff and full jitter, bounded by a per-call deadline, and
+    identical in-flight requests share one provider call. Synchronous callers go
+    through invoke(), which runs the call on the gateway's own event loop thread.
+    """
+
+    def __init__(self, llm, rate_per_second=RATE_PER_SECOND, burst=BURST, max_concurrency=MAX_CONCURRENCY,
+                 max_retries=MAX_RETRIES, base_delay=BASE_DELAY_SECONDS, max_delay=MAX_DELAY_SECONDS,
+                 timeout=CALL_TIMEOUT_SECONDS):
+        self.llm = llm
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._in_flight = {}
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {'calls': 0, 'acquires': 0, 'coalesced': 0, 'retries': 0, 'failures': 0, 'queue_depth': 0,
+                         'max_queue_depth': 0, 'wait_seconds_total': 0.0, 'wait_seconds_max': 0.0}
+
+    def _get_loop(self):
+        """Start the gateway's event loop thread on first use; all limiter state lives on it."""
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-gateway", daemon=True).start()
+                self._bucket = asyncio.run_coroutine_threadsafe(self._make_limiters(), loop).result()
+                self._loop = loop
+            return self._loop
+
+    async def _make_limiters(self):
+        """Create the limiter primitives on the gateway loop."""
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return TokenBucket(self.rate_per_second, self.burst)
+
+    def _record(self, **changes):
+        """Update metric counters."""
+        with self._metrics_lock:
+            for key, value in changes.items():
+                self._metrics[key] += value
+            self._metrics['max_queue_depth'] = max(self._metrics['max_queue_depth'], self._metrics['queue_depth'])
+
+    def metrics(self):
+        """Return a snapshot of call, retry, coalescing, queue depth and wait-time metrics."""
+        with self._metrics_lock:
+            snapshot = dict(self._metrics)
+        snapshot['wait_seconds_avg'] = snapshot['wait_seconds_total'] / snapshot['acquires'] if snapshot['acquires'] else 0.0
+        return snapshot
+
+    async def acquire(self):
+        """Wait for a rate-limit token and a concurrency slot; returns the time spent waiting."""
+        started = time.monotonic()
+        self._record(queue_depth=1)
+        try:
+            await self._bucket.acquire()
+            await self._semaphore.acquire()
+        finally:
+            self._record(queue_depth=-1)
+        waited = time.monotonic() - started
+        with self._metrics_lock:
+            self._metrics['acquires'] += 1
+            self._metrics['wait_seconds_total'] += waited
+            self._metrics['wait_seconds_max'] = max(self._metrics['wait_seconds_max'], waited)
+        return waited
+
+    def release(self):
+        """Give back a concurrency slot taken by acquire()."""
+        self._semaphore.release()
+
+    async def _call(self, messages, kwargs):
+        """One provider call with retries, each attempt holding a rate token and a slot."""
+        for attempt in range(self.max_retries + 1):
+            await self.acquire()
+            try:
+                return await asyncio.wait_for(self.llm.ainvoke(messages, **kwargs), self.timeout)
+            except Exception as e:
+                if not is_retryable(e):
+                    # Bad requests, invalid keys and the like are not load; let them surface as they are
+                    self._record(failures=1)
+                    raise
+                if attempt == self.max_retries:
+                    self._record(failures=1)
+                    raise LLMGatewayError(f"LLM call failed after {attempt + 1} attempt(s): {e}") from e
+                self._record(retries=1)
+            finally:
+                self.release()
+            await asyncio.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+    async def ainvoke(self, messages, **kwargs):
+        """Call the model, sharing the result with identical requests already in flight."""
+        self._get_loop()
+        if asyncio.get_running_loop() is not self._loop:
+            return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self.ainvoke(messages, **kwargs), self._loop))
+
+        key = dumps([messages, kwargs])
+        self._record(calls=1)
+        future = self._in_flight.get(key)
+        if future is not None:
+            self._record(coalesced=1)
+            return await asyncio.shield(future)
+
+        future = self._loop.create_future()
+        self._in_flight[key] = future
+        try:
+            result = await self._call(messages, kwargs)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception retrieved when no other caller is waiting on it
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+
+    def invoke(self, messages, **kwargs):
+        """Synchronous wrapper around ainvoke() for threaded callers."""
+        loop = self._get_loop()
+        return asyncio.run_coroutine_threadsafe(self.ainvoke(messages, **kwargs), loop).result()
+
+class GatewayChatModel(BaseChatModel):
+    """LangChain chat model that sends every call through an LLMGateway."""
+
+    gateway: Any
+
+    @property
+    def _llm_type(self):
+        return f"gateway-{self.gateway.llm._llm_type}"
+
+    @property
+    def _identifying_params(self):
+        # Same identity as the wrapped model, so response cache keys stay stable across processes
+        return self.gateway.llm._identifying_params
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if stop:
+            kwargs['stop'] = stop
+        return ChatResult(generations=[ChatGeneration(message=self.gateway.invoke(messages, **kwargs))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if stop:
+            kwargs['stop'] = stop
+        return ChatResult(generations=[ChatGeneration(message=await self.gateway.ainvoke(messages, **kwargs))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        # Streams hold a rate token and a concurrency slot for their whole duration; no retries
+        loop = self.gateway._get_loop()
+        asyncio.run_coroutine_threadsafe(self.gateway.acquire(), loop).result()
+        try:
+            for chunk in self.gateway.llm._stream(messages, stop=stop, **kwargs):
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+        finally:
+            loop.call_soon_threadsafe(self.gateway.release)
@@ -1,17 +1,66 @@
 import os
-import streamlit as st
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.memory import ConversationBufferMemory
-from langchain.chains import LLMChain
-
-def setup_llm():
-    """Set up the LLM chain for conversation with the appointment booking assistant."""
+import logging
+from src.startup import cache_resource
+from src.utils import render_confirmation, render_appointments, estimate_tokens, CONFIRMATION_FIELDS
+
+# LangChain, the Gemini client and pydantic are imported inside the functions
+# that need them, so importing this module stays cheap for paths that never call the LLM.
+
+logger = logging.getLogger(__name__)
+
+# Reword booking confirmations with the LLM instead of the built-in templates.
+# Polished templates are cached per set of fields, so the LLM runs once per shape.
+CONFIRMATION_LLM_POLISH = False
+_polished_confirmations = {}
+
+# Serve repeated, PII-free prompts from a local on-disk cache
+LLM_CACHE_ENABLED = True
+
+def enable_llm_cache(cache=None):
+    """Install a response cache for every LangChain LLM call; defaults to the local SQLite cache."""
+    from langchain.globals import set_llm_cache
+    from src.llm_cache import SQLiteLLMCache
+    
+    cache = cache or SQLiteLLMCache()
+    set_llm_cache(cache)
+    return cache
+
+# How the model reports appointment details: "tags" for the <APPOINTMENT_DETAILS> block,
+# "json" for native JSON output validated against a compact schema
+EXTRACTION_MODE = "tags"
+
+# Send every Gemini call through the rate-limited, retrying gateway
+LLM_GATEWAY_ENABLED = True
+
+@cache_resource
+def get_llm_gateway(_llm):
+    """Create the process-wide gateway around the raw Gemini client."""
+    from src.llm_gateway import LLMGateway
+    
+    return LLMGateway(_llm)
+
+@cache_resource
+def get_llm_cache():
+    """Create and install the process-wide response cache once."""
+    return enable_llm_cache()
+
+@cache_resource
+def get_llm():
+    """Create the Gemini client once per process; all sessions share it and its connection pool.
+
+    With LLM_GATEWAY_ENABLED the client is wrapped so calls from every session share
+    one rate limiter, concurrency cap and retry policy.
+    """
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from src.llm_gateway import GatewayChatModel
+    
     api_key = os.getenv('GEMINI_API_KEY')
     
+    if LLM_CACHE_ENABLED:
+        get_llm_cache()
+    
     if not api_key:
-        st.error("Google API key not found. Please set the GEMINI_API_KEY in your environment variables or .env file.")
-        st.stop()
+        raise ValueError("Google API key not found. Please set the GEMINI_API_KEY in your environment variables or .env file.")
     
     try:
         llm = ChatGoogleGenerativeAI(
@@ -19,21 +68,35 @@ def setup_llm():
             model="gemini-2.0-flash"
         )
     except Exception as e:
-        st.warning(f"Error initializing gemini-2.0-flash: {str(e)}")
-        st.warning("Falling back to gemini-pro model.")
+        logger.warning("Error initializing gemini-2.0-flash: %s. Falling back to gemini-pro model.", e)
         llm = ChatGoogleGenerativeAI(
             api_key=api_key,
             model="gemini-pro"
         )
     
-    prompt = ChatPromptTemplate.from_messages([
+    if LLM_GATEWAY_ENABLED:
+        # The wrapper is what gets cached; skip a second cache lookup inside the gateway
+        llm.cache = False
+        return GatewayChatModel(gateway=get_llm_gateway(llm))
+    return llm
+
+@cache_resource
+def get_prompt():
+    """Build the assistant's chat prompt once per process.
+
+    {collected} takes the budget memory's summary of earlier turns; it is empty otherwise.
+    """
+    from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+    
+    return ChatPromptTemplate.from_messages([
         ("system", """You are a friendly and helpful appointment booking assistant named AppointmentBot. Your job is to:
             1. Help users book appointments by collecting their information in a natural, conversational way.
             2. Ask for information one piece at a time - don't ask for multiple pieces of information in a single message.
             3. First ask for their name, then email, then preferred date, then time, and finally the purpose of their appointment.
             4. Help users retrieve their existing appointment information when they ask about their appointments.
             5. Help users cancel appointments if requested.
-            6. Always use a warm, friendly tone with some appropriate emojis.
+            6. Help users reschedule an existing appointment to a new date and time.
+            7. Always use a warm, friendly tone with some appropriate emojis.
 
             Important: Email address is required for all appointments. Always ask for it if not provided.
 
@@ -45,36 +108,124 @@ def setup_llm():
             date: [extracted date in YYYY-MM-DD format]
             time: [extracted time in 12-hour format with AM/PM]
             purpose: [extracted purpose]
-            action: [book/retrieve/cancel]
+            id: [appointment ID, only when rescheduling; date and time are then the new slot]
+            action: [book/retrieve/cancel/reschedule]
             </APPOINTMENT_DETAILS>
 
             When displaying appointments, use a friendly, conversational format with emojis.
 
             The initial greeting should be varied and personalized, not the same message every time.
+
+            {collected}
             """),
         MessagesPlaceholder(variable_name="history"),
         ("human", "{input}")
-    ])
+    ]).partial(collected="")
+
+@cache_resource
+def get_structured_prompt():
+    """Build the trimmed chat prompt for the JSON extraction mode once per process."""
+    from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+    from src.structured import STRUCTURED_SYSTEM_PROMPT
+    
+    return ChatPromptTemplate.from_messages([
+        ("system", STRUCTURED_SYSTEM_PROMPT + "\n{collected}"),
+        MessagesPlaceholder(variable_name="history"),
+        ("human", "{input}")
+    ]).partial(collected="")
+
+def repair_structured_reply(llm, text, error):
+    """Ask the model to rewrite a reply that failed schema validation as valid JSON."""
+    from src.structured import JSON_GENERATION_CONFIG, REPAIR_PROMPT
+    
+    return llm.invoke(REPAIR_PROMPT.format(error=error, text=text), generation_config=JSON_GENERATION_CONFIG).content
+
+def setup_llm(memory_mode="budget", max_prompt_tokens=None, max_turns=None,
+              chat_history=None, memory_slots=None, llm=None, extraction_mode=None):
+    """Set up the LLM chain for conversation with the appointment booking assistant.
+
+    The client and prompt are shared process-wide; only the conversation memory and
+    the chain wrapping it are created per session. memory_mode "budget" keeps the
+    last max_turns turns within max_prompt_tokens (src.memory's defaults when not
+    given) and summarizes the rest; "buffer" keeps the full, unbounded history. Pass chat_history (and the budget memory's
+    memory_slots) to keep the conversation in a session store instead of in memory.
+    Pass llm to use another chat model than the shared Gemini client, and
+    extraction_mode to override EXTRACTION_MODE.
+    """
+    from langchain.chains import LLMChain
+    from langchain.memory import ConversationBufferMemory
+    from src.memory import TokenBudgetMemory, DEFAULT_MAX_TURNS, DEFAULT_MAX_PROMPT_TOKENS
+    from src.structured import JSON_GENERATION_CONFIG
     
-    memory = ConversationBufferMemory(return_messages=True, input_key="input", memory_key="history")
+    llm = llm or get_llm()
+    extraction_mode = extraction_mode or EXTRACTION_MODE
+    prompt = get_structured_prompt() if extraction_mode == "json" else get_prompt()
     
+    memory_args = dict(return_messages=True, input_key="input", output_key="text", memory_key="history")
+    if chat_history is not None:
+        memory_args['chat_memory'] = chat_history
+    
+    if memory_mode == "budget":
+        system_prompt = prompt.messages[0].prompt.template
+        memory = TokenBudgetMemory(
+            max_turns=max_turns or DEFAULT_MAX_TURNS,
+            max_prompt_tokens=max_prompt_tokens or DEFAULT_MAX_PROMPT_TOKENS,
+            base_prompt_tokens=estimate_tokens(system_prompt),
+            slots=memory_slots or {},
+            **memory_args
+        )
+    else:
+        memory = ConversationBufferMemory(**memory_args)
+    
+    # The full generation is returned too, so the handler can read token usage
     chain = LLMChain(
         llm=llm,
         prompt=prompt,
-        memory=memory
+        memory=memory,
+        llm_kwargs={"generation_config": JSON_GENERATION_CONFIG} if extraction_mode == "json" else {},
+        return_final_only=False,
+        metadata={"extraction_mode": extraction_mode}
     )
     
     return chain, llm
 
+def _polished_confirmation(data, llm):
+    """Render a confirmation from an LLM-polished template cached by the fields present."""
+    shape = tuple(field for field, _ in CONFIRMATION_FIELDS if data.get(field))
+    template = _polished_confirmations.get(shape)
+    
+    if template is None:
+        from langchain.prompts import ChatPromptTemplate
+        
+        system_message = """You are a helpful assistant that formats appointment confirmations in a conversational way. 
+        Use bullet points with relevant emojis. Never invent information - only use what's provided. 
+        Keep every placeholder in curly braces exactly as written. 
+        Start with a positive confirmation like 'Great! I've booked your appointment successfully! 📝' 
+        End with 'Your appointment is all set! Is there anything else you'd like help with?'"""
+        prompt_template = ChatPromptTemplate.from_messages([
+            ("system", system_message),
+            ("human", "Please format this appointment confirmation naturally:\n{data}")
+        ])
+        placeholders = {field: "{" + field + "}" for field in shape}
+        template = (prompt_template | llm).invoke({"data": placeholders}).content
+        
+        # Only reuse templates that kept every placeholder
+        if not all(placeholder in template for placeholder in placeholders.values()):
+            return render_confirmation(data)
+        _polished_confirmations[shape] = template
+    
+    response = template
+    for field in shape:
+        response = response.replace("{" + field + "}", str(data[field]))
+    return response
+
 def format_appointment_response(data, response_type, llm, clean_response=None):
     """Format appointments data into a user-friendly response."""
     try:
         if response_type == "confirmation":
-            system_message = """You are a helpful assistant that formats appointment confirmations in a conversational way. 
-            Use bullet points with relevant emojis. Never invent information - only use what's provided. 
-            Start with a positive confirmation like 'Great! I've booked your appointment successfully! 📝' 
-            End with 'Your appointment is all set! Is there anything else you'd like help with?'"""
-            prompt_input = "Please format this appointment confirmation naturally:\n{data}"
+            if CONFIRMATION_LLM_POLISH:
+                return _polished_confirmation(data, llm)
+            return render_confirmation(data)
         else:
             if not data:
                 return f"{clean_response}\n\nYou don't have any appointments scheduled."
@@ -86,6 +237,7 @@ def format_appointment_response(data, response_type, llm, clean_response=None):
 Appointment Data:
 {data}"""
 
+        from langchain.prompts import ChatPromptTemplate
         prompt_template = ChatPromptTemplate.from_messages([
             ("system", system_message),
             ("human", prompt_input)
@@ -99,36 +251,10 @@ Appointment Data:
         return formatted_response
         
     except Exception as e:
-        from src.database import get_table_structure
-        
         if response_type == "confirmation":
-            details = data
-            return f"""Great! I've booked your appointment successfully! 📝
-
-Here are the details:
-- Name: {details['name']}
-- Email: {details['email']}
-- Date: {details['date']}
-- Time: {details['time']}
-- Purpose: {details.get('purpose', 'General appointment')}
-
-Your appointment is all set! Is there anything else you'd like help with?"""
+            return render_confirmation(data)
         else:
-            appointments = data
-            columns = get_table_structure()
-            appointments_text = "Here are your appointments:\n\n"
-            for i, appt in enumerate(appointments):
-                appt_dict = {columns[j]: appt[j] for j in range(len(appt))}
-                appointments_text += f"📅 Appointment {i+1}:\n"
-                appointments_text += f"• ID: {appt_dict.get('id', 'N/A')}\n"
-                appointments_text += f"• Date: {appt_dict.get('date', 'N/A')}\n"
-                appointments_text += f"• Time: {appt_dict.get('time', 'N/A')}\n"
-                appointments_text += f"• Name: {appt_dict.get('name', 'N/A')}\n"
-                purpose = appt_dict.get('purpose', '')
-                if purpose and purpose.lower() not in ('n/a', 'none'):
-                    appointments_text += f"• Purpose: {purpose}\n"
-                appointments_text += "\n"
-            
+            appointments_text = render_appointments(data, "Here are your appointments:")
             if clean_response:
-                return f"{clean_response}\n\n{appointments_text.strip()}"
-            return appointments_text.strip()
\ No newline at end of file
+                return f"{clean_response}\n\n{appointments_text}"
+            return appointments_text
@@ -0,0 +1,87 @@
+import re
+from langchain.memory import ConversationBufferMemory
+from src.structured import parse_structured_reply
+from src.utils import estimate_tokens
+
+# Default prompt budget for the bounded memory mode
+DEFAULT_MAX_TURNS = 4
+DEFAULT_MAX_PROMPT_TOKENS = 2000
+
+SLOT_FIELDS = ['name', 'email', 'date', 'time', 'purpose']
+SLOT_PATTERN = re.compile(r'^\s*(name|email|date|time|purpose):[ \t]*(.*?)\s*$', re.MULTILINE)
+DETAILS_PATTERN = re.compile(r'<APPOINTMENT_DETAILS>(.*?)</APPOINTMENT_DETAILS>', re.DOTALL)
+EMPTY_VALUES = ('', 'n/a', 'none', 'null', 'unknown')
+
+class TokenBudgetMemory(ConversationBufferMemory):
+    """Conversation memory that keeps the last few turns verbatim within a token budget.
+
+    Older turns are folded into a short summary of the appointment details collected
+    so far, so the prompt stops growing with the length of the conversation. The
+    summary is returned under summary_key for the system prompt, since chat models
+    like Gemini only accept a system message at the start of the prompt.
+    """
+    summary_key: str = "collected"
+    max_turns: int = DEFAULT_MAX_TURNS
+    max_prompt_tokens: int = DEFAULT_MAX_PROMPT_TOKENS
+    base_prompt_tokens: int = 0
+    slots: dict = {}
+    last_prompt_tokens: int = 0
+
+    def _fold(self, message):
+        """Merge appointment details found in a message being dropped into the summary slots."""
+        for block in DETAILS_PATTERN.findall(message.content):
+            for field, value in SLOT_PATTERN.findall(block):
+                # Skip empty values and unfilled template placeholders like "[extracted email]"
+                if value.lower() not in EMPTY_VALUES and not value.startswith('['):
+                    self.slots[field] = value
+        
+        # Replies from the JSON extraction mode
+        if message.content.lstrip().startswith(('{', '```')):
+            try:
+                details, _ = parse_structured_reply(message.content)
+            except ValueError:
+                details = None
+            for field in SLOT_FIELDS:
+                if details and details.get(field, '').lower() not in EMPTY_VALUES:
+                    self.slots[field] = details[field]
+
+    def summary(self):
+        """Return the one-line summary of details collected in folded turns, or ''."""
+        collected = [f"{field}: {self.slots[field]}" for field in SLOT_FIELDS if field in self.slots]
+        if not collected:
+            return ""
+        return "Details collected earlier in this conversation: " + ", ".join(collected)
+
+    @property
+    def memory_variables(self):
+        return [self.memory_key, self.summary_key]
+
+    def load_memory_variables(self, inputs):
+        """Return the most recent turns that fit in the budget, and the summary of older ones."""
+        messages = self.chat_memory.messages
+        keep = self.max_turns * 2
+        if len(messages) > keep:
+            for message in messages[:-keep]:
+                self._fold(message)
+            messages = messages[-keep:]
+            self.chat_memory.clear()
+            self.chat_memory.add_messages(messages)
+
+        input_tokens = estimate_tokens(str(inputs.get(self.input_key, "")))
+        recent = list(messages)
+        recent_tokens = sum(estimate_tokens(m.content) for m in recent)
+        while recent and self.base_prompt_tokens + input_tokens + estimate_tokens(self.summary()) + recent_tokens > self.max_prompt_tokens:
+            # Drop a whole turn at a time so the history never starts with an AI reply
+            for message in recent[:2]:
+                self._fold(message)
+                recent_tokens -= estimate_tokens(message.content)
+            recent = recent[2:]
+
+        summary = self.summary()
+        self.last_prompt_tokens = self.base_prompt_tokens + input_tokens + estimate_tokens(summary) + recent_tokens
+        return {self.memory_key: recent, self.summary_key: summary}
+
+    def clear(self):
+        """Forget the history and the collected summary slots."""
+        super().clear()
+        self.slots = {}
@@ -0,0 +1,212 @@
+import json
+import time
+import logging
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Tracing is off unless enabled; disabled spans are a shared no-op object
+METRICS_ENABLED = False
+
+# Recent samples kept per (stage, action) for percentile estimates
+SAMPLES_PER_SERIES = 2048
+QUANTILES = (0.5, 0.95, 0.99)
+
+logger = logging.getLogger("appointment_agent.metrics")
+
+_series = {}
+_series_lock = threading.Lock()
+_current_turn = ContextVar("metrics_turn", default=None)
+
+class _Series:
+    """Count, sum and a bounded window of recent samples for one (stage, action)."""
+    __slots__ = ('count', 'total', 'samples')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=SAMPLES_PER_SERIES)
+
+class _Turn:
+    """Stage timings collected during one chat turn."""
+    __slots__ = ('started', 'spans', 'action', 'fields')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self.action = None
+        self.fields = {}
+
+class _NullTurn:
+    """Stand-in turn used while tracing is disabled."""
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        pass
+
+class _NullSpan:
+    """No-op span used while tracing is disabled."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class _Span:
+    """Times a block and files it under the current turn, or records it directly."""
+    __slots__ = ('stage', 'turn', 'started')
+
+    def __init__(self, stage, turn):
+        self.stage = stage
+        self.turn = turn
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        turn = self.turn or _current_turn.get()
+        if turn is not None:
+            turn.spans.append((self.stage, elapsed))
+        else:
+            record(self.stage, "none", elapsed)
+        return False
+
+_NULL_SPAN = _NullSpan()
+_NULL_TURN = _NullTurn()
+
+def enable_metrics(enabled=True):
+    """Turn stage tracing on or off for the whole process."""
+    global METRICS_ENABLED
+    METRICS_ENABLED = enabled
+
+def record(stage, action, seconds):
+    """Add one duration sample to the (stage, action) series."""
+    with _series_lock:
+        series = _series.get((stage, action))
+        if series is None:
+            series = _series[(stage, action)] = _Series()
+        series.count += 1
+        series.total += seconds
+        series.samples.append(seconds)
+
+def span(stage, turn=None):
+    """Context manager timing one pipeline stage; free when tracing is disabled."""
+    if not METRICS_ENABLED:
+        return _NULL_SPAN
+    return _Span(stage, turn)
+
+def timed(stage):
+    """Decorator timing every call of a function as the given stage."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not METRICS_ENABLED:
+                return func(*args, **kwargs)
+            with _Span(stage, None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def set_action(action):
+    """Label the current turn with its action (book, retrieve, cancel, ...)."""
+    turn = _current_turn.get()
+    if turn is not None and turn.action is None:
+        turn.action = action
+
+def annotate(**fields):
+    """Attach extra fields, such as token counts, to the current turn's log line."""
+    turn = _current_turn.get()
+    if turn is not None:
+        turn.fields.update(fields)
+
+@contextmanager
+def trace_turn():
+    """Collect the stage spans of one chat turn.
+
+    On exit every span is recorded under the turn's action, the total under
+    stage "turn", and one structured JSON log line is written.
+    """
+    if not METRICS_ENABLED:
+        yield _NULL_TURN
+        return
+
+    turn = _Turn()
+    _current_turn.set(turn)
+    try:
+        yield turn
+    finally:
+        _current_turn.set(None)
+        action = turn.action or "chat"
+        total = time.perf_counter() - turn.started
+        stages = {}
+        for stage, seconds in turn.spans:
+            record(stage, action, seconds)
+            stages[stage] = stages.get(stage, 0.0) + seconds
+        record("turn", action, total)
+        logger.info(json.dumps({
+            "event": "turn",
+            "action": action,
+            "total_ms": round(total * 1000, 3),
+            "stages_ms": {stage: round(seconds * 1000, 3) for stage, seconds in stages.items()},
+            **turn.fields
+        }))
+
+def iterate_in_turn(turn, iterator):
+    """Yield from iterator with turn current at every step.
+
+    Generators resume in their caller's context, and callers like Starlette's
+    iterate_in_threadpool run each step in a fresh copy of it, which would lose
+    the turn after the first yield.
+    """
+    iterator = iter(iterator)
+    while True:
+        if turn is not _NULL_TURN:
+            _current_turn.set(turn)
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        yield item
+
+def _quantile(sorted_samples, q):
+    """Nearest-rank quantile of already sorted samples."""
+    index = min(len(sorted_samples) - 1, max(0, int(round(q * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+def snapshot():
+    """Return per (stage, action) count, sum and p50/p95/p99 latencies in seconds."""
+    with _series_lock:
+        items = [(key, series.count, series.total, sorted(series.samples)) for key, series in _series.items()]
+
+    result = []
+    for (stage, action), count, total, samples in sorted(items):
+        entry = {"stage": stage, "action": action, "count": count, "sum_seconds": total}
+        for q in QUANTILES:
+            entry[f"p{int(q * 100)}"] = _quantile(samples, q) if samples else 0.0
+        result.append(entry)
+    return result
+
+def prometheus_text():
+    """Render the latency series in the Prometheus text exposition format."""
+    lines = [
+        "# HELP appointment_stage_seconds Latency of chat pipeline stages.",
+        "# TYPE appointment_stage_seconds summary"
+    ]
+    for entry in snapshot():
+        labels = f'stage="{entry["stage"]}",action="{entry["action"]}"'
+        for q in QUANTILES:
+            lines.append(f'appointment_stage_seconds{{{labels},quantile="{q}"}} {entry[f"p{int(q * 100)}"]:.6f}')
+        lines.append(f'appointment_stage_seconds_sum{{{labels}}} {entry["sum_seconds"]:.6f}')
+        lines.append(f'appointment_stage_seconds_count{{{labels}}} {entry["count"]}')
+    return "\n".join(lines) + "\n"
+
+def reset_metrics():
+    """Drop every recorded series."""
+    with _series_lock:
+        _series.clear()
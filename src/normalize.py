@@ -0,0 +1,83 @@
+import re
+from datetime import date as date_type, datetime
+from functools import lru_cache
+
+# Strict fast paths; anything else falls back to dateparser
+ISO_DATE = re.compile(r'^(\d{4})-(\d{1,2})-(\d{1,2})(?:[T ].*)?$')
+NUMERIC_DATE = re.compile(r'^(\d{1,4})[/.-](\d{1,2})[/.-](\d{1,4})$')
+CLOCK_TIME = re.compile(r'^(\d{1,2})(?::(\d{2}))?(?::\d{2})?\s*(?:([ap])\.?\s*m?\.?)?$', re.IGNORECASE)
+NAMED_TIMES = {'noon': (12, 0), 'midday': (12, 0), 'midnight': (0, 0)}
+
+DATEPARSER_CACHE_SIZE = 1024
+
+def _safe_date(year, month, day):
+    """Return a date for the given parts, or None if they don't form a real date."""
+    try:
+        return date_type(year, month, day)
+    except ValueError:
+        return None
+
+def _fast_date(text):
+    """Parse ISO and common numeric dates without dateparser, or return None."""
+    match = ISO_DATE.match(text)
+    if match:
+        return _safe_date(*map(int, match.groups()))
+
+    match = NUMERIC_DATE.match(text)
+    if match:
+        first, second, third = match.groups()
+        if len(first) == 4:
+            return _safe_date(int(first), int(second), int(third))
+        if len(third) == 4:
+            return _safe_date(int(third), int(first), int(second))
+    return None
+
+@lru_cache(maxsize=DATEPARSER_CACHE_SIZE)
+def _dateparser_date(text, today):
+    """Parse a free-form date with dateparser (imported on first use).
+
+    today is part of the cache key so relative dates like "tomorrow" don't go stale.
+    """
+    import dateparser
+
+    parsed = dateparser.parse(text)
+    return parsed.date() if parsed else None
+
+def normalize_date(text):
+    """Normalize a date to YYYY-MM-DD, or return the stripped input if it can't be parsed."""
+    text = text.strip()
+    if not text:
+        return text
+
+    parsed = _fast_date(text)
+    if parsed is None:
+        parsed = _dateparser_date(text.lower(), datetime.now().date().isoformat())
+    return parsed.strftime('%Y-%m-%d') if parsed else text
+
+def parse_time(text):
+    """Parse a clock time like "3:30 PM", "15:30", "3pm" or "noon" into (hour, minute), or None."""
+    text = text.strip().lower()
+    if text in NAMED_TIMES:
+        return NAMED_TIMES[text]
+
+    match = CLOCK_TIME.match(text)
+    if not match:
+        return None
+
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2) or 0), match.group(3)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem == 'p' else 0)
+    if hour > 23 or minute > 59:
+        return None
+    return hour, minute
+
+def normalize_time(text):
+    """Normalize a time to 12-hour "H:MM AM" form, or return the stripped input if it can't be parsed."""
+    parsed = parse_time(text)
+    if parsed is None:
+        return text.strip()
+
+    hour, minute = parsed
+    return f"{hour % 12 or 12}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
@@ -0,0 +1,280 @@
+"""Reminders sent ahead of each appointment by a background scheduler.
+
+    python -m src.reminders                      # scan every minute, printing reminders to stdout
+    python -m src.reminders --once --log reminders.jsonl
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from src.database import ensure_db, transaction, to_epoch
+
+# How long before an appointment its reminder goes out, and how often the scheduler looks for due ones
+REMINDER_LEAD_SECONDS = 24 * 3600
+SCAN_INTERVAL_SECONDS = 60
+
+# Appointments claimed per transaction, and reminders handed to the worker pool at a time
+SCAN_BATCH_SIZE = 500
+
+# Concurrent sends, and attempts before a delivery is marked failed
+MAX_SEND_WORKERS = 4
+MAX_DELIVERY_ATTEMPTS = 5
+
+# Name of the scheduler's high-water mark in scheduler_state
+CURSOR_NAME = 'reminders'
+
+logger = logging.getLogger(__name__)
+
+# Scans run and deliveries claimed, sent, retried, given up on, skipped (already started) or canceled
+_stats = {'scans': 0, 'claimed': 0, 'sent': 0, 'retried': 0, 'failed': 0, 'skipped': 0, 'canceled': 0}
+_stats_lock = threading.Lock()
+
+class ReminderSender:
+    """Interface for delivering one reminder."""
+
+    def send(self, reminder):
+        """Deliver a reminder dict; raise to have it retried on a later scan.
+
+        reminder['key'] identifies the delivery. A crash between a send and its
+        bookkeeping repeats that one reminder, so senders should drop repeated keys.
+        """
+        raise NotImplementedError
+
+class FileReminderSender(ReminderSender):
+    """Stand-in sender appending reminders as JSON lines to a file, or to stdout."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, reminder):
+        line = json.dumps(reminder, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self.path is None:
+                sys.stdout.write(line)
+                sys.stdout.flush()
+            else:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+
+def _reminder(appointment_id, starts_at, name, email, date, time, purpose):
+    """Build the payload handed to the sender for one delivery."""
+    about = f" ({purpose})" if purpose else ""
+    return {
+        'key': f"{appointment_id}:{starts_at}",
+        'appointment_id': appointment_id,
+        'name': name,
+        'email': email,
+        'date': date,
+        'time': time,
+        'purpose': purpose,
+        'message': f"Hi {name}, this is a reminder of your appointment on {date} at {time}{about}."
+    }
+
+def _count(**changes):
+    """Add to the scheduler counters."""
+    with _stats_lock:
+        for key, value in changes.items():
+            _stats[key] += value
+
+def reminder_stats():
+    """Return a snapshot of the scheduler counters."""
+    with _stats_lock:
+        return dict(_stats)
+
+class ReminderScheduler:
+    """Claims appointments as they come within lead_seconds of starting and sends their reminders.
+
+    A persisted (starts_at, id) high-water mark records how far appointments have
+    been claimed, so each scan reads only newly due rows through the starts_at
+    index, in batches. Bookings made or moved behind the mark are found by a range
+    scan between now and the mark. Claims and the mark move in one transaction and
+    every delivery's status is kept in reminder_deliveries, so a restart neither
+    rescans nor resends. Run one scheduler per database.
+    """
+
+    def __init__(self, sender=None, lead_seconds=REMINDER_LEAD_SECONDS, batch_size=SCAN_BATCH_SIZE,
+                 max_workers=MAX_SEND_WORKERS, interval=SCAN_INTERVAL_SECONDS):
+        self.sender = sender or FileReminderSender()
+        self.lead_seconds = lead_seconds
+        self.batch_size = batch_size
+        self.interval = interval
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="reminders")
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _mark(self, conn, now):
+        """Return the stored high-water mark, moved up to now; appointments already started get no reminder."""
+        row = conn.execute("SELECT starts_at, appointment_id FROM scheduler_state WHERE name = ?",
+                           (CURSOR_NAME,)).fetchone()
+        if row is None or row[0] < now:
+            return now, 0
+        return row[0], row[1]
+
+    def claim(self, now):
+        """Record a pending delivery for every appointment due a reminder; returns how many were added."""
+        claimed = 0
+
+        # Late bookings and reschedules into the range that was already claimed
+        with transaction(immediate=True) as conn:
+            mark_starts_at, mark_id = self._mark(conn, now)
+            c = conn.execute("INSERT INTO reminder_deliveries (appointment_id, starts_at, updated_at) "
+                             "SELECT id, starts_at, ? FROM appointments WHERE starts_at > ? AND starts_at <= ? "
+                             "AND (starts_at < ? OR id <= ?) ON CONFLICT DO NOTHING",
+                             (time.time(), now, mark_starts_at, mark_starts_at, mark_id))
+            claimed += c.rowcount
+
+        # Newly due appointments past the mark, one batch per transaction
+        while True:
+            with transaction(immediate=True) as conn:
+                mark_starts_at, mark_id = self._mark(conn, now)
+                rows = conn.execute("SELECT id, starts_at FROM appointments WHERE starts_at <= ? AND starts_at >= ? "
+                                    "AND (starts_at > ? OR id > ?) ORDER BY starts_at, id LIMIT ?",
+                                    (now + self.lead_seconds, mark_starts_at, mark_starts_at, mark_id,
+                                     self.batch_size)).fetchall()
+                if rows:
+                    updated_at = time.time()
+                    c = conn.executemany("INSERT INTO reminder_deliveries (appointment_id, starts_at, updated_at) "
+                                         "VALUES (?, ?, ?) ON CONFLICT DO NOTHING",
+                                         [(appointment_id, starts_at, updated_at) for appointment_id, starts_at in rows])
+                    claimed += c.rowcount
+                    last_id, last_starts_at = rows[-1]
+                    conn.execute("INSERT INTO scheduler_state (name, starts_at, appointment_id) VALUES (?, ?, ?) "
+                                 "ON CONFLICT (name) DO UPDATE SET starts_at = excluded.starts_at, "
+                                 "appointment_id = excluded.appointment_id", (CURSOR_NAME, last_starts_at, last_id))
+            if len(rows) < self.batch_size:
+                return claimed
+
+    def _send(self, reminder):
+        """Send one reminder on a pool thread; returns None or the error it raised."""
+        try:
+            self.sender.send(reminder)
+            return None
+        except Exception as e:
+            return e
+
+    def dispatch(self, now):
+        """Send every pending reminder through the worker pool in batches; returns the outcome counts."""
+        report = {'sent': 0, 'retried': 0, 'failed': 0, 'skipped': 0, 'canceled': 0}
+        after_starts_at = after_id = 0
+        while True:
+            with transaction() as conn:
+                rows = conn.execute("SELECT d.appointment_id, d.starts_at, d.attempts, a.starts_at, a.name, a.email, "
+                                    "a.date, a.time, a.purpose FROM reminder_deliveries AS d "
+                                    "LEFT JOIN appointments AS a ON a.id = d.appointment_id "
+                                    "WHERE d.status = 'pending' AND d.starts_at >= ? "
+                                    "AND (d.starts_at > ? OR d.appointment_id > ?) "
+                                    "ORDER BY d.starts_at, d.appointment_id LIMIT ?",
+                                    (after_starts_at, after_starts_at, after_id, self.batch_size)).fetchall()
+            if not rows:
+                return report
+            after_id, after_starts_at = rows[-1][:2]
+
+            settled, sending = [], []
+            for appointment_id, starts_at, attempts, current_starts_at, *fields in rows:
+                # Deleted, or moved: a moved appointment gets its own delivery for the new slot
+                if current_starts_at != starts_at:
+                    settled.append(('canceled', appointment_id, starts_at))
+                elif starts_at <= now:
+                    settled.append(('skipped', appointment_id, starts_at))
+                else:
+                    reminder = _reminder(appointment_id, starts_at, *fields)
+                    sending.append((appointment_id, starts_at, attempts, self._pool.submit(self._send, reminder)))
+
+            sent, retried = [], []
+            for appointment_id, starts_at, attempts, future in sending:
+                error = future.result()
+                if error is None:
+                    sent.append((time.time(), appointment_id, starts_at))
+                    continue
+                logger.warning("Reminder for appointment %s failed (attempt %s): %s", appointment_id, attempts + 1, error)
+                if attempts + 1 >= MAX_DELIVERY_ATTEMPTS:
+                    settled.append(('failed', appointment_id, starts_at))
+                else:
+                    retried.append((str(error), time.time(), appointment_id, starts_at))
+
+            with transaction(immediate=True) as conn:
+                conn.executemany("UPDATE reminder_deliveries SET status = 'sent', attempts = attempts + 1, "
+                                 "last_error = NULL, updated_at = ? WHERE appointment_id = ? AND starts_at = ?", sent)
+                conn.executemany("UPDATE reminder_deliveries SET attempts = attempts + 1, last_error = ?, updated_at = ? "
+                                 "WHERE appointment_id = ? AND starts_at = ?", retried)
+                conn.executemany("UPDATE reminder_deliveries SET status = ?, updated_at = ? "
+                                 "WHERE appointment_id = ? AND starts_at = ?",
+                                 [(status, time.time(), appointment_id, starts_at)
+                                  for status, appointment_id, starts_at in settled])
+
+            report['sent'] += len(sent)
+            report['retried'] += len(retried)
+            for status, _, _ in settled:
+                report[status] += 1
+
+    def run_once(self, now=None):
+        """Claim newly due appointments and send their reminders; returns the counts for this scan.
+
+        now is epoch seconds in the same wall-clock terms as starts_at, defaulting to the current time.
+        """
+        now = to_epoch(datetime.now()) if now is None else int(now)
+        report = {'claimed': self.claim(now), **self.dispatch(now)}
+        _count(scans=1, **report)
+        return report
+
+    def _run(self):
+        """Scan every interval until stopped."""
+        while not self._stop.is_set():
+            try:
+                report = self.run_once()
+                if any(report.values()):
+                    logger.info(json.dumps({'event': 'reminders', **report}))
+            except Exception:
+                logger.exception("Reminder scan failed")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Start scanning on a daemon thread."""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="reminder-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop scanning and wait for in-flight sends to finish."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._pool.shutdown(wait=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Send reminders ahead of upcoming appointments.")
+    parser.add_argument('--once', action='store_true', help="run one scan and exit")
+    parser.add_argument('--log', help="append reminders to this JSONL file instead of printing them")
+    parser.add_argument('--lead-hours', type=float, default=REMINDER_LEAD_SECONDS / 3600,
+                        help="how long before an appointment its reminder is sent")
+    parser.add_argument('--interval', type=float, default=SCAN_INTERVAL_SECONDS, help="seconds between scans")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    ensure_db()
+    scheduler = ReminderScheduler(FileReminderSender(args.log), lead_seconds=int(args.lead_hours * 3600),
+                                  interval=args.interval)
+    if args.once:
+        report = scheduler.run_once()
+        scheduler.stop()
+        print(f"Claimed {report['claimed']}, sent {report['sent']}, retried {report['retried']}, "
+              f"failed {report['failed']}, skipped {report['skipped']}, canceled {report['canceled']}.",
+              file=sys.stderr)
+        return
+
+    scheduler.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        scheduler.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import copy
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict, deque
+from itertools import islice
+from contextlib import contextmanager
+from src.database import transaction
+
+# Default bounds for stored chat sessions
+MAX_SESSIONS = 10000
+SESSION_IDLE_SECONDS = 3600
+
+# Saves tried per turn when other workers keep saving the same session in between
+SESSION_SAVE_ATTEMPTS = 5
+
+# How often a SQLite store deletes idle sessions, checked as sessions are saved
+SESSION_PURGE_INTERVAL_SECONDS = 300
+
+# Chat messages a transcript keeps in memory; older ones are spilled to SQLite, half a ring at a time
+TRANSCRIPT_RING_SIZE = 50
+
+# Spilled messages of transcripts that haven't spilled for this long are purged
+TRANSCRIPT_RETENTION_SECONDS = 24 * 3600
+
+# Session keys that are persisted; everything else (the chain, the LLM client) is rebuilt per turn
+PERSISTED_KEYS = ('current_name', 'current_email', 'prompt_tokens', 'completion_tokens', 'history', 'memory_slots',
+                  'more_appointments')
+
+class SessionConflictError(Exception):
+    """Raised when a session was saved by someone else since it was read."""
+
+class SessionStore:
+    """Interface for storing chat session state as JSON-serializable dicts.
+
+    Every save bumps the session's version, and saves name the version they read,
+    so two workers running turns on one session cannot overwrite each other.
+    """
+
+    def get(self, session_id):
+        """Return (state, version) for a session, or (None, None) if it is unknown or expired."""
+        raise NotImplementedError
+
+    def put(self, session_id, state, version=None):
+        """Store the state for a session read at version (None for a new one); returns the new version.
+
+        Raises SessionConflictError when the stored session is no longer at version.
+        """
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        """Forget a session."""
+        raise NotImplementedError
+
+class MemorySessionStore(SessionStore):
+    """In-process LRU session store, bounded in size and evicting idle sessions."""
+
+    def __init__(self, max_sessions=MAX_SESSIONS, idle_seconds=SESSION_IDLE_SECONDS):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        # session_id -> (state JSON, version, last used)
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        """Drop idle sessions from the LRU end, then any beyond max_sessions."""
+        while self._sessions:
+            session_id, (_, _, updated_at) = next(iter(self._sessions.items()))
+            if now - updated_at <= self.idle_seconds and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+
+    def get(self, session_id):
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None, None
+            self._sessions[session_id] = (entry[0], entry[1], now)
+            self._sessions.move_to_end(session_id)
+            return json.loads(entry[0]), entry[1]
+
+    def put(self, session_id, state, version=None):
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            entry = self._sessions.get(session_id)
+            if (entry[1] if entry else None) != version:
+                raise SessionConflictError(session_id)
+            version = (version or 0) + 1
+            self._sessions[session_id] = (json.dumps(state), version, now)
+            self._sessions.move_to_end(session_id)
+            self._evict(now)
+            return version
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+class SQLiteSessionStore(SessionStore):
+    """Session store in the appointments database, shared by every worker process.
+
+    Saves are compare-and-swap on the version column, each its own short write,
+    so no lock is held while a turn runs. Idle sessions are deleted every
+    purge_interval seconds, on the next save.
+    """
+
+    def __init__(self, idle_seconds=SESSION_IDLE_SECONDS, purge_interval=SESSION_PURGE_INTERVAL_SECONDS):
+        self.idle_seconds = idle_seconds
+        self.purge_interval = purge_interval
+        self._purged_at = time.monotonic()
+        self._purge_lock = threading.Lock()
+
+    def get(self, session_id):
+        with transaction() as conn:
+            row = conn.execute("SELECT state, version FROM sessions WHERE id = ? AND updated_at >= ?",
+                               (session_id, time.time() - self.idle_seconds)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else (None, None)
+
+    def put(self, session_id, state, version=None):
+        now = time.time()
+        with transaction(immediate=True) as conn:
+            if version is None:
+                # A new session, or one that expired and reads as unknown
+                c = conn.execute("INSERT INTO sessions (id, state, updated_at, version) VALUES (?, ?, ?, 1) "
+                                 "ON CONFLICT (id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at, "
+                                 "version = sessions.version + 1 WHERE sessions.updated_at < ?",
+                                 (session_id, json.dumps(state), now, now - self.idle_seconds))
+            else:
+                c = conn.execute("UPDATE sessions SET state = ?, updated_at = ?, version = version + 1 "
+                                 "WHERE id = ? AND version = ?", (json.dumps(state), now, session_id, version))
+            if not c.rowcount:
+                raise SessionConflictError(session_id)
+            new_version = conn.execute("SELECT version FROM sessions WHERE id = ?", (session_id,)).fetchone()[0]
+        self._purge_if_due()
+        return new_version
+
+    def delete(self, session_id):
+        with transaction(immediate=True) as conn:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def _purge_if_due(self):
+        """Run purge_idle when purge_interval has passed since the last purge in this process."""
+        with self._purge_lock:
+            now = time.monotonic()
+            if now - self._purged_at < self.purge_interval:
+                return
+            self._purged_at = now
+        self.purge_idle()
+
+    def purge_idle(self):
+        """Delete sessions idle for longer than idle_seconds; returns how many were removed."""
+        with transaction(immediate=True) as conn:
+            c = conn.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.idle_seconds,))
+        return c.rowcount
+
+class ChatTranscript:
+    """The chat messages shown for one session, bounded in memory.
+
+    Messages are {'role', 'content'} dicts numbered from 0 in the order they were
+    added. The newest ring_size stay in memory; when the ring overflows its oldest
+    half is written to the chat_messages table in one transaction, so the last
+    ring_size // 2 messages can always be read without touching the database.
+    """
+
+    def __init__(self, session_id=None, ring_size=TRANSCRIPT_RING_SIZE):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.ring_size = ring_size
+        self._recent = deque()
+        # Messages already in SQLite, which is also the number of the first one in the ring
+        self._spilled = 0
+
+    def __len__(self):
+        return self._spilled + len(self._recent)
+
+    def append(self, role, content):
+        """Add a message, spilling the oldest half of the ring when it is full."""
+        self._recent.append({'role': role, 'content': content})
+        if len(self._recent) > self.ring_size:
+            self._spill(len(self._recent) - self.ring_size // 2)
+
+    def _spill(self, count):
+        """Move the oldest count messages from the ring to SQLite."""
+        now = time.time()
+        rows = [(self.session_id, self._spilled + offset, message['role'], message['content'], now)
+                for offset, message in enumerate(self._recent.popleft() for _ in range(count))]
+        with transaction(immediate=True) as conn:
+            conn.executemany("INSERT OR REPLACE INTO chat_messages (session_id, seq, role, content, spilled_at) "
+                             "VALUES (?, ?, ?, ?, ?)", rows)
+        self._spilled += count
+
+    def earlier(self, before, limit):
+        """Return up to limit spilled messages numbered below before, oldest first."""
+        with transaction() as conn:
+            rows = conn.execute("SELECT role, content FROM chat_messages WHERE session_id = ? AND seq >= ? AND seq < ? "
+                                "ORDER BY seq", (self.session_id, max(0, before - limit), before)).fetchall()
+        return [{'role': role, 'content': content} for role, content in rows]
+
+    def window(self, size):
+        """Return the last size messages, reading SQLite only for those no longer in the ring."""
+        if size <= len(self._recent):
+            return list(islice(self._recent, len(self._recent) - size, None))
+        return self.earlier(self._spilled, size - len(self._recent)) + list(self._recent)
+
+def purge_idle_transcripts(retention_seconds=TRANSCRIPT_RETENTION_SECONDS):
+    """Delete the spilled messages of transcripts idle for longer than retention_seconds; returns rows removed."""
+    with transaction(immediate=True) as conn:
+        c = conn.execute("DELETE FROM chat_messages WHERE session_id IN (SELECT session_id FROM chat_messages "
+                         "GROUP BY session_id HAVING MAX(spilled_at) < ?)", (time.time() - retention_seconds,))
+    return c.rowcount
+
+def _merge(base, ours, theirs):
+    """Apply one turn's changes (base to ours) on top of the state another worker saved (theirs)."""
+    merged = dict(theirs)
+    for key in PERSISTED_KEYS:
+        if key == 'history':
+            base_history, our_history = base.get('history', []), ours.get('history', [])
+            if our_history[:len(base_history)] == base_history:
+                merged['history'] = theirs.get('history', []) + our_history[len(base_history):]
+            else:
+                merged['history'] = our_history
+        elif ours.get(key) != base.get(key):
+            if key in ours:
+                merged[key] = ours[key]
+            else:
+                merged.pop(key, None)
+    return merged
+
+@contextmanager
+def open_session(store, session_id, setup_llm):
+    """Load a session from the store, bind a fresh chain to its history, and save it afterwards.
+
+    setup_llm is called as setup_llm(chat_history=..., memory_slots=...) and returns
+    (llm_chain, llm), like src.llm_setup.setup_llm. If another worker saved the session
+    during the turn, this turn's changes are merged onto that save: new messages are
+    appended to its history and other changed keys overwrite it. Raises
+    SessionConflictError if the session keeps changing for SESSION_SAVE_ATTEMPTS saves.
+    """
+    from src.chat_history import SessionChatHistory
+    base, version = store.get(session_id)
+    base = base or {'current_name': None, 'current_email': None}
+    session = copy.deepcopy(base)
+    session['llm_chain'], session['llm'] = setup_llm(chat_history=SessionChatHistory(session),
+                                                     memory_slots=session.get('memory_slots'))
+    yield session
+
+    memory_slots = getattr(session['llm_chain'].memory, 'slots', None)
+    if memory_slots is not None:
+        session['memory_slots'] = memory_slots
+    state = {key: session[key] for key in PERSISTED_KEYS if key in session}
+    for _ in range(SESSION_SAVE_ATTEMPTS):
+        try:
+            store.put(session_id, state, version)
+            return
+        except SessionConflictError:
+            theirs, version = store.get(session_id)
+            theirs = theirs or {}
+            state, base = _merge(base, state, theirs), theirs
+    raise SessionConflictError(session_id)
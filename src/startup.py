@@ -0,0 +1,143 @@
+"""Startup profiling and lazy-loading helpers.
+
+Set PROFILE_STARTUP=1 to report how long each module took to import (its own time and
+including the modules it pulled in) and how long each initialization step took.
+Import this module before the rest of src so the timer sees their imports.
+"""
+import os
+import sys
+import time
+import json
+import inspect
+import threading
+import functools
+from contextlib import contextmanager
+
+PROFILE_STARTUP = os.getenv("PROFILE_STARTUP", "") not in ("", "0")
+
+# Modules listed in the startup report, slowest first
+REPORT_LIMIT = 25
+
+# module name -> [total seconds, self seconds]; init step name -> seconds
+_imports = {}
+_steps = {}
+_reported = False
+_local = threading.local()
+_lock = threading.Lock()
+
+class _TimedLoader:
+    """Loader wrapper timing exec_module and delegating everything else."""
+
+    def __init__(self, loader):
+        self._loader = loader
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        # Per-thread stack of time spent in nested imports, to split out each module's own time
+        stack = _local.__dict__.setdefault('stack', [])
+        started = time.perf_counter()
+        stack.append(0.0)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            children = stack.pop()
+            total = time.perf_counter() - started
+            if stack:
+                stack[-1] += total
+            _imports[module.__name__] = [total, total - children]
+
+class _ImportTimer:
+    """Meta path finder that wraps the loaders found by the other finders."""
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _TimedLoader(spec.loader)
+                return spec
+        return None
+
+def enable_import_profiling():
+    """Start timing every module imported from now on."""
+    if not any(isinstance(finder, _ImportTimer) for finder in sys.meta_path):
+        sys.meta_path.insert(0, _ImportTimer())
+
+@contextmanager
+def profile_step(name):
+    """Time an initialization step for the startup report; does nothing unless profiling."""
+    if not PROFILE_STARTUP:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _steps[name] = _steps.get(name, 0.0) + time.perf_counter() - started
+
+def startup_report(limit=REPORT_LIMIT):
+    """Return the slowest imports (by own time) and the initialization steps, in milliseconds."""
+    slowest = sorted(_imports.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+    return {
+        'imports': [{'module': name, 'self_ms': round(own * 1000, 2), 'total_ms': round(total * 1000, 2)}
+                    for name, (total, own) in slowest],
+        'import_count': len(_imports),
+        'steps': {name: round(seconds * 1000, 2) for name, seconds in _steps.items()}
+    }
+
+def log_startup_report():
+    """Write the startup report to stderr once per process when profiling is on."""
+    global _reported
+    with _lock:
+        if not PROFILE_STARTUP or _reported:
+            return
+        _reported = True
+    print(json.dumps({'event': 'startup', **startup_report()}, indent=2), file=sys.stderr)
+
+def _in_streamlit():
+    """Whether this process is serving a Streamlit app; streamlit is never imported to find out."""
+    if 'streamlit' not in sys.modules:
+        return False
+    from streamlit import runtime
+    return runtime.exists()
+
+def cache_resource(func):
+    """Cache func's result once per process and arguments.
+
+    Inside a running Streamlit app this is st.cache_resource, imported on first call.
+    Elsewhere (the API, scripts, tests) results are kept in a plain dict under a lock,
+    so streamlit is never imported. As with st.cache_resource, arguments whose names
+    start with an underscore are left out of the key.
+    """
+    cached = None
+    results = {}
+    lock = threading.Lock()
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        nonlocal cached
+        if _in_streamlit():
+            if cached is None:
+                import streamlit as st
+                cached = st.cache_resource(func)
+            return cached(*args, **kwargs)
+
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = tuple((name, value) for name, value in bound.arguments.items() if not name.startswith('_'))
+        with lock:
+            if key not in results:
+                results[key] = func(*args, **kwargs)
+            return results[key]
+    return wrapper
+
+if PROFILE_STARTUP:
+    enable_import_profiling()
@@ -0,0 +1,80 @@
+import re
+import threading
+from typing import Literal, Optional
+from pydantic import BaseModel, ValidationError
+from src.normalize import normalize_date, normalize_time
+
+# Ask Gemini for a bare JSON object instead of free text
+JSON_GENERATION_CONFIG = {"response_mime_type": "application/json"}
+
+# Repair calls made when a reply doesn't match the schema, before falling back to tag parsing
+STRUCTURED_MAX_RETRIES = 1
+
+# Trimmed system prompt for the structured mode; the schema replaces the tag template
+STRUCTURED_SYSTEM_PROMPT = """You are AppointmentBot, a warm appointment assistant who uses a few emojis.
+Help users book, view, cancel and reschedule appointments. Collect name, email, date, time and purpose one
+question at a time; email is required.
+Answer ONLY with JSON: {{"reply": "<message to the user>", "details": null or {{"name": str|null,
+"email": str|null, "date": "YYYY-MM-DD"|null, "time": "H:MM AM/PM"|null, "purpose": str|null,
+"id": int|null, "action": "book"|"retrieve"|"cancel"|"reschedule"}}}}
+Fill details only when the user wants an action; id is the appointment to reschedule, whose new slot is date and time."""
+
+REPAIR_PROMPT = """Rewrite the text below as one JSON object matching this schema, changing nothing else:
+{{"reply": str, "details": null or {{"name", "email", "date", "time", "purpose", "id", "action"}}}}
+Parse error: {error}
+
+Text:
+{text}"""
+
+CODE_FENCE = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$')
+
+class AppointmentDetails(BaseModel):
+    name: Optional[str] = None
+    email: Optional[str] = None
+    date: Optional[str] = None
+    time: Optional[str] = None
+    purpose: Optional[str] = None
+    id: Optional[int] = None
+    action: Optional[Literal['book', 'retrieve', 'cancel', 'reschedule']] = None
+
+class StructuredReply(BaseModel):
+    reply: str
+    details: Optional[AppointmentDetails] = None
+
+# Structured-mode turns, schema failures and repair calls
+_stats = {'turns': 0, 'parse_failures': 0, 'retries': 0}
+_stats_lock = threading.Lock()
+
+def parse_structured_reply(text):
+    """Validate a JSON reply against the schema.
+
+    Returns (details, reply) where details is a dict of the fields that were set, in
+    the same shape extract_appointment_details produces, or None. Raises ValueError
+    when the text isn't valid JSON for the schema.
+    """
+    try:
+        parsed = StructuredReply.model_validate_json(CODE_FENCE.sub('', text))
+    except ValidationError as e:
+        raise ValueError(str(e)) from e
+
+    if parsed.details is None:
+        return None, parsed.reply.strip()
+
+    details = {field: str(value).strip() for field, value in parsed.details.model_dump().items() if value is not None}
+    if 'date' in details:
+        details['date'] = normalize_date(details['date'])
+    if 'time' in details:
+        details['time'] = normalize_time(details['time'])
+    return details or None, parsed.reply.strip()
+
+def record_parse(failures, retries):
+    """Count one structured-mode turn and the parse failures and repair calls it took."""
+    with _stats_lock:
+        _stats['turns'] += 1
+        _stats['parse_failures'] += failures
+        _stats['retries'] += retries
+
+def structured_stats():
+    """Return a snapshot of the structured-mode counters."""
+    with _stats_lock:
+        return dict(_stats)
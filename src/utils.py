@@ -1,8 +1,15 @@
 import re
 import random
-from datetime import datetime
-import dateparser
-import streamlit as st
+from src.normalize import normalize_date, normalize_time
+
+DETAILS_OPEN_TAG = '<APPOINTMENT_DETAILS>'
+DETAILS_CLOSE_TAG = '</APPOINTMENT_DETAILS>'
+DETAILS_PATTERN = re.compile(f'{DETAILS_OPEN_TAG}(.*?){DETAILS_CLOSE_TAG}', re.DOTALL)
+DETAILS_FIELD_PATTERN = re.compile(r'^\s*(name|email|date|time|purpose|id|action):[ \t]*(.*)$', re.MULTILINE | re.IGNORECASE)
+
+def estimate_tokens(text):
+    """Estimate the token count of a piece of text (about four characters per token)."""
+    return (len(text) + 3) // 4
 
 def is_valid_email(email):
     """Validate email format."""
@@ -11,89 +18,22 @@ def is_valid_email(email):
 
 def extract_appointment_details(response_text):
     """Extract appointment details from the LLM response."""
-    details_pattern = r'<APPOINTMENT_DETAILS>(.*?)</APPOINTMENT_DETAILS>'
-    match = re.search(details_pattern, response_text, re.DOTALL)
+    match = DETAILS_PATTERN.search(response_text)
     
     if not match:
         return None, response_text.strip()
     
-    details_text = match.group(1).strip()
+    # Single pass over the block; the first occurrence of each field wins
     details = {}
+    for field, value in DETAILS_FIELD_PATTERN.findall(match.group(1)):
+        details.setdefault(field.lower(), value.strip())
     
-    name_match = re.search(r'name:\s*(.*)', details_text)
-    email_match = re.search(r'email:\s*(.*)', details_text)
-    date_match = re.search(r'date:\s*(.*)', details_text)
-    time_match = re.search(r'time:\s*(.*)', details_text)
-    purpose_match = re.search(r'purpose:\s*(.*)', details_text)
-    action_match = re.search(r'action:\s*(.*)', details_text)
-    
-    if name_match:
-        details['name'] = name_match.group(1).strip()
-    if email_match:
-        details['email'] = email_match.group(1).strip()
-        
-    if date_match:
-        date_str = date_match.group(1).strip()
-        try:
-            parsed_date = dateparser.parse(date_str)
-            if parsed_date:
-                details['date'] = parsed_date.strftime('%Y-%m-%d')
-            else:
-                for fmt in ['%m/%d/%Y', '%m-%d-%Y', '%Y-%m-%d', '%Y/%m/%d']:
-                    try:
-                        parsed_date = datetime.strptime(date_str, fmt)
-                        details['date'] = parsed_date.strftime('%Y-%m-%d')
-                        break
-                    except ValueError:
-                        continue
-                if 'date' not in details:
-                    details['date'] = date_str
-        except Exception:
-            details['date'] = date_str
+    if 'date' in details:
+        details['date'] = normalize_date(details['date'])
+    if 'time' in details:
+        details['time'] = normalize_time(details['time'])
     
-    if time_match:
-        time_str = time_match.group(1).strip()
-        try:
-            if ':' in time_str:
-                hour, minute = map(int, time_str.split(':'))
-                if 'am' not in time_str.lower() and 'pm' not in time_str.lower():
-                    if hour == 0:
-                        time_str = f"12:{minute:02d} AM"
-                    elif hour < 12:
-                        time_str = f"{hour}:{minute:02d} AM"
-                    elif hour == 12:
-                        time_str = f"12:{minute:02d} PM"
-                    else:
-                        time_str = f"{hour-12}:{minute:02d} PM"
-            else:
-                try:
-                    hour = int(time_str.split()[0])
-                    if "pm" in time_str.lower():
-                        if hour < 12:
-                            hour += 12
-                    elif "am" in time_str.lower() and hour == 12:
-                        hour = 0
-                        
-                    if hour == 0:
-                        time_str = "12:00 AM"
-                    elif hour < 12:
-                        time_str = f"{hour}:00 AM"
-                    elif hour == 12:
-                        time_str = "12:00 PM"
-                    else:
-                        time_str = f"{hour-12}:00 PM"
-                except:
-                    pass
-        except Exception:
-            pass
-        details['time'] = time_str
-    
-    if purpose_match:
-        details['purpose'] = purpose_match.group(1).strip()
-    if action_match:
-        details['action'] = action_match.group(1).strip()
-    
-    clean_response = re.sub(details_pattern, '', response_text, flags=re.DOTALL).strip()
+    clean_response = DETAILS_PATTERN.sub('', response_text).strip()
     
     return details, clean_response
 
@@ -106,4 +46,55 @@ def get_random_greeting():
         "Hello! I'm ready to help with your appointments. What would you like to do today?",
         "Hi there! Looking to book an appointment or check your schedule? I'm here to help!"
     ]
-    return random.choice(greetings)
\ No newline at end of file
+    return random.choice(greetings)
+
+# Phrasings a booking confirmation picks its opening and closing lines from, and the fields it lists
+CONFIRMATION_OPENINGS = [
+    "Great! I've booked your appointment successfully! 📝",
+    "All done! Your appointment is booked. 🎉",
+    "You're all booked in! ✅",
+    "Done! I've reserved that appointment for you. 📅"
+]
+
+CONFIRMATION_CLOSINGS = [
+    "Your appointment is all set! Is there anything else you'd like help with?",
+    "See you then! Is there anything else I can do for you?",
+    "You're all set! Let me know if you need anything else."
+]
+
+CONFIRMATION_FIELDS = [
+    ('name', '👤 Name'),
+    ('email', '📧 Email'),
+    ('date', '📅 Date'),
+    ('time', '🕒 Time'),
+    ('purpose', '📝 Purpose')
+]
+
+def render_confirmation(details, opening=None, closing=None):
+    """Render a booking confirmation from a template with a randomly chosen phrasing."""
+    lines = [opening or random.choice(CONFIRMATION_OPENINGS), "", "Here are the details:"]
+    for field, label in CONFIRMATION_FIELDS:
+        if details.get(field):
+            lines.append(f"- {label}: {details[field]}")
+    lines.extend(["", closing or random.choice(CONFIRMATION_CLOSINGS)])
+    return "\n".join(lines)
+
+# Appointments listed per chat message; longer lists continue on "show more"
+APPOINTMENTS_PAGE_SIZE = 5
+SHOW_MORE_HINT = 'There are more — say "show more" to see the next ones.'
+
+def render_appointments(appointments, heading, start=1, footer=None):
+    """Render a numbered list of appointments under a heading, numbering from start."""
+    lines = [heading, ""]
+    for number, appt in enumerate(appointments, start=start):
+        lines.append(f"📅 Appointment {number}:")
+        lines.append(f"• ID: {appt.id}")
+        lines.append(f"• Date: {appt.date}")
+        lines.append(f"• Time: {appt.time}")
+        lines.append(f"• Name: {appt.name}")
+        if appt.purpose and appt.purpose.lower() not in ('n/a', 'none'):
+            lines.append(f"• Purpose: {appt.purpose}")
+        lines.append("")
+    if footer:
+        lines.append(footer)
+    return "\n".join(lines).strip()
@@ -0,0 +1,29 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import src.database as database
+from src import availability
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh, migrated appointments database for one test."""
+    monkeypatch.setattr(database, 'DB_FOLDER', str(tmp_path))
+    monkeypatch.setattr(database, 'DB_PATH', str(tmp_path / 'test.db'))
+    database.ensure_db()
+    availability.clear_cache()
+    yield database
+    database.close_connections()
+    availability.clear_cache()
+
+@pytest.fixture
+def add_mixed_rows(db):
+    """Add one person's bookings on a date, ids out of time order and some with unparseable times."""
+    times = ["3:00 PM", "after lunch", "9:00 AM", "whenever", "11:30 AM", "9:30 AM", "early", "4:00 PM",
+             "10:00 AM", "late", "2:00 PM", "1:00 PM"]
+
+    def add(email, date):
+        return [db.add_appointment("Ann Lee", email, date, time, "Checkup") for time in times]
+    return add
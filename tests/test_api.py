@@ -0,0 +1,33 @@
+import pytest
+from fastapi.testclient import TestClient
+import api
+
+MONDAY = "2031-01-06"
+
+@pytest.fixture
+def client(db):
+    return TestClient(api.app)
+
+@pytest.mark.parametrize("name, email", [
+    ("", "ann@example.com"),
+    ("   ", "ann@example.com"),
+    ("Ann Lee", "not-an-email"),
+    ("Ann Lee", ""),
+])
+def test_booking_rejects_a_blank_name_or_invalid_email(client, db, name, email):
+    response = client.post("/appointments", json={'name': name, 'email': email, 'date': MONDAY, 'time': "9:00 AM"})
+    assert response.status_code == 422
+    assert db.get_appointments(date=MONDAY) == []
+
+def test_booking_stores_valid_requests(client):
+    response = client.post("/appointments", json={'name': " Ann Lee ", 'email': "ann@example.com",
+                                                  'date': MONDAY, 'time': "9:00 AM"})
+    assert response.status_code == 201
+    assert response.json()['name'] == "Ann Lee"
+
+def test_reschedule_rejects_an_invalid_email(client, db):
+    appointment_id = db.add_appointment("Ann Lee", "ann@example.com", MONDAY, "9:00 AM", "Checkup")
+    response = client.post(f"/appointments/{appointment_id}/reschedule",
+                           json={'email': "not-an-email", 'date': MONDAY, 'time': "10:00 AM"})
+    assert response.status_code == 422
+    assert db.get_appointment(appointment_id).time == "9:00 AM"
@@ -0,0 +1,61 @@
+import pytest
+from src.availability import book_slot, reschedule_slot, is_slot_free, next_free_slots, SlotUnavailableError
+from src.appointment_handler import _act_on_details
+
+MONDAY, SUNDAY = "2031-01-06", "2031-01-05"
+
+def test_booking_is_gated_by_occupancy(db):
+    appointment_id, conflict = book_slot("Ann", "ann@example.com", MONDAY, "9:00 AM", "Checkup")
+    assert appointment_id and conflict is None
+    assert not is_slot_free(MONDAY, "9:00 AM")
+    
+    with pytest.raises(SlotUnavailableError, match="already booked"):
+        book_slot("Bob", "bob@example.com", MONDAY, "9:00 AM", "Checkup")
+    # The person's own booking is reported as a conflict rather than an error
+    assert book_slot("Ann", "ann@example.com", MONDAY, "9:00 AM", "Again")[1].id == appointment_id
+
+def test_longer_booking_blocks_the_slots_it_overlaps(db):
+    assert book_slot("Ann", "ann@example.com", MONDAY, "10:00 AM", "Long", duration_minutes=60)[0]
+    with pytest.raises(SlotUnavailableError):
+        book_slot("Bob", "bob@example.com", MONDAY, "10:30 AM", "Checkup")
+    assert book_slot("Bob", "bob@example.com", MONDAY, "11:00 AM", "Checkup")[0]
+
+@pytest.mark.parametrize("date, time", [(MONDAY, "9:15 AM"), (SUNDAY, "3:00 PM"), (MONDAY, "3:00 AM"),
+                                        (MONDAY, "5:00 PM"), ("someday", "noonish")])
+def test_closed_and_off_grid_times_are_refused(db, date, time):
+    with pytest.raises(SlotUnavailableError):
+        book_slot("Ann", "ann@example.com", date, time, "Checkup")
+
+def test_reschedule_is_gated_like_booking(db):
+    first, _ = book_slot("Ann", "ann@example.com", MONDAY, "9:00 AM", "Checkup")
+    book_slot("Bob", "bob@example.com", MONDAY, "9:30 AM", "Checkup")
+    with pytest.raises(SlotUnavailableError):
+        reschedule_slot(first, "ann@example.com", MONDAY, "9:30 AM")
+    with pytest.raises(SlotUnavailableError):
+        reschedule_slot(first, "ann@example.com", SUNDAY, "9:30 AM")
+    moved, _ = reschedule_slot(first, "ann@example.com", MONDAY, "10:00 AM")
+    assert moved.time == "10:00 AM"
+
+def test_free_slots_agree_with_booking(db):
+    book_slot("Ann", "ann@example.com", MONDAY, "9:00 AM", "Checkup")
+    for slot in next_free_slots(db.compute_starts_at(MONDAY, "8:00 AM"), count=5):
+        date, time = slot.strftime('%Y-%m-%d'), slot.strftime('%I:%M %p').lstrip('0')
+        assert book_slot("Bob", "bob@example.com", date, time, "Checkup")[0]
+
+def test_handler_offers_alternatives_for_unavailable_slots(db):
+    details = {'action': 'book', 'name': "Ann", 'email': "ann@example.com", 'date': SUNDAY, 'time': "3:00 PM",
+               'purpose': "Checkup"}
+    text, _ = _act_on_details(details, False, None, {})
+    assert "outside our hours" in text and "2031-01-06 at 9:00 AM" in text
+
+def test_a_slot_freed_by_another_process_can_be_booked(db):
+    appointment_id, _ = book_slot("Ann Lee", "ann@example.com", MONDAY, "9:00 AM", "Checkup")
+    assert not is_slot_free(MONDAY, "9:00 AM")
+
+    # Another worker cancels; this process's cached day still counts the booking
+    with db.transaction(immediate=True) as conn:
+        conn.execute("DELETE FROM appointments WHERE id = ?", (appointment_id,))
+    assert not is_slot_free(MONDAY, "9:00 AM")
+
+    appointment_id, conflict = book_slot("Bob Ray", "bob@example.com", MONDAY, "9:00 AM", "Checkup")
+    assert appointment_id and conflict is None
@@ -0,0 +1,34 @@
+from src.bulk import import_file, export_file
+
+def test_import_counts_exclude_search_index_writes(db, tmp_path):
+    path = tmp_path / "in.csv"
+    path.write_text("name,email,date,time,purpose\n"
+                    "Ann,ann@example.com,2031-03-03,9:00 AM,Dental\n"
+                    "Bob,bob@example.com,2031-03-03,9:00 AM,Checkup\n"
+                    "Cy,not-an-email,2031-03-03,10:00 AM,Checkup\n"
+                    "Dee,dee@example.com,2031-03-03,11:00 AM,Dental follow-up\n")
+    report = import_file(str(path))
+    assert (report['read'], report['added'], report['skipped'], report['invalid']) == (4, 2, 1, 1)
+    assert db.add_appointments([("Eve", "eve@example.com", "2031-03-04", "9:00 AM", "x", None, None)]) == 1
+    assert [a.name for a in db.search_appointments("dental")] == ["Ann", "Dee"]
+
+def test_export_round_trip(db, tmp_path):
+    db.add_appointment("Ann", "ann@example.com", "2031-03-03", "9:00 AM", "Dental")
+    path = tmp_path / "out.jsonl"
+    assert export_file(str(path)) == 1
+    assert '"name": "Ann"' in path.read_text()
+
+def test_malformed_jsonl_lines_are_reported_not_raised(db, tmp_path):
+    path = tmp_path / "in.jsonl"
+    path.write_text('{"name": "Ann", "email": "ann@example.com", "date": "2031-03-03", "time": "9:00 AM"}\n'
+                    '{"name": "Bob", "email": \n'
+                    '\n'
+                    '[1, 2]\n'
+                    '"just text"\n'
+                    '{"name": "Dee", "email": "dee@example.com", "date": "2031-03-03", "time": "11:00 AM"}\n')
+    report = import_file(str(path), batch_size=1)
+    assert (report['read'], report['added'], report['invalid']) == (5, 2, 3)
+    assert [line for line, _ in report['errors']] == [2, 4, 5]
+    assert report['errors'][0][1].startswith("malformed JSON")
+    assert report['errors'][1][1] == "not a JSON object"
+    assert len(db.get_appointments(date="2031-03-03")) == 2
@@ -0,0 +1,72 @@
+import threading
+
+MONDAY = "2031-01-06"
+
+def test_reserve_slot_books_a_free_slot(db):
+    appointment_id, conflict = db.reserve_slot("Ann Lee", "ann@example.com", MONDAY, "9:00 AM", "Checkup")
+    assert conflict is None
+    assert db.get_appointment(appointment_id).email == "ann@example.com"
+
+def test_reserve_slot_returns_the_booking_holding_the_slot(db):
+    first, _ = db.reserve_slot("Ann Lee", "ann@example.com", MONDAY, "9:00 AM", "Checkup")
+    appointment_id, conflict = db.reserve_slot("Bob Ray", "bob@example.com", MONDAY, "9:00 AM", "Checkup")
+    assert appointment_id is None
+    assert conflict.id == first
+
+    # Another resource is free at that time, for someone else
+    appointment_id, conflict = db.reserve_slot("Bob Ray", "bob@example.com", MONDAY, "9:00 AM", "Checkup",
+                                               resource="room-2")
+    assert appointment_id and conflict is None
+
+def test_reserve_slot_stops_a_person_double_booking_across_resources(db):
+    first, _ = db.reserve_slot("Ann Lee", "ann@example.com", MONDAY, "9:00 AM", "Checkup")
+    db.reserve_slot("Bob Ray", "bob@example.com", MONDAY, "9:00 AM", "Checkup", resource="room-2")
+    appointment_id, conflict = db.reserve_slot("Ann Lee", "ANN@example.com ", MONDAY, "9:00 AM", "Checkup",
+                                               resource="room-3")
+    assert appointment_id is None
+    assert conflict.id == first
+
+def test_reserve_slot_dedupes_unparseable_times_per_person(db):
+    first, _ = db.reserve_slot("Ann Lee", "ann@example.com", MONDAY, "after lunch", "Checkup")
+    appointment_id, conflict = db.reserve_slot("Ann Lee", "ann@example.com", MONDAY, "after lunch", "Checkup")
+    assert appointment_id is None and conflict.id == first
+
+def test_concurrent_reservations_book_a_slot_once(db):
+    results = []
+    barrier = threading.Barrier(8)
+
+    def reserve(i):
+        barrier.wait()
+        results.append(db.reserve_slot(f"Person {i}", f"p{i}@example.com", MONDAY, "10:00 AM", "Checkup"))
+
+    threads = [threading.Thread(target=reserve, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    booked = [appointment_id for appointment_id, _ in results if appointment_id]
+    assert len(booked) == 1
+    assert all(conflict.id == booked[0] for appointment_id, conflict in results if not appointment_id)
+    assert len(db.get_appointments(date=MONDAY)) == 1
+
+def test_keyset_pages_visit_every_row_once_in_order(db, add_mixed_rows):
+    ids = add_mixed_rows("ann@example.com", MONDAY)
+    add_mixed_rows("bob@example.com", "2031-01-07")
+    everything = db.get_appointments(email="ann@example.com")
+
+    for size in (1, 3, 4, 5, 12):
+        seen, after = [], None
+        while True:
+            page = db.get_appointments(email="ann@example.com", limit=size, after=after)
+            if not page:
+                break
+            seen.extend(page)
+            after = page[-1].cursor
+        assert [a.id for a in seen] == [a.id for a in everything]
+    assert sorted(a.id for a in everything) == sorted(ids)
+
+    # Unscheduled rows come first, in id order, then the rest by start time
+    assert [a.time for a in everything[:4]] == ["after lunch", "whenever", "early", "late"]
+    starts = [a.starts_at for a in everything[4:]]
+    assert starts == sorted(starts)
@@ -0,0 +1,48 @@
+import re
+from src.appointment_handler import _act_on_details, process_message
+
+MONDAY = "2031-01-06"
+
+def test_cancel_matches_on_email_even_with_a_shorter_name(db):
+    appointment_id = db.add_appointment("John Smith", "john@example.com", MONDAY, "9:00 AM", "Checkup")
+    details = {'action': 'cancel', 'name': "John", 'email': "john@example.com"}
+    text, _ = _act_on_details(details, False, None, {})
+    assert "successfully canceled" in text
+    assert db.get_appointment(appointment_id) is None
+
+def test_cancel_by_name_alone_needs_the_full_name(db):
+    db.add_appointment("John Smith", "john@example.com", MONDAY, "9:00 AM", "Checkup")
+    text, _ = _act_on_details({'action': 'cancel', 'name': "John"}, False, None, {})
+    assert "couldn't find any appointments" in text
+    text, _ = _act_on_details({'action': 'cancel', 'name': "john smith"}, False, None, {})
+    assert "successfully canceled" in text
+
+def test_cancel_lists_choices_when_an_email_has_several_bookings(db):
+    db.add_appointment("John Smith", "john@example.com", MONDAY, "9:00 AM", "Checkup")
+    db.add_appointment("John Smith", "john@example.com", MONDAY, "10:00 AM", "Follow-up")
+    text, _ = _act_on_details({'action': 'cancel', 'email': "john@example.com"}, False, None, {})
+    assert "multiple appointments" in text and "10:00 AM" in text
+
+def test_search_needs_an_email_and_only_lists_that_persons_appointments(db):
+    db.add_appointment("Ann Lee", "ann@corp.example", MONDAY, "9:00 AM", "HIV test")
+    db.add_appointment("Bob Ray", "bob@example.com", MONDAY, "10:00 AM", "Dental corp checkup")
+
+    reply = process_message("search corp", None, None, {})
+    assert "email address" in reply and "Ann Lee" not in reply
+
+    session = {'current_email': "bob@example.com"}
+    reply = process_message("search corp", None, None, session)
+    assert "Bob Ray" in reply and "Ann Lee" not in reply and "HIV" not in reply
+    assert "couldn't find" in process_message("search hiv", None, None, session)
+
+def test_show_more_pages_through_every_appointment(db, add_mixed_rows):
+    ids = add_mixed_rows("ann@example.com", MONDAY)
+    session = {'current_email': "ann@example.com"}
+    replies = [process_message("show my appointments", None, None, session)]
+    while "say \"show more\"" in replies[-1]:
+        replies.append(process_message("show more", None, None, session))
+
+    listed = [int(n) for reply in replies for n in re.findall(r"• ID: (\d+)", reply)]
+    assert sorted(listed) == sorted(ids) and len(listed) == len(set(listed))
+    assert len(replies) == 3
+    assert "no more appointments" in process_message("show more", None, None, session)
@@ -0,0 +1,27 @@
+import pytest
+from src.intents import route_intent
+
+@pytest.mark.parametrize("message", [
+    "I want to reschedule my appointment",
+    "Can you cancel my appointment please?",
+    "Could you move my appointment to Friday?",
+    "I'd like to book an appointment, can you look up free times?",
+    "Cancelling my appointment, sorry",
+    "search for a slot next week",
+    "Search for available times on Friday",
+])
+def test_action_requests_go_to_the_llm(message):
+    assert route_intent(message) is None
+
+@pytest.mark.parametrize("message, expected", [
+    ("Show me my appointment", ('retrieve', {})),
+    ("Can you look up my bookings?", ('retrieve', {})),
+    ("cancel 5", ('cancel_by_id', {'id': 5})),
+    ("reschedule 7 to 2031-01-06 at 10:00 AM", ('reschedule', {'id': 7, 'date': '2031-01-06', 'time': '10:00 AM'})),
+    ("show my appointments on 2031-01-06", ('retrieve_by_date', {'date': '2031-01-06', 'email': None})),
+    ("ann@example.com", ('bare_email', {'email': 'ann@example.com'})),
+    ("search dental", ('search', {'query': 'dental'})),
+    ("more", ('show_more', {})),
+])
+def test_commands_are_routed(message, expected):
+    assert route_intent(message) == expected
@@ -0,0 +1,98 @@
+import pytest
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain.schema import Generation
+import src.llm_cache as llm_cache
+from src.llm_cache import SQLiteLLMCache, cache_key
+
+LLM = "fake-model"
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache.time, 'time', clock.time)
+    return clock
+
+def make_cache(tmp_path, **kwargs):
+    return SQLiteLLMCache(path=str(tmp_path / 'llm_cache.db'), **kwargs)
+
+def reply(text):
+    return [Generation(text=text)]
+
+def test_keys_ignore_whitespace_and_case_but_not_the_model():
+    assert cache_key("What  are your\nHOURS?", LLM) == cache_key("what are your hours?", LLM)
+    assert cache_key("what are your hours?", LLM) != cache_key("what are your hours?", "other-model")
+
+def test_hits_and_misses_are_counted(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    assert cache.lookup("hours?", LLM) is None
+    cache.update("hours?", LLM, reply("9 to 5"))
+    assert [g.text for g in cache.lookup("Hours?", LLM)] == ["9 to 5"]
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['bypassed'], stats['entries']) == (1, 1, 0, 1)
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    cache = make_cache(tmp_path, ttl_seconds=60)
+    cache.update("hours?", LLM, reply("9 to 5"))
+    clock.now += 60
+    assert cache.lookup("hours?", LLM) is not None
+    clock.now += 1
+    assert cache.lookup("hours?", LLM) is None
+    assert cache.stats()['entries'] == 0
+
+def test_least_recently_used_entries_are_evicted_over_the_size_limit(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    cache.update("a", LLM, reply("alpha"))
+    entry_size = cache.stats()['bytes']
+    cache.max_bytes = 2 * entry_size
+
+    clock.now += 1
+    cache.update("b", LLM, reply("bravo"))
+    clock.now += 1
+    assert cache.lookup("a", LLM) is not None
+    clock.now += 1
+    cache.update("c", LLM, reply("delta"))
+
+    assert cache.lookup("b", LLM) is None
+    assert cache.lookup("a", LLM) is not None
+    assert cache.lookup("c", LLM) is not None
+    assert cache.stats()['bytes'] <= cache.max_bytes
+
+def test_expired_entries_are_dropped_when_writing(tmp_path, clock):
+    cache = make_cache(tmp_path, ttl_seconds=60)
+    cache.update("a", LLM, reply("old"))
+    clock.now += 61
+    cache.update("b", LLM, reply("new"))
+    assert cache.stats()['entries'] == 1
+
+@pytest.mark.parametrize("prompt, text, bypassed", [
+    ("Book me in, my email is ann@example.com", "Sure", 1),
+    ("<APPOINTMENT_DETAILS>{}</APPOINTMENT_DETAILS>", "Done", 1),
+    ("What is my email?", "It is ann@example.com", 0),
+])
+def test_personal_data_is_never_stored(tmp_path, clock, prompt, text, bypassed):
+    cache = make_cache(tmp_path)
+    cache.update(prompt, LLM, reply(text))
+    assert cache.lookup(prompt, LLM) is None
+    stats = cache.stats()
+    assert (stats['entries'], stats['bypassed'], stats['misses']) == (0, bypassed, 1 - bypassed)
+
+def test_a_chat_model_reuses_cached_replies(tmp_path):
+    cache = make_cache(tmp_path)
+    model = GenericFakeChatModel(messages=iter([AIMessage("We open at 9."), AIMessage("Something else.")]),
+                                 cache=cache)
+    assert model.invoke("When do you open?").content == "We open at 9."
+    assert model.invoke("when do you  open?").content == "We open at 9."
+    assert cache.stats()['hits'] == 1
+
+    model = GenericFakeChatModel(messages=iter([AIMessage("Noted."), AIMessage("Noted again.")]), cache=cache)
+    assert model.invoke("I'm ann@example.com").content == "Noted."
+    assert model.invoke("I'm ann@example.com").content == "Noted again."
+    assert cache.stats()['bypassed'] == 2
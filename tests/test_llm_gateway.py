@@ -0,0 +1,138 @@
+import asyncio
+import pytest
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+import src.llm_gateway as llm_gateway
+from src.llm_gateway import LLMGateway, LLMGatewayError, GatewayChatModel, is_retryable
+
+class ResourceExhausted(Exception):
+    """Stands in for the provider's quota error."""
+
+class FlakyModel:
+    """Wraps a fake chat model, raising the given errors on the first calls."""
+
+    def __init__(self, replies, errors=(), delay=0):
+        self.llm = GenericFakeChatModel(messages=iter(replies))
+        self.errors = list(errors)
+        self.delay = delay
+        self.calls = 0
+        self._llm_type = self.llm._llm_type
+        self._identifying_params = self.llm._identifying_params
+
+    async def ainvoke(self, messages, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.errors:
+            raise self.errors.pop(0)
+        return await self.llm.ainvoke(messages, **kwargs)
+
+@pytest.fixture
+def backoffs(monkeypatch):
+    """Record the upper bound of every backoff and skip the sleep itself."""
+    bounds = []
+    def uniform(low, high):
+        bounds.append(high)
+        return 0
+    monkeypatch.setattr(llm_gateway.random, 'uniform', uniform)
+    return bounds
+
+def make_gateway(llm, **kwargs):
+    kwargs = {'rate_per_second': 1000, 'burst': 1000, 'base_delay': 0.5, 'max_delay': 1.5, **kwargs}
+    return LLMGateway(llm, **kwargs)
+
+def test_retryable_errors():
+    assert is_retryable(ResourceExhausted())
+    assert is_retryable(asyncio.TimeoutError())
+    error = RuntimeError()
+    error.status_code = 503
+    assert is_retryable(error)
+    assert not is_retryable(ValueError("bad request"))
+
+def test_transient_errors_are_retried_with_growing_backoff(backoffs):
+    model = FlakyModel([AIMessage("ok")], errors=[ResourceExhausted()] * 3)
+    gateway = make_gateway(model)
+    assert gateway.invoke([HumanMessage("hi")]).content == "ok"
+    assert model.calls == 4
+    assert backoffs == [0.5, 1.0, 1.5]
+    metrics = gateway.metrics()
+    assert (metrics['calls'], metrics['retries'], metrics['failures'], metrics['acquires']) == (1, 3, 0, 4)
+
+def test_gives_up_after_max_retries(backoffs):
+    model = FlakyModel([], errors=[ResourceExhausted()] * 3)
+    gateway = make_gateway(model, max_retries=2)
+    with pytest.raises(LLMGatewayError, match="after 3 attempt"):
+        gateway.invoke([HumanMessage("hi")])
+    assert model.calls == 3
+    assert gateway.metrics()['failures'] == 1
+
+def test_permanent_errors_are_not_retried(backoffs):
+    model = FlakyModel([AIMessage("unused")], errors=[ValueError("bad request")])
+    gateway = make_gateway(model)
+    with pytest.raises(ValueError, match="bad request"):
+        gateway.invoke([HumanMessage("hi")])
+    assert model.calls == 1 and backoffs == []
+    assert gateway.metrics()['failures'] == 1
+
+def test_calls_past_the_deadline_fail(backoffs):
+    gateway = make_gateway(FlakyModel([AIMessage("late")], delay=1), timeout=0.05, max_retries=0)
+    with pytest.raises(LLMGatewayError):
+        gateway.invoke([HumanMessage("hi")])
+
+def test_identical_requests_in_flight_share_one_call():
+    model = FlakyModel([AIMessage("shared"), AIMessage("second")], delay=0.1)
+    gateway = make_gateway(model)
+
+    async def ask_together():
+        return await asyncio.gather(gateway.ainvoke([HumanMessage("hi")]), gateway.ainvoke([HumanMessage("hi")]))
+
+    replies = asyncio.run(ask_together())
+    assert [reply.content for reply in replies] == ["shared", "shared"]
+    assert model.calls == 1
+    assert gateway.metrics()['coalesced'] == 1
+
+    assert gateway.invoke([HumanMessage("hi")]).content == "second"
+    assert model.calls == 2
+
+def test_concurrency_is_capped():
+    running, peak = [], []
+    class Counting(FlakyModel):
+        async def ainvoke(self, messages, **kwargs):
+            running.append(1)
+            peak.append(len(running))
+            try:
+                return await super().ainvoke(messages, **kwargs)
+            finally:
+                running.pop()
+
+    model = Counting([AIMessage(str(i)) for i in range(6)], delay=0.05)
+    gateway = make_gateway(model, max_concurrency=2)
+
+    async def ask_all():
+        return await asyncio.gather(*(gateway.ainvoke([HumanMessage(f"q{i}")]) for i in range(6)))
+
+    assert len(asyncio.run(ask_all())) == 6
+    assert max(peak) == 2
+
+def test_chat_model_invokes_and_streams_through_the_gateway():
+    fake = GenericFakeChatModel(messages=iter([AIMessage("hello there"), AIMessage("streamed reply")]))
+    gateway = make_gateway(fake)
+    model = GatewayChatModel(gateway=gateway)
+    assert model.invoke("hi").content == "hello there"
+    assert "".join(chunk.content for chunk in model.stream("hi")) == "streamed reply"
+    assert gateway.metrics()['acquires'] == 2
+
+def test_chat_reports_permanent_errors_instead_of_load(backoffs):
+    from src.llm_setup import setup_llm
+    from src.appointment_handler import process_message, BUSY_MESSAGE
+
+    class PermissionDenied(Exception):
+        """Stands in for the provider's invalid-key error."""
+
+    def reply_with(error):
+        gateway = make_gateway(FlakyModel([], errors=[error] * 5), max_retries=2)
+        llm_chain, llm = setup_llm(llm=GatewayChatModel(gateway=gateway))
+        return process_message("I'd like to book something", llm_chain, llm, {})
+
+    assert reply_with(ResourceExhausted("quota")) == BUSY_MESSAGE
+    reply = reply_with(PermissionDenied("API key not valid"))
+    assert reply != BUSY_MESSAGE and "API key not valid" in reply
@@ -0,0 +1,32 @@
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_google_genai.chat_models import _parse_chat_history
+from src.llm_setup import setup_llm
+
+DETAILS = "Got it!\n<APPOINTMENT_DETAILS>\nname: Ann Lee\nemail: ann@example.com\naction: book\n</APPOINTMENT_DETAILS>"
+
+def _chain(**kwargs):
+    chain, _ = setup_llm(llm=GenericFakeChatModel(messages=iter([])), **kwargs)
+    return chain
+
+def test_folded_summary_is_part_of_the_system_prompt():
+    chain = _chain(max_turns=4)
+    for turn in range(5):
+        chain.memory.save_context({"input": f"message {turn}"}, {"text": DETAILS})
+    
+    variables = chain.memory.load_memory_variables({"input": "next"})
+    messages = chain.prompt.format_messages(input="next", **variables)
+    
+    assert "name: Ann Lee" in variables["collected"]
+    assert len(variables["history"]) == 8
+    assert [m.type for m in messages].count("system") == 1
+    # Gemini rejects system messages anywhere but first
+    system, history = _parse_chat_history(messages)
+    assert "email: ann@example.com" in system.parts[0].text
+    assert len(history) == 9
+
+def test_prompt_without_summary_formats_for_gemini():
+    chain = _chain(memory_mode="buffer")
+    chain.memory.save_context({"input": "hi"}, {"text": "Hello!"})
+    messages = chain.prompt.format_messages(input="next", **chain.memory.load_memory_variables({}))
+    system, history = _parse_chat_history(messages)
+    assert system is not None and len(history) == 3
@@ -0,0 +1,44 @@
+import contextvars
+import pytest
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from src import metrics
+from src.llm_setup import setup_llm
+from src.appointment_handler import stream_message
+
+REPLY = ("Great, you're all set! <APPOINTMENT_DETAILS>\nname: Ann Lee\nemail: ann@example.com\ndate: 2031-01-06\n"
+         "time: 10:00 AM\npurpose: Checkup\naction: book\n</APPOINTMENT_DETAILS>")
+
+@pytest.fixture
+def traced():
+    metrics.reset_metrics()
+    metrics.enable_metrics()
+    yield
+    metrics.enable_metrics(False)
+    metrics.reset_metrics()
+
+def _series():
+    return {(entry['stage'], entry['action']) for entry in metrics.snapshot()}
+
+def test_streamed_turn_keeps_its_action_across_thread_pool_steps(db, traced):
+    llm = GenericFakeChatModel(messages=iter([AIMessage(content=REPLY)]))
+    chain, llm = setup_llm(llm=llm)
+    chunks = stream_message("Book me a checkup", chain, llm, {})
+    
+    # Like Starlette's iterate_in_threadpool: every step runs in a fresh copy of the caller's context
+    reply = []
+    while True:
+        try:
+            reply.append(contextvars.copy_context().run(next, chunks))
+        except StopIteration:
+            break
+    
+    assert "Ann Lee" in "".join(reply) and "APPOINTMENT_DETAILS" not in "".join(reply)
+    series = _series()
+    assert {('act', 'book'), ('turn', 'book'), ('db.reserve_slot', 'book')} <= series
+    assert ('act', 'none') not in series and ('turn', 'chat') not in series
+
+def test_spans_outside_a_turn_are_recorded_directly(traced):
+    with metrics.span("standalone"):
+        pass
+    assert ('standalone', 'none') in _series()
@@ -0,0 +1,45 @@
+import pytest
+from datetime import date, timedelta
+from src.normalize import normalize_date, normalize_time, parse_time
+
+@pytest.mark.parametrize("text, expected", [
+    ("3:30 PM", "3:30 PM"),
+    ("3:30pm", "3:30 PM"),
+    ("15:30", "3:30 PM"),
+    ("3pm", "3:00 PM"),
+    ("3 p.m.", "3:00 PM"),
+    ("9:00", "9:00 AM"),
+    ("  9:00  ", "9:00 AM"),
+    ("10:15:00", "10:15 AM"),
+    ("noon", "12:00 PM"),
+    ("Midnight", "12:00 AM"),
+    ("12 am", "12:00 AM"),
+    ("12 pm", "12:00 PM"),
+])
+def test_normalize_time(text, expected):
+    assert normalize_time(text) == expected
+
+@pytest.mark.parametrize("text", ["13 pm", "0 am", "25:00", "9:75", "soon", ""])
+def test_invalid_times_are_returned_as_written(text):
+    assert parse_time(text) is None
+    assert normalize_time(text) == text
+
+@pytest.mark.parametrize("text, expected", [
+    ("2031-01-06", "2031-01-06"),
+    ("2031-1-6", "2031-01-06"),
+    ("2031-01-06T09:00:00", "2031-01-06"),
+    ("1/6/2031", "2031-01-06"),
+    ("01-06-2031", "2031-01-06"),
+    ("2031/01/06", "2031-01-06"),
+    (" 1/6/2031 ", "2031-01-06"),
+])
+def test_numeric_dates(text, expected):
+    assert normalize_date(text) == expected
+
+@pytest.mark.parametrize("text", ["2031-02-30", "2/30/2031", "not a date", ""])
+def test_impossible_or_unreadable_dates_are_returned_as_written(text):
+    assert normalize_date(text) == text
+
+def test_other_dates_fall_back_to_dateparser():
+    assert normalize_date("January 6, 2031") == "2031-01-06"
+    assert normalize_date("Tomorrow") == (date.today() + timedelta(days=1)).isoformat()
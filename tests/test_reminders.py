@@ -0,0 +1,58 @@
+from datetime import datetime
+from src.database import to_epoch
+from src.reminders import ReminderScheduler, ReminderSender
+
+NOW = to_epoch(datetime(2031, 1, 1, 8, 0))
+
+class RecordingSender(ReminderSender):
+    def __init__(self, failing=()):
+        self.keys = []
+        self.failing = set(failing)
+
+    def send(self, reminder):
+        if reminder['appointment_id'] in self.failing:
+            raise OSError("mail server down")
+        self.keys.append(reminder['key'])
+
+def _book(db, hour, day=1, name="Ann"):
+    return db.add_appointment(name, f"{name.lower()}{day}{hour}@example.com", f"2031-01-{day:02d}",
+                              f"{hour % 12 or 12}:00 {'AM' if hour < 12 else 'PM'}", "Checkup")
+
+def test_claims_in_batches_and_never_resends_after_restart(db):
+    ids = [_book(db, hour) for hour in range(9, 18)] + [_book(db, 9, day=3)]
+    sender = RecordingSender()
+    scheduler = ReminderScheduler(sender, batch_size=4)
+    try:
+        report = scheduler.run_once(NOW)
+    finally:
+        scheduler.stop()
+    assert report['claimed'] == report['sent'] == 9
+    assert len(set(sender.keys)) == 9 and str(ids[-1]) not in [key.split(':')[0] for key in sender.keys]
+    
+    restarted = ReminderScheduler(sender, batch_size=4)
+    try:
+        assert restarted.run_once(NOW + 60) == {'claimed': 0, 'sent': 0, 'retried': 0, 'failed': 0,
+                                                'skipped': 0, 'canceled': 0}
+    finally:
+        restarted.stop()
+    assert len(sender.keys) == 9
+
+def test_late_bookings_retries_and_cancellations(db):
+    first = _book(db, 12)
+    sender = RecordingSender(failing=[first])
+    scheduler = ReminderScheduler(sender)
+    try:
+        assert scheduler.run_once(NOW)['retried'] == 1
+        # Booked behind the high-water mark after the first scan
+        late = _book(db, 10, name="Bob")
+        gone = _book(db, 11, name="Cy")
+        sender.failing.add(gone)
+        report = scheduler.run_once(NOW + 60)
+        assert (report['claimed'], report['sent'], report['retried']) == (2, 1, 2)
+        db.delete_appointment(gone)
+        sender.failing.clear()
+        report = scheduler.run_once(NOW + 120)
+    finally:
+        scheduler.stop()
+    assert (report['sent'], report['canceled']) == (1, 1)
+    assert sorted(key.split(':')[0] for key in sender.keys) == sorted([str(first), str(late)])
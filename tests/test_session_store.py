@@ -0,0 +1,107 @@
+import os
+import sys
+import subprocess
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from src.session_store import MemorySessionStore, SQLiteSessionStore, SessionConflictError, open_session
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_importing_the_api_does_not_load_langchain():
+    code = ("import sys, api; "
+            "print(sorted({m.split('.')[0] for m in sys.modules if m.startswith('langchain')}))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "[]"
+
+class FakeChain:
+    class memory:
+        pass
+
+def fake_setup_llm(histories):
+    """A setup_llm that records the chat history each turn is bound to."""
+    def setup_llm(chat_history, memory_slots):
+        histories.append(chat_history)
+        return FakeChain(), None
+    return setup_llm
+
+def test_open_session_keeps_the_chat_history_between_turns():
+    histories = []
+    store = MemorySessionStore()
+    with open_session(store, "s1", fake_setup_llm(histories)):
+        histories[-1].add_messages([HumanMessage("hi"), AIMessage("hello")])
+    with open_session(store, "s1", fake_setup_llm(histories)) as session:
+        assert [m.content for m in histories[-1].messages] == ["hi", "hello"]
+        assert 'llm_chain' in session
+    state, version = store.get("s1")
+    assert 'llm_chain' not in state and version == 2
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request):
+    if request.param == "memory":
+        return MemorySessionStore()
+    request.getfixturevalue('db')
+    return SQLiteSessionStore(purge_interval=3600)
+
+def test_saves_must_name_the_version_they_read(store):
+    version = store.put("s1", {'current_name': "Ann"})
+    with pytest.raises(SessionConflictError):
+        store.put("s1", {'current_name': "Bob"})
+    assert store.put("s1", {'current_name': "Bob"}, version) == version + 1
+    with pytest.raises(SessionConflictError):
+        store.put("s1", {'current_name': "Cy"}, version)
+    assert store.get("s1") == ({'current_name': "Bob"}, version + 1)
+
+def test_concurrent_turns_on_one_session_keep_both_turns(store):
+    """Two workers run a turn on the same session at once; the later save merges onto the earlier."""
+    histories = []
+    with open_session(store, "s1", fake_setup_llm(histories)):
+        histories[-1].add_messages([HumanMessage("hi"), AIMessage("hello")])
+
+    with open_session(store, "s1", fake_setup_llm(histories)) as first:
+        histories[-1].add_messages([HumanMessage("book me in"), AIMessage("what email?")])
+        first['current_email'] = "ann@example.com"
+
+        with open_session(store, "s1", fake_setup_llm(histories)) as second:
+            histories[-1].add_messages([HumanMessage("show more"), AIMessage("no more")])
+            second['more_appointments'] = None
+            second['current_name'] = "Ann"
+
+    state, version = store.get("s1")
+    assert [m['data']['content'] for m in state['history']] == ["hi", "hello", "show more", "no more",
+                                                                "book me in", "what email?"]
+    assert (state['current_name'], state['current_email']) == ("Ann", "ann@example.com")
+    assert 'more_appointments' in state
+    assert version == 3
+
+def test_open_session_gives_up_when_the_session_keeps_changing():
+    class BusyStore(MemorySessionStore):
+        def put(self, session_id, state, version=None):
+            raise SessionConflictError(session_id)
+
+    with pytest.raises(SessionConflictError):
+        with open_session(BusyStore(), "s1", fake_setup_llm([])):
+            pass
+
+def test_an_expired_session_can_be_started_again(db):
+    with db.transaction(immediate=True) as conn:
+        conn.execute("INSERT INTO sessions (id, state, updated_at, version) VALUES ('old', '{}', 0, 7)")
+    store = SQLiteSessionStore(purge_interval=3600)
+    assert store.get("old") == (None, None)
+    assert store.put("old", {'current_name': "Ann"}) == 8
+
+def _session_ids(db):
+    with db.transaction() as conn:
+        return [row[0] for row in conn.execute("SELECT id FROM sessions ORDER BY id")]
+
+def test_saving_sessions_purges_idle_ones_periodically(db):
+    with db.transaction(immediate=True) as conn:
+        conn.execute("INSERT INTO sessions (id, state, updated_at) VALUES ('stale', '{}', 0)")
+
+    store = SQLiteSessionStore(purge_interval=3600)
+    assert store.put("fresh", {}) == 1
+    assert _session_ids(db) == ["fresh", "stale"]
+
+    store.purge_interval = 0
+    version = store.put("fresh", {}, 1)
+    assert _session_ids(db) == ["fresh"]
+    assert store.get("fresh") == ({}, version)
@@ -0,0 +1,36 @@
+import os
+import sys
+import subprocess
+import threading
+from src.startup import cache_resource
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_cache_resource_runs_once_per_key_outside_streamlit():
+    calls = []
+
+    @cache_resource
+    def build(name, _client=None):
+        calls.append(name)
+        return object()
+
+    first = build("a", _client=1)
+    threads = [threading.Thread(target=build, args=("a",), kwargs={'_client': i}) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert build("a", _client=2) is first
+    assert build("b") is not first
+    assert calls == ["a", "b"]
+
+def test_api_llm_setup_does_not_import_streamlit(tmp_path):
+    code = ("import sys, api; from src.llm_setup import setup_llm; "
+            "chain, llm = setup_llm(); assert setup_llm()[1] is llm; "
+            "print('streamlit' in sys.modules)")
+    # Run from an empty folder so the response cache file is created there
+    env = {**os.environ, 'GEMINI_API_KEY': "test-key", 'PYTHONPATH': ROOT}
+    result = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "False"
+    assert "ScriptRunContext" not in result.stderr
@@ -0,0 +1,75 @@
+import json
+import pytest
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from src.structured import parse_structured_reply, structured_stats, STRUCTURED_MAX_RETRIES
+from src.appointment_handler import _parse_structured, process_message
+from src.llm_setup import setup_llm
+
+BOOKING = {'reply': "Booking that now!", 'details': {'name': "Ann Lee", 'email': "ann@example.com",
+                                                     'date': "1/6/2031", 'time': "9am", 'purpose': "Checkup",
+                                                     'id': None, 'action': "book"}}
+EXPECTED = {'name': "Ann Lee", 'email': "ann@example.com", 'date': "2031-01-06", 'time': "9:00 AM",
+            'purpose': "Checkup", 'action': "book"}
+
+class RecordingModel(GenericFakeChatModel):
+    """Fake chat model that also records the prompts it was sent."""
+    prompts: list = []
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(messages[-1].content)
+        return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+def fake_model(*replies):
+    return RecordingModel(messages=iter([AIMessage(reply) for reply in replies]), prompts=[])
+
+def test_valid_json_is_validated_and_normalized():
+    assert parse_structured_reply(json.dumps(BOOKING)) == (EXPECTED, "Booking that now!")
+    assert parse_structured_reply('{"reply": " Hi there! ", "details": null}') == (None, "Hi there!")
+
+def test_code_fences_are_stripped():
+    assert parse_structured_reply(f"```json\n{json.dumps(BOOKING)}\n```") == (EXPECTED, "Booking that now!")
+    assert parse_structured_reply(f"```\n{json.dumps(BOOKING)}\n```")[0] == EXPECTED
+
+@pytest.mark.parametrize("text", [
+    "Sure, what's your name?",
+    '{"details": null}',
+    '{"reply": "ok", "details": {"action": "delete"}}',
+    '{"reply": "ok", "details": {"id": "seven"}}',
+])
+def test_replies_off_the_schema_raise_value_error(text):
+    with pytest.raises(ValueError):
+        parse_structured_reply(text)
+
+def test_valid_reply_needs_no_repair():
+    model = fake_model()
+    before = structured_stats()
+    assert _parse_structured(json.dumps(BOOKING), model) == (EXPECTED, "Booking that now!")
+    assert model.prompts == []
+    after = structured_stats()
+    assert (after['turns'] - before['turns'], after['parse_failures'] - before['parse_failures']) == (1, 0)
+
+def test_a_failed_parse_is_repaired_by_the_model():
+    model = fake_model(json.dumps(BOOKING))
+    before = structured_stats()
+    assert _parse_structured("Booking that now! name: Ann Lee", model) == (EXPECTED, "Booking that now!")
+    assert len(model.prompts) == 1 and "Booking that now! name: Ann Lee" in model.prompts[0]
+    after = structured_stats()
+    assert (after['parse_failures'] - before['parse_failures'], after['retries'] - before['retries']) == (1, 1)
+
+def test_falls_back_to_the_tag_parser_after_the_retries():
+    text = ("Booking that now!\n<APPOINTMENT_DETAILS>\nname: Ann Lee\nemail: ann@example.com\n"
+            "date: 2031-01-06\ntime: 9:00 AM\npurpose: Checkup\naction: book\n</APPOINTMENT_DETAILS>")
+    model = fake_model(*["still not json"] * STRUCTURED_MAX_RETRIES)
+    before = structured_stats()
+    details, reply = _parse_structured(text, model)
+    assert details == EXPECTED and reply == "Booking that now!"
+    assert len(model.prompts) == STRUCTURED_MAX_RETRIES
+    after = structured_stats()
+    assert after['parse_failures'] - before['parse_failures'] == STRUCTURED_MAX_RETRIES + 1
+
+def test_json_mode_turn_books_through_process_message(db):
+    llm_chain, llm = setup_llm(llm=fake_model(json.dumps(BOOKING)), extraction_mode="json")
+    reply = process_message("Book Ann Lee, ann@example.com, 1/6/2031 at 9am", llm_chain, llm, {})
+    assert "Ann Lee" in reply and "{" not in reply
+    assert [a.time for a in db.get_appointments(email="ann@example.com")] == ["9:00 AM"]